@@ -1,10 +1,19 @@
-import RPi.GPIO as GPIO
 import time
 import numpy as np
-import random
 import cv2
 import datetime
 import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import hal
+import metrics
+from hal import GPIO
+from camera_manager import get_camera_manager, release_camera_manager
+from vision import get_engine
+from ultrasonic import UltrasonicRanger
+from cache import LRUCache, quantize, dequantize
+from history import NON_STAGE_TIMINGS, record_measurement
 
 # Configure logging for debugging output
 logging.basicConfig(
@@ -29,69 +38,83 @@ POPULATION_SIZE = 10
 GENERATIONS = 50
 SEALING_MARGIN = 0.5       # Extra margin added to object dimensions
 MUTATION_RATE = 0.1
+PARENT_POOL_SIZE = 5       # Fittest individuals allowed to breed
+GA_SEED = None             # Set an int for reproducible optimization runs
+
+# Optimizer used by measure_and_optimize(); see OPTIMIZERS
+OPTIMIZER = "analytical"
+
+# Optimizer and wrap-size results are memoized on dimensions quantized to
+# the measurement resolution, since the line packs the same SKUs repeatedly
+MEASUREMENT_RESOLUTION = 0.1   # cm
+RESULT_CACHE_SIZE = 256
+result_cache = LRUCache(RESULT_CACHE_SIZE)
+
+# Overlap front capture with side camera alignment and capture
+CONCURRENT_CAPTURE = True
 
 # Pixel-to-cm ratios (calibrated values)
 PIXEL_TO_CM_RATIO_FRONT = 0.06035  # Front camera calibration
 PIXEL_TO_CM_RATIO_SIDE = 0.03895   # Side camera calibration
 
+# Side camera measurement mode:
+#   "scaled" - one ultrasonic reading scales the pixel ratio by distance
+#   "servo"  - move the camera to TARGET_DISTANCE before capturing
+SIDE_MEASUREMENT_MODE = "scaled"
+
+# Distance-to-ratio model: ratio = slope * distance + intercept (cm/pixel).
+# Defaults to a pinhole model anchored at the TARGET_DISTANCE calibration;
+# refit with fit_side_ratio_model() from measured calibration points.
+SIDE_RATIO_MODEL = (PIXEL_TO_CM_RATIO_SIDE / TARGET_DISTANCE, 0.0)
+SIDE_RATIO_VALID_RANGE = (8, 30)   # Distances (cm) the model is trusted for
+
+# --- Metrics ---
+measurements_total = metrics.counter(
+    "packaging_measurements_total", "measure_and_optimize() runs by outcome", ["result"]
+)
+measurement_stage_seconds = metrics.histogram(
+    "packaging_measurement_stage_seconds", "Measurement stage duration", ["stage"]
+)
+vision_seconds = metrics.histogram(
+    "packaging_vision_seconds",
+    "Vision step duration (frame_grab, preprocess, contours, image_write)",
+    ["camera", "step"]
+)
+side_alignment_iterations = metrics.histogram(
+    "packaging_side_alignment_iterations",
+    "Servo/ultrasonic iterations per side camera alignment",
+    buckets=(1, 2, 3, 5, 8, 13, 20)
+)
+ultrasonic_failures_total = metrics.counter(
+    "packaging_ultrasonic_failures_total", "Distance readings without an echo"
+)
+optimizer_seconds = metrics.histogram(
+    "packaging_optimizer_seconds", "Optimizer run time (cache misses only)", ["optimizer"]
+)
 
-# --- Setup GPIO ---
-logging.debug("Setting up GPIO...")
-GPIO.setmode(GPIO.BCM)          # Initialize the GPIO mode to BCM
-GPIO.setwarnings(False)         # Disable warnings if reinitializing GPIO
-GPIO.setup(TRIG_PIN, GPIO.OUT)  # Set trigger pin as output
-GPIO.setup(ECHO_PIN, GPIO.IN)   # Set echo pin as input
 
-logging.debug("GPIO setup complete.")
+# --- Setup GPIO ---
+# The ranger configures the trigger and echo pins on its first reading
+# (through the HAL), so importing this module touches no hardware.
+ranger = UltrasonicRanger(TRIG_PIN, ECHO_PIN)
 
 
 # --- Ultrasonic Sensor and Servo Control Functions ---
 
 def measure_distance(timeout=0.2):
     """Measure distance using HC-SR04 ultrasonic sensor.
-    
-    Triggers the sensor and returns measured distance in centimeters.
-    Includes timeout to avoid infinite loops if no echo is received.
+
+    Returns measured distance in centimeters, or None if no echo is
+    received within the timeout.
     """
     logging.debug("Measuring distance...")
+    return ranger.measure(timeout)
 
-    # Ensure GPIO is set up
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setwarnings(False)
-    GPIO.setup(TRIG_PIN, GPIO.OUT)
-    GPIO.setup(ECHO_PIN, GPIO.IN)
-
-    GPIO.output(TRIG_PIN, False)
-    time.sleep(0.0002)  # 200 microseconds delay
-
-    GPIO.output(TRIG_PIN, True)
-    time.sleep(0.00001)  # 10 microseconds pulse
-    GPIO.output(TRIG_PIN, False)
-
-    start_time = time.time()
-    stop_time = time.time()
-
-    # Wait for echo to start with timeout
-    echo_start = time.time()
-    while GPIO.input(ECHO_PIN) == 0:
-        start_time = time.time()
-        if time.time() - echo_start > timeout:
-            logging.error("Timeout waiting for echo to start.")
-            return None
-
-    # Wait for echo to end with timeout
-    echo_end = time.time()
-    while GPIO.input(ECHO_PIN) == 1:
-        stop_time = time.time()
-        if time.time() - echo_end > timeout:
-            logging.error("Timeout waiting for echo to end.")
-            return None
-
-    elapsed_time = stop_time - start_time
-    distance = (elapsed_time * 34300) / 2  # cm
-    logging.debug(f"Distance measured: {distance:.2f} cm")
 
-    return distance
+def measure_distance_burst(count=5):
+    """Return the outlier-filtered median of several distance readings."""
+    logging.debug(f"Measuring distance (burst of {count})...")
+    return ranger.measure_burst(count)
 
 
 def set_servo_angle(angle):
@@ -111,7 +134,7 @@ def set_servo_angle(angle):
         angle = max(0, min(160, angle))  # Clamp angle
         duty_cycle = angle / 18.0 + 2.5
         servo.ChangeDutyCycle(duty_cycle)
-        time.sleep(0.5)
+        hal.sleep(0.5)
         servo.ChangeDutyCycle(0)
 
         servo.stop()
@@ -133,9 +156,12 @@ def adjust_side_camera_position(
     current_angle = NEUTRAL_ANGLE
     set_servo_angle(current_angle)
 
+    iterations = 0
     for i in range(max_iterations):
+        iterations = i + 1
         distance = measure_distance()
         if distance is None:
+            ultrasonic_failures_total.inc()
             logging.error("Distance measurement failed. Skipping iteration.")
             continue
 
@@ -154,45 +180,99 @@ def adjust_side_camera_position(
         new_angle = max(0, min(160, new_angle))  # Constrain angle
         set_servo_angle(new_angle)
         current_angle = new_angle
-        time.sleep(0.1)
+        hal.sleep(0.1)
+    side_alignment_iterations.observe(iterations)
+
+
+def fit_side_ratio_model(samples):
+    """Fit the distance-to-ratio model from calibration samples.
+
+    Args:
+        samples: Iterable of (distance_cm, cm_per_pixel) pairs measured with
+            a reference object at two or more distances
+
+    Returns:
+        tuple: (slope, intercept) for SIDE_RATIO_MODEL
+    """
+    distances, ratios = zip(*samples)
+    slope, intercept = np.polyfit(distances, ratios, 1)
+    logging.debug(f"Fitted side ratio model: slope={slope:.6f}, intercept={intercept:.6f}")
+    return float(slope), float(intercept)
+
+
+def side_ratio_for_distance(distance, model=None):
+    """Return the side camera cm-per-pixel ratio at a given distance."""
+    slope, intercept = model if model is not None else SIDE_RATIO_MODEL
+    return slope * distance + intercept
+
+
+def measure_side_ratio():
+    """Take one ultrasonic reading and convert it to a pixel ratio.
+
+    Returns:
+        float: cm-per-pixel ratio, or None if the reading is unusable
+    """
+    distance = measure_distance()
+    if distance is None:
+        ultrasonic_failures_total.inc()
+        logging.error("[Side Cam Scale] Distance measurement failed.")
+        return None
+
+    low, high = SIDE_RATIO_VALID_RANGE
+    if not low <= distance <= high:
+        logging.error(
+            f"[Side Cam Scale] Distance {distance:.2f} cm outside "
+            f"calibrated range {low}-{high} cm."
+        )
+        return None
+
+    ratio = side_ratio_for_distance(distance)
+    logging.debug(
+        f"[Side Cam Scale] Distance = {distance:.2f} cm, "
+        f"ratio = {ratio:.5f} cm/px"
+    )
+    return ratio
+
+
+def position_side_camera(mode=None):
+    """Prepare the side camera and return the pixel ratio to measure with.
+
+    In "scaled" mode the servo stays put and the ratio is scaled by one
+    distance reading. If that fails, or in "servo" mode, the camera is
+    moved to TARGET_DISTANCE and the fixed calibration is used.
+
+    Args:
+        mode: "scaled" or "servo"; defaults to SIDE_MEASUREMENT_MODE
+    """
+    if (mode or SIDE_MEASUREMENT_MODE) == "scaled":
+        ratio = measure_side_ratio()
+        if ratio is not None:
+            return ratio
+        logging.warning("Falling back to servo alignment for side camera.")
+
+    adjust_side_camera_position(target_distance=TARGET_DISTANCE, tolerance=0.5)
+    return PIXEL_TO_CM_RATIO_SIDE
 
 
 # --- Computer Vision Functions for Camera Detection ---
 
 def detect_front_dimensions(camera):
     """Detect object dimensions from front camera."""
-    ret, frame = camera.read()
+    with vision_seconds.time(camera="front", step="frame_grab"):
+        ret, frame = camera.read()
     if not ret:
         logging.error("Failed to read frame from front camera.")
         return None, None, None
 
-    # Increase contrast and brightness
-    alpha = 1.5  # Contrast control (1.0-3.0)
-    beta = 50    # Brightness control (0-100)
-    frame = cv2.convertScaleAbs(frame, alpha=alpha, beta=beta)
-
-    # Apply Gaussian blur
-    frame_blurred = cv2.GaussianBlur(frame, (5, 5), 0)
-
-    # Crop to central region
-    height, width, _ = frame_blurred.shape
-    x1, y1 = int(width * 0.2), int(height * 0.2)
-    x2, y2 = int(width * 0.8), int(height * 0.8)
-    roi = frame_blurred[y1:y2, x1:x2]
-
-    # Convert ROI to grayscale
-    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-
-    # Threshold to isolate white box
-    _, mask_white = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
-
-    # Apply morphological operations
-    kernel = np.ones((7, 7), np.uint8)
-    mask_final = cv2.morphologyEx(mask_white, cv2.MORPH_OPEN, kernel, iterations=2)
-    mask_final = cv2.morphologyEx(mask_final, cv2.MORPH_CLOSE, kernel, iterations=2)
+    # Crop, contrast, blur, threshold and clean up in reused buffers
+    with vision_seconds.time(camera="front", step="preprocess"):
+        mask_final, roi = get_engine("front").process(frame)
 
     # Find contours
-    contours, _ = cv2.findContours(mask_final, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    with vision_seconds.time(camera="front", step="contours"):
+        contours, _ = cv2.findContours(
+            mask_final, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
     if not contours:
         logging.error("No contours found in front camera frame.")
         return None, None, None
@@ -218,7 +298,8 @@ def detect_front_dimensions(camera):
         f'/home/team48/packaging_env/images/'
         f'front_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.png'
     )
-    cv2.imwrite(image_path, roi)
+    with vision_seconds.time(camera="front", step="image_write"):
+        cv2.imwrite(image_path, roi)
 
     logging.debug(
         f"Front dimensions detected: "
@@ -229,62 +310,64 @@ def detect_front_dimensions(camera):
     return width_cm - 0.4, height_cm + 0.3, image_path
 
 
-def detect_side_dimension(camera):
-    """Detect object dimension from side camera."""
+def detect_side_dimension(camera, align=True, pixel_ratio=None):
+    """Detect object dimension from side camera.
+
+    Args:
+        camera: Managed side camera
+        align: Adjust the camera position before capturing
+        pixel_ratio: cm-per-pixel ratio for the current camera distance
+            (default: PIXEL_TO_CM_RATIO_SIDE)
+    """
     logging.debug("Detecting side dimensions...")
-    
-    # Adjust camera position first
-    adjust_side_camera_position(
-        target_distance=TARGET_DISTANCE,
-        tolerance=0.5,
-        max_iterations=20
-    )
-    
+    if pixel_ratio is None:
+        pixel_ratio = PIXEL_TO_CM_RATIO_SIDE
+
+    if align:
+        adjust_side_camera_position(
+            target_distance=TARGET_DISTANCE,
+            tolerance=0.5,
+            max_iterations=20
+        )
+    # Only accept frames captured after the camera stopped moving
+    frame_after = time.monotonic()
+
     for attempt in range(3):  # Retry up to 3 times
-        ret, frame = camera.read()
+        with vision_seconds.time(camera="side", step="frame_grab"):
+            ret, frame = camera.read(after=frame_after)
+        frame_after = time.monotonic()  # Retries wait for a newer frame
         if not ret:
             logging.error("Failed to read frame from side camera.")
             continue
 
-        alpha = 1.5  # Contrast control
-        beta = 50    # Brightness control
-        frame = cv2.convertScaleAbs(frame, alpha=alpha, beta=beta)
-        frame_blurred = cv2.GaussianBlur(frame, (5, 5), 0)
-
-        height, width, _ = frame_blurred.shape
-        x1, y1 = int(width * 0.2), int(height * 0.2)
-        x2, y2 = int(width * 0.8), int(height * 0.8)
-        roi = frame_blurred[y1:y2, x1:x2]
-
-        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-        _, mask_white = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
-        kernel = np.ones((7, 7), np.uint8)
-        mask_final = cv2.morphologyEx(mask_white, cv2.MORPH_OPEN, kernel, iterations=2)
-        mask_final = cv2.morphologyEx(mask_final, cv2.MORPH_CLOSE, kernel, iterations=2)
+        with vision_seconds.time(camera="side", step="preprocess"):
+            mask_final, roi = get_engine("side").process(frame)
 
-        contours, _ = cv2.findContours(mask_final, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        with vision_seconds.time(camera="side", step="contours"):
+            contours, _ = cv2.findContours(
+                mask_final, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+            )
         if not contours:
             logging.error("No contours found in side camera frame. Retrying...")
-            time.sleep(1)
             continue
 
         largest_contour = max(contours, key=cv2.contourArea)
         if cv2.contourArea(largest_contour) < 5000:
             logging.error("Largest contour too small. Retrying...")
-            time.sleep(1)
             continue
 
         x, y, w, h = cv2.boundingRect(largest_contour)
         cv2.rectangle(roi, (x, y), (x + w, y + h), (0, 255, 0), 2)
 
-        length_cm = w * PIXEL_TO_CM_RATIO_SIDE - 0.4
+        length_cm = w * pixel_ratio - 0.4
         length_cm = round(length_cm, 1)
 
         image_path = (
             f'/home/team48/packaging_env/images/'
             f'side_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.png'
         )
-        cv2.imwrite(image_path, roi)
+        with vision_seconds.time(camera="side", step="image_write"):
+            cv2.imwrite(image_path, roi)
 
         logging.debug(
             f"Side dimension detected: length={length_cm} cm. "
@@ -298,23 +381,14 @@ def detect_side_dimension(camera):
 
 # --- Genetic Algorithm and Related Functions ---
 
-def fitness_function(candidate_solution, object_dimensions, sealing_margin):
-    """Calculate fitness score for genetic algorithm candidate."""
-    candidate_length, candidate_width, candidate_height = candidate_solution
-    min_length = object_dimensions[0] + sealing_margin
-    min_width = object_dimensions[1] + sealing_margin
-    min_height = object_dimensions[2] + sealing_margin
-
-    length_penalty = max(0, candidate_length - min_length)
-    width_penalty = max(0, candidate_width - min_width)
-    height_penalty = max(0, candidate_height - min_height)
-    total_penalty = length_penalty + width_penalty + height_penalty
-    logging.debug(
-        f"Fitness function: "
-        f"candidate={candidate_solution}, "
-        f"penalty={total_penalty}"
-    )
-    return total_penalty
+def fitness_batch(population, object_dimensions, sealing_margin):
+    """Score every row of an (N, 3) population of candidate packages.
+
+    A candidate's penalty is how far each dimension exceeds the object
+    dimension plus the sealing margin, summed; lower is better.
+    """
+    minimums = np.asarray(object_dimensions, dtype=float) + sealing_margin
+    return np.maximum(population - minimums, 0).sum(axis=1)
 
 
 def genetic_algorithm(
@@ -322,50 +396,209 @@ def genetic_algorithm(
         population_size,
         generations,
         sealing_margin,
-        mutation_rate
+        mutation_rate,
+        rng=None
 ):
-    """Optimize packaging dimensions using genetic algorithm."""
+    """Optimize packaging dimensions using genetic algorithm.
+
+    The population is an (N, 3) array; fitness, selection, crossover and
+    mutation are computed for the whole population at once.
+
+    Args:
+        rng: numpy Generator or seed for reproducible runs (default: GA_SEED)
+    """
     logging.debug("Starting genetic algorithm...")
-    population = [
-        np.array([
-            object_dimensions[0] + sealing_margin + random.uniform(0, 0.1),
-            object_dimensions[1] + sealing_margin + random.uniform(0, 0.1),
-            object_dimensions[2] + sealing_margin + random.uniform(0, 0.1)
-        ])
-        for _ in range(population_size)
-    ]
+    rng = np.random.default_rng(GA_SEED if rng is None else rng)
+    minimums = np.asarray(object_dimensions, dtype=float) + sealing_margin
+
+    population = minimums + rng.uniform(0, 0.1, (population_size, 3))
+    pool_size = min(PARENT_POOL_SIZE, population_size)
     best_solution = population[0]
-    
+
     for generation in range(generations):
-        population.sort(
-            key=lambda individual: fitness_function(
-                individual,
-                object_dimensions,
-                sealing_margin
-            )
-        )
+        fitness = fitness_batch(population, object_dimensions, sealing_margin)
+        population = population[np.argsort(fitness, kind="stable")]
         best_solution = population[0]
-        logging.debug(f"Generation {generation}: Best solution = {best_solution}")
-        new_population = []
-        
-        while len(new_population) < population_size:
-            parent1, parent2 = random.sample(population[:5], 2)
-            child = (parent1 + parent2) / 2  # Simple crossover
-            if random.random() < mutation_rate:
-                child += np.random.normal(0, 0.1, 3)  # Mutation
-                logging.debug("Mutation applied to child.")
-            new_population.append(child)
-        
-        population = new_population
-
-    logging.debug("Genetic algorithm complete.")
+
+        # Pick two distinct parents from the fittest for every child
+        parents = population[:pool_size]
+        first = rng.integers(0, pool_size, population_size)
+        if pool_size > 1:
+            second = (first + rng.integers(1, pool_size, population_size)) % pool_size
+        else:
+            second = first
+        children = (parents[first] + parents[second]) / 2  # Simple crossover
+
+        mutate = rng.random(population_size) < mutation_rate
+        children[mutate] += rng.normal(0, 0.1, (int(mutate.sum()), 3))  # Mutation
+        population = children
+
+    logging.debug(f"Genetic algorithm complete. Best solution = {best_solution}")
+    return {
+        "Optimal Length": float(best_solution[0]),
+        "Optimal Width": float(best_solution[1]),
+        "Optimal Height": float(best_solution[2])
+    }
+
+
+# --- Packaging Optimizers ---
+# An optimizer takes (object_dimensions, sealing_margin) and returns the
+# "Optimal Length/Width/Height" dict used by calculate_2d_bubble_wrap_size().
+
+def analytical_optimizer(object_dimensions, sealing_margin):
+    """Return the exact optimum of fitness_batch().
+
+    The smallest package that keeps the sealing margin on every side is
+    the object dimensions plus the margin, where the penalty is zero.
+    """
+    length, width, height = (float(d) + sealing_margin for d in object_dimensions)
     return {
-        "Optimal Length": best_solution[0],
-        "Optimal Width": best_solution[1],
-        "Optimal Height": best_solution[2]
+        "Optimal Length": length,
+        "Optimal Width": width,
+        "Optimal Height": height
     }
 
 
+def genetic_optimizer(object_dimensions, sealing_margin):
+    """Search for the optimum with the genetic algorithm.
+
+    Kept for objectives without a closed form (e.g. wrap overlap or
+    roll-width constraints).
+    """
+    return genetic_algorithm(
+        object_dimensions,
+        POPULATION_SIZE,
+        GENERATIONS,
+        sealing_margin,
+        MUTATION_RATE
+    )
+
+
+OPTIMIZERS = {
+    "analytical": analytical_optimizer,
+    "genetic": genetic_optimizer,
+}
+
+
+def register_optimizer(name, optimizer):
+    """Make an optimizer selectable by name in measure_and_optimize()."""
+    OPTIMIZERS[name] = optimizer
+
+
+def optimize_dimensions(object_dimensions, optimizer=None, sealing_margin=None, use_cache=True):
+    """Run the named optimizer (default: OPTIMIZER) on measured dimensions.
+
+    Results are cached per optimizer, margin and quantized dimensions; the
+    optimizer runs on the quantized values so a key always maps to the
+    same result.
+    """
+    name = optimizer or OPTIMIZER
+    if name not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimizer '{name}'. Choose from {sorted(OPTIMIZERS)}")
+    margin = SEALING_MARGIN if sealing_margin is None else sealing_margin
+
+    dimensions_key = quantize(object_dimensions, MEASUREMENT_RESOLUTION)
+    dimensions = dequantize(dimensions_key, MEASUREMENT_RESOLUTION)
+
+    def compute():
+        logging.debug(f"Optimizing dimensions with '{name}' optimizer...")
+        with optimizer_seconds.time(optimizer=name):
+            return OPTIMIZERS[name](dimensions, margin)
+
+    if not use_cache:
+        return compute()
+    key = ("optimize", name, margin, dimensions_key)
+    return dict(result_cache.get_or_compute(key, compute))
+
+
+def cached_bubble_wrap_size(optimal_dimensions):
+    """calculate_2d_bubble_wrap_size() memoized on quantized dimensions.
+
+    Like optimize_dimensions(), the size is computed from the quantized
+    values, so a key always maps to the same result.
+    """
+    dimensions_key = quantize(
+        (
+            optimal_dimensions["Optimal Length"],
+            optimal_dimensions["Optimal Width"],
+            optimal_dimensions["Optimal Height"]
+        ),
+        MEASUREMENT_RESOLUTION
+    )
+    length, width, height = dequantize(dimensions_key, MEASUREMENT_RESOLUTION)
+    key = ("wrap", dimensions_key)
+    return dict(result_cache.get_or_compute(
+        key, lambda: calculate_2d_bubble_wrap_size({
+            "Optimal Length": length, "Optimal Width": width, "Optimal Height": height
+        })
+    ))
+
+
+def invalidate_result_cache():
+    """Drop all memoized optimizer and wrap-size results."""
+    removed = result_cache.invalidate()
+    logging.debug(f"Result cache invalidated ({removed} entries).")
+
+
+def set_sealing_margin(margin):
+    """Change SEALING_MARGIN and drop results computed with the old margin."""
+    global SEALING_MARGIN
+    SEALING_MARGIN = margin
+    invalidate_result_cache()
+
+
+def set_calibration(front_ratio=None, side_ratio=None, side_ratio_model=None):
+    """Update pixel-to-cm calibration and drop results derived from it."""
+    global PIXEL_TO_CM_RATIO_FRONT, PIXEL_TO_CM_RATIO_SIDE, SIDE_RATIO_MODEL
+    if front_ratio is not None:
+        PIXEL_TO_CM_RATIO_FRONT = front_ratio
+    if side_ratio is not None:
+        PIXEL_TO_CM_RATIO_SIDE = side_ratio
+    if side_ratio_model is not None:
+        SIDE_RATIO_MODEL = side_ratio_model
+    invalidate_result_cache()
+
+
+def benchmark_optimizers(samples=200, seed=0):
+    """Compare latency and result quality of every registered optimizer.
+
+    Quality is the distance from the tight optimum (dimensions plus
+    margin): mean absolute error, and how often any dimension came out
+    smaller than the margin allows.
+    """
+    rng = np.random.default_rng(seed)
+    cases = np.round(rng.uniform(5, 30, (samples, 3)), 1)
+    level = logging.getLogger().level
+    logging.getLogger().setLevel(logging.INFO)  # Keep debug logging out of timings
+
+    results = {}
+    try:
+        for name, optimizer in OPTIMIZERS.items():
+            errors, undersized, elapsed = [], 0, 0.0
+            for dimensions in cases:
+                start = time.perf_counter()
+                result = optimizer(tuple(dimensions), SEALING_MARGIN)
+                elapsed += time.perf_counter() - start
+
+                found = np.array([
+                    result["Optimal Length"],
+                    result["Optimal Width"],
+                    result["Optimal Height"]
+                ])
+                target = dimensions + SEALING_MARGIN
+                errors.append(np.abs(found - target).mean())
+                undersized += bool((found < target - 1e-9).any())
+            results[name] = {
+                "mean_latency_us": elapsed / samples * 1e6,
+                "mean_abs_error_cm": float(np.mean(errors)),
+                "max_abs_error_cm": float(np.max(errors)),
+                "undersized_fraction": undersized / samples,
+            }
+    finally:
+        logging.getLogger().setLevel(level)
+    return results
+
+
 def calculate_2d_bubble_wrap_size(optimal_dimensions):
     """Calculate required bubble wrap size from optimized dimensions."""
     optimal_length = optimal_dimensions["Optimal Length"]
@@ -384,61 +617,173 @@ def calculate_2d_bubble_wrap_size(optimal_dimensions):
 
 # --- Main Measure and Optimize Function ---
 
-def measure_and_optimize():
-    """Main function to measure dimensions and optimize packaging."""
-    logging.debug("Starting measure_and_optimize()...")
-    # Initialize cameras with V4L2 backend
-    front_camera = cv2.VideoCapture(0, cv2.CAP_V4L2)
-    side_camera = cv2.VideoCapture(2, cv2.CAP_V4L2)
+def _timed_call(timings, stage, func, *args, **kwargs):
+    """Call func and record its wall-clock duration under timings[stage]."""
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings[stage] = time.perf_counter() - start
 
-    # Increase exposure for dim environments
-    front_camera.set(cv2.CAP_PROP_EXPOSURE, 1)
-    side_camera.set(cv2.CAP_PROP_EXPOSURE, 1)
 
+def _capture_side(side_camera, timings, report=None):
+    """Position the side camera once, then capture the side dimension."""
+    pixel_ratio = _timed_call(timings, "side_alignment", position_side_camera)
+    if report:
+        report("side_capture", 0.5)
+    return _timed_call(
+        timings, "side_capture", detect_side_dimension, side_camera,
+        align=False, pixel_ratio=pixel_ratio
+    )
+
+
+def _capture_concurrently(front_camera, side_camera, timings, report=None):
+    """Run front detection alongside side alignment and side detection.
+
+    The front camera pipeline and the side servo/ultrasonic loop use
+    independent hardware, so they run on separate pool threads, each in a
+    copy of the caller's context so an emergency stop still cancels them.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="capture") as pool:
+        front_future = pool.submit(
+            contextvars.copy_context().run, _timed_call, timings, "front_capture",
+            detect_front_dimensions, front_camera
+        )
+        side_future = pool.submit(
+            contextvars.copy_context().run, _capture_side, side_camera, timings, report
+        )
+        front_result = front_future.result()
+        side_result = side_future.result()
+    timings["capture_wall"] = time.perf_counter() - start
+
+    stage_sum = (
+        timings["front_capture"]
+        + timings["side_alignment"]
+        + timings["side_capture"]
+    )
+    timings["overlap_saved"] = stage_sum - timings["capture_wall"]
+    return front_result, side_result
+
+
+def measure_and_optimize(concurrent=CONCURRENT_CAPTURE, optimizer=None, progress=None):
+    """Main function to measure dimensions and optimize packaging.
+
+    Every outcome, failures included, is recorded in the history database.
+
+    Args:
+        concurrent: Overlap front capture with side alignment and capture.
+            The sequential path keeps the original stage order.
+        optimizer: Name of a registered optimizer (default: OPTIMIZER)
+        progress: Optional callback progress(stage, fraction) called as
+            each stage starts, with the overall fraction done (0 to 1)
+
+    Returns:
+        dict: Measurement result with a per-stage "timings" breakdown
+            in seconds, or None if detection failed
+    """
+    start = time.perf_counter()
+    result = None
     try:
+        result = _measure(concurrent, optimizer, progress)
+        return result
+    finally:
+        record_measurement(result, time.perf_counter() - start)
+        _record_metrics(result)
+
+
+def _record_metrics(result):
+    """Count a measurement outcome and observe its stage timings."""
+    measurements_total.inc(result="success" if result else "failed")
+    if result:
+        for stage, seconds in result["timings"].items():
+            if stage not in NON_STAGE_TIMINGS:
+                measurement_stage_seconds.observe(seconds, stage=stage)
+
+
+def _measure(concurrent, optimizer, progress):
+    """Measure and optimize; see measure_and_optimize()."""
+    logging.debug("Starting measure_and_optimize()...")
+    timings = {}
+    start = time.perf_counter()
+
+    def report(stage, fraction):
+        if progress:
+            progress(stage, fraction)
+
+    # Cameras stay open between captures; the manager reconnects them on failure
+    cameras = get_camera_manager()
+    front_camera = cameras.get("front")
+    side_camera = cameras.get("side")
+
+    if concurrent:
+        logging.debug("Capturing front and side dimensions concurrently...")
+        report("capture", 0.05)
+        front_result, side_result = _capture_concurrently(
+            front_camera, side_camera, timings, report
+        )
+        front_width, front_height, front_image = front_result
+        if front_width is None or front_height is None:
+            logging.error("Front camera failed to detect dimensions.")
+            return None
+    else:
         logging.debug("Capturing front dimensions...")
-        front_width, front_height, front_image = detect_front_dimensions(front_camera)
+        report("front_capture", 0.05)
+        front_width, front_height, front_image = _timed_call(
+            timings, "front_capture", detect_front_dimensions, front_camera
+        )
         if front_width is None or front_height is None:
             logging.error("Front camera failed to detect dimensions.")
             return None
 
-        logging.debug("Adjusting side camera position...")
-        adjust_side_camera_position(target_distance=TARGET_DISTANCE, tolerance=0.5)
+        logging.debug("Positioning side camera...")
+        report("side_alignment", 0.3)
+        pixel_ratio = _timed_call(timings, "side_alignment", position_side_camera)
 
         logging.debug("Capturing side dimension...")
-        side_length, side_image = detect_side_dimension(side_camera)
-        if side_length is None:
-            logging.error("Side camera failed to detect dimension.")
-            return None
+        report("side_capture", 0.5)
+        side_result = _timed_call(
+            timings, "side_capture", detect_side_dimension, side_camera,
+            align=False, pixel_ratio=pixel_ratio
+        )
 
-        object_dimensions = (side_length, front_width, front_height)
-        logging.debug(f"Measured object dimensions (L, W, H): {object_dimensions}")
+    side_length, side_image = side_result
+    if side_length is None:
+        logging.error("Side camera failed to detect dimension.")
+        return None
 
-        logging.debug("Running genetic algorithm for optimization...")
-        optimized_dimensions = genetic_algorithm(
-            object_dimensions,
-            POPULATION_SIZE,
-            GENERATIONS,
-            SEALING_MARGIN,
-            MUTATION_RATE
-        )
-        logging.debug(f"Optimized dimensions: {optimized_dimensions}")
-
-        logging.debug("Calculating bubble wrap size...")
-        bubble_wrap = calculate_2d_bubble_wrap_size(optimized_dimensions)
-        logging.debug(f"Calculated bubble wrap size: {bubble_wrap}")
-
-        return {
-            "object_dimensions": object_dimensions,
-            "optimized_dimensions": optimized_dimensions,
-            "bubble_wrap_size": bubble_wrap,
-            "front_image_path": front_image,
-            "side_image_path": side_image
-        }
-    finally:
-        logging.debug("Releasing cameras...")
-        front_camera.release()
-        side_camera.release()
+    object_dimensions = (side_length, front_width, front_height)
+    logging.debug(f"Measured object dimensions (L, W, H): {object_dimensions}")
+
+    logging.debug("Running optimization...")
+    report("optimization", 0.85)
+    optimized_dimensions = _timed_call(
+        timings, "optimization", optimize_dimensions,
+        object_dimensions, optimizer
+    )
+    logging.debug(f"Optimized dimensions: {optimized_dimensions}")
+
+    logging.debug("Calculating bubble wrap size...")
+    report("wrap_size", 0.95)
+    bubble_wrap = _timed_call(
+        timings, "wrap_size", cached_bubble_wrap_size, optimized_dimensions
+    )
+    logging.debug(f"Calculated bubble wrap size: {bubble_wrap}")
+    logging.debug(f"Result cache: {result_cache.stats()}")
+    logging.debug(f"Camera latency: {cameras.stats()}")
+
+    timings["total"] = time.perf_counter() - start
+    logging.debug(f"Stage timings (s): {timings}")
+    report("complete", 1.0)
+
+    return {
+        "object_dimensions": object_dimensions,
+        "optimized_dimensions": optimized_dimensions,
+        "bubble_wrap_size": bubble_wrap,
+        "front_image_path": front_image,
+        "side_image_path": side_image,
+        "timings": timings
+    }
 
 
 # --- Test Code ---
@@ -453,6 +798,7 @@ def test_measure_and_optimize():
         logging.info(f"Bubble Wrap Size: {result['bubble_wrap_size']}")
         logging.info(f"Front Image Path: {result['front_image_path']}")
         logging.info(f"Side Image Path: {result['side_image_path']}")
+        logging.info(f"Stage Timings (s): {result['timings']}")
     else:
         logging.error("Test failed: No results returned.")
 
@@ -463,5 +809,6 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logging.error("Test interrupted by user.")
     finally:
-        logging.debug("Cleaning up GPIO...")
+        logging.debug("Releasing cameras and cleaning up GPIO...")
+        release_camera_manager()
         GPIO.cleanup()
\ No newline at end of file
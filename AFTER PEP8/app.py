@@ -1,10 +1,18 @@
 from flask import (
-    Flask, jsonify, request, send_from_directory, render_template,
+    Flask, Response, jsonify, request, send_from_directory, render_template,
     session, redirect, url_for
 )
 from initial_seal import InitialSealController
-from delivery_mechanism import run_delivery
+from delivery_mechanism import run_delivery, rail_status, load_plan_cache
 from emergency_stop import emergency_stop as hardware_emergency_stop
+from camera_manager import get_camera_manager, release_camera_manager
+from jobs import get_job_manager
+from metrics import CONTENT_TYPE, get_registry
+from history import STATS_WINDOW_HOURS, get_history
+from measurement_store import get_measurement_store
+from arbiter import EMERGENCY, get_arbiter
+import atexit
+import json
 import os
 import algot as detection
 import logging
@@ -43,31 +51,70 @@ def login():
     return render_template('login.html')
 
 
+def capture_response(result):
+    """Build the /capture-dimensions JSON body from a measurement."""
+    front_image_url = os.path.join(
+        '/images', 
+        os.path.basename(result["front_image_path"])
+    )
+    return {
+        "measured_dimensions": {
+            "length": result["object_dimensions"][0],
+            "width": result["object_dimensions"][1],
+            "height": result["object_dimensions"][2]
+        },
+        "optimal_dimensions": result["optimized_dimensions"],
+        "bubble_wrap_size": result["bubble_wrap_size"],
+        "image_url": front_image_url,
+        "delivery": True
+    }
+
+
+def session_measurement():
+    """Return the session's measurement from the store.
+
+    The session only holds the measurement id; a finished capture job
+    started from this session supplies it on first use.
+    """
+    if 'capture_job' in session:
+        job = get_job_manager().get(session['capture_job'])
+        if job and job.state == "succeeded":
+            session['measurement_id'] = job.result['measurement_id']
+            session.pop('capture_job')
+    return get_measurement_store().get(session.get('measurement_id'))
+
+
+def measure_job(progress):
+    """Job body for a capture: measure and store the result, or fail."""
+    result = get_arbiter().run("capture", detection.measure_and_optimize, progress=progress)
+    if not result:
+        raise RuntimeError("Measurement failed")
+    return {"measurement_id": get_measurement_store().put(result)}
+
+
+def delivery_job(wrap_width, wrap_length, object_dimensions, progress):
+    """Job body for a delivery: run it, or fail with a message."""
+    success = get_arbiter().run(
+        "delivery", run_delivery, wrap_width, wrap_length, object_dimensions,
+        progress=progress
+    )
+    if not success:
+        raise RuntimeError("Delivery failed")
+    return {"status": "success"}
+
+
 @app.route('/capture-dimensions', methods=['GET'])
 def capture_dimensions():
     """Capture and calculate package dimensions."""
     try:
-        # Store result in session instead of just returning
-        session['measurement_data'] = detection.measure_and_optimize()
-        
-        if session['measurement_data']:
-            result = session['measurement_data']
-            front_image_url = os.path.join(
-                '/images', 
-                os.path.basename(result["front_image_path"])
-            )
-            
-            return jsonify({
-                "measured_dimensions": {
-                    "length": result["object_dimensions"][0],
-                    "width": result["object_dimensions"][1],
-                    "height": result["object_dimensions"][2]
-                },
-                "optimal_dimensions": result["optimized_dimensions"],
-                "bubble_wrap_size": result["bubble_wrap_size"],
-                "image_url": front_image_url,
-                "delivery": True
-            })
+        result = get_arbiter().run("capture", detection.measure_and_optimize)
+
+        if result:
+            # Keep the result server-side; the session only holds its id
+            store = get_measurement_store()
+            session['measurement_id'] = store.put(result)
+            session.pop('capture_job', None)
+            return jsonify(capture_response(store.get(session['measurement_id'])))
         else:
             return jsonify({"error": "Measurement failed"}), 500
             
@@ -76,32 +123,97 @@ def capture_dimensions():
         return jsonify({"error": "Measurement failed"}), 500
 
 
+@app.route('/capture-dimensions', methods=['POST'])
+def start_capture():
+    """Start a capture job and return its id without waiting for it."""
+    job = get_job_manager().submit("capture", measure_job)
+    session.pop('measurement_id', None)
+    session['capture_job'] = job.id
+    return jsonify({"job_id": job.id}), 202
+
+
 @app.route('/deliver-product', methods=['POST'])
 def deliver_product():
-    """Handle product delivery."""
+    """Start a delivery job for the captured measurement."""
     try:
-        if 'measurement_data' not in session:
+        measurement = session_measurement()
+        if not measurement:
             return jsonify({"error": "Capture dimensions first"}), 400
             
-        wrap_width = session['measurement_data']['bubble_wrap_size']['width']
-        wrap_length = session['measurement_data']['bubble_wrap_size']['length']
-
-        # Call with both width and length
-        success = run_delivery(wrap_width, wrap_length)
-        
-        if success:
-            return jsonify({"status": "success"})
-        return jsonify({"status": "error"}), 500
+        wrap_width = measurement['bubble_wrap_size']['width']
+        wrap_length = measurement['bubble_wrap_size']['length']
+        object_dimensions = measurement.get('object_dimensions')
+
+        # Package dimensions let small packages use a shorter sealing cycle
+        job = get_job_manager().submit(
+            "delivery", delivery_job, wrap_width, wrap_length, object_dimensions
+        )
+        return jsonify({"job_id": job.id}), 202
             
     except Exception as e:
         logging.error(f"Delivery error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report a job's state, latest progress and, once done, its result."""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    status = job.to_dict()
+    if job.state == "succeeded":
+        if job.kind == "capture":
+            if session.get('capture_job') == job.id:
+                session_measurement()
+            measurement_id = job.result["measurement_id"]
+            status["result"] = {
+                "measurement_id": measurement_id,
+                **capture_response(get_measurement_store().get(measurement_id)),
+            }
+        else:
+            status["result"] = job.result
+    return jsonify(status)
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream a job's progress and state events as Server-Sent Events."""
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    try:
+        after = int(request.headers.get('Last-Event-ID') or 0)
+    except ValueError:
+        after = 0   # Not an id we sent; replay the job from the start
+
+    def stream():
+        for event in manager.stream(job, after):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield (
+                    f"id: {event['seq']}\nevent: {event['type']}\n"
+                    f"data: {json.dumps(event)}\n\n"
+                )
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def run_seal_controller(operation):
+    """Run one InitialSealController operation and release its GPIO."""
+    controller = InitialSealController()
+    try:
+        getattr(controller, operation)()
+    finally:
+        controller.cleanup()
+
+
 @app.route('/initial-feed', methods=['POST'])
 def initial_feed():
     """Handle initial bubble wrap feeding."""
-    controller = None
     try:
         if not session.get('authenticated'):
             return jsonify({
@@ -109,8 +221,8 @@ def initial_feed():
                 "message": "Unauthorized"
             }), 401
 
-        controller = InitialSealController()
-        controller.perform_feeding()  # Only does the feeding
+        # Only does the feeding
+        get_arbiter().run("initial_feed", run_seal_controller, "perform_feeding")
         return jsonify({
             "status": "success", 
             "message": "Bubble wrap feeding completed"
@@ -122,20 +234,14 @@ def initial_feed():
             "status": "error", 
             "message": str(e)
         }), 500
-    finally:
-        if controller:
-            controller.cleanup()
 
 
 @app.route('/initial-seal-actuate', methods=['POST'])
 def initial_seal_actuate():
     """Handle initial sealing actuation."""
-    controller = None
     try:
-        app.logger.info("Initializing sealing controller...")
-        controller = InitialSealController()
         app.logger.info("Performing sealing operation...")
-        controller.perform_sealing()
+        get_arbiter().run("initial_seal", run_seal_controller, "perform_sealing")
         return jsonify({
             "status": "success", 
             "message": "Actuator sealing completed"
@@ -148,16 +254,17 @@ def initial_seal_actuate():
             "status": "error", 
             "message": str(e)
         }), 500
-    finally:
-        if controller:
-            controller.cleanup()
 
 
 @app.route('/emergency-stop', methods=['POST'])
 def emergency_stop():
-    """Activate emergency stop for all hardware."""
+    """Activate emergency stop for all hardware.
+
+    The stop preempts whatever hardware command is running: its step loops
+    and waits are cancelled before the reset sequence starts.
+    """
     try:
-        hardware_emergency_stop()
+        get_arbiter().run("emergency_stop", hardware_emergency_stop, priority=EMERGENCY)
         return jsonify({
             "status": "success",
             "message": "Emergency stop activated. All hardware stopped."
@@ -171,6 +278,49 @@ def emergency_stop():
         }), 500
 
 
+@app.route('/hardware-status', methods=['GET'])
+def hardware_status():
+    """Report the running hardware command and arbiter counters."""
+    return jsonify(get_arbiter().stats())
+
+
+@app.route('/measurements/<measurement_id>', methods=['GET'])
+def stored_measurement(measurement_id):
+    """Return a stored measurement by id."""
+    result = get_measurement_store().get(measurement_id)
+    if result is None:
+        return jsonify({"error": "Unknown measurement"}), 404
+    return jsonify({"measurement_id": measurement_id, **capture_response(result)})
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Report throughput, stage latency percentiles and wrap consumption."""
+    try:
+        hours = float(request.args.get('hours', STATS_WINDOW_HOURS))
+    except ValueError:
+        return jsonify({"error": "hours must be a number"}), 400
+    return jsonify(get_history().stats(hours))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose counters, gauges and latency histograms for Prometheus."""
+    return Response(get_registry().render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/camera-stats', methods=['GET'])
+def camera_stats():
+    """Report open, first-frame and grab latency for each camera."""
+    return jsonify(get_camera_manager().stats())
+
+
+@app.route('/rail-status', methods=['GET'])
+def rail_status_route():
+    """Report tracked rail positions and the rail travel saved."""
+    return jsonify(rail_status())
+
+
 @app.route('/images/<filename>')
 def images(filename):
     """Serve image files."""
@@ -195,4 +345,10 @@ def list_images():
 
 
 if __name__ == "__main__":
+    # Open cameras once at startup so the first capture doesn't pay for it
+    get_camera_manager()
+    atexit.register(release_camera_manager)
+    # Recompile saved motion plans before any motion, so the first delivery
+    # after a restart hits the plan cache
+    load_plan_cache()
     app.run(host="0.0.0.0", port=5001, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,236 @@
+import logging
+import threading
+import contextvars
+
+import hal
+
+# --- Arbiter Settings ---
+NORMAL = 0                     # Priority of ordinary hardware commands
+EMERGENCY = 1                  # Preempts whatever is running
+CANCEL_POLL_INTERVAL = 0.005   # Longest a HAL sleep runs between cancellation checks (s)
+PREEMPT_TIMEOUT = 3.0          # Longest an emergency waits for a preempted command (s);
+                               # above FRAME_WAIT_TIMEOUT, the longest uncancellable camera wait
+
+
+# Token of the hardware command the current thread is working for. Set by
+# HardwareArbiter.run() in the command's thread; worker threads only see it
+# when started in a copy of that context (contextvars.copy_context()).
+_command_token = contextvars.ContextVar("hardware_command_token", default=None)
+
+
+class CommandCancelled(Exception):
+    """Raised inside a hardware command once its token has been cancelled."""
+
+
+class PreemptionTimeout(RuntimeError):
+    """Raised when a preempted command did not stop within PREEMPT_TIMEOUT."""
+
+
+class CancellationToken:
+    """Flag shared by one hardware command and everything it runs.
+
+    Step loops call is_set() (the threading.Event interface, so pulse
+    trains accept either); other code calls check(), which raises
+    CommandCancelled once the command has been preempted.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        """Raise CommandCancelled if the command has been cancelled."""
+        if self._event.is_set():
+            raise CommandCancelled(f"{self.name} {self.reason}")
+
+
+class HardwareArbiter:
+    """Serializes hardware commands and lets emergencies preempt them.
+
+    One command runs at a time. Its token is the current token only in
+    the command's own thread and in workers started in a copy of its
+    context (phase workers included), so step loops, relay timelines and
+    hal.sleep() there see the cancellation while other threads don't.
+    An EMERGENCY command cancels the running command, waits for it to
+    unwind and runs next; normal commands queue behind it. If the command
+    is stuck somewhere that never checks its token, the emergency forces
+    the outputs safe after preempt_timeout and fails instead of waiting.
+    """
+
+    def __init__(self, preempt_timeout=PREEMPT_TIMEOUT):
+        self.preempt_timeout = preempt_timeout
+        self._condition = threading.Condition()
+        self._active = None            # (name, priority, token)
+        self._emergencies_waiting = 0
+        self.commands = 0
+        self.preemptions = 0
+        self.cancelled = 0
+        self.preempt_timeouts = 0
+        hal.set_sleep_hook(_cancellable_sleep)
+
+    def run(self, name, func, *args, priority=NORMAL, **kwargs):
+        """Run func(*args, **kwargs) as the only hardware command.
+
+        Returns:
+            The return value of func
+
+        Raises:
+            CommandCancelled: If the command was preempted, even when func
+                swallowed the cancellation and returned normally
+            PreemptionTimeout: If this is an emergency and the preempted
+                command did not stop in time; func is not run, but relays
+                are released and STEP pins driven low
+        """
+        token = CancellationToken(name)
+        with self._condition:
+            stuck = None
+            if priority >= EMERGENCY:
+                stuck = self._preempt(name)
+            else:
+                self._condition.wait_for(
+                    lambda: self._active is None and not self._emergencies_waiting
+                )
+            if stuck is None:
+                self._active = (name, priority, token)
+                self.commands += 1
+
+        if stuck is not None:
+            logging.critical(
+                f"'{stuck}' did not stop within {self.preempt_timeout}s of {name}; "
+                f"forcing relays off and STEP pins low without running {name}"
+            )
+            force_safe_outputs()
+            raise PreemptionTimeout(
+                f"'{stuck}' did not stop within {self.preempt_timeout}s; "
+                f"outputs forced safe, {name} not run"
+            )
+
+        context_token = _command_token.set(token)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            _command_token.reset(context_token)
+            with self._condition:
+                self._active = None
+                self._condition.notify_all()
+        if token.cancelled:
+            self.cancelled += 1
+            raise CommandCancelled(f"{name} {token.reason}")
+        return result
+
+    def _preempt(self, name):
+        """Cancel a running normal command and wait for the arbiter to be idle.
+
+        Called with the condition held. Another emergency is waited for
+        without a timeout.
+
+        Returns:
+            None once idle, or the name of a preempted command that did not
+            stop within preempt_timeout
+        """
+        self._emergencies_waiting += 1
+        try:
+            active = self._active
+            if active and active[1] < EMERGENCY:
+                logging.warning(f"{name} preempting '{active[0]}'")
+                active[2].cancel(f"preempted by {name}")
+                self.preemptions += 1
+                if not self._condition.wait_for(
+                    lambda: self._active is not active, timeout=self.preempt_timeout
+                ):
+                    self.preempt_timeouts += 1
+                    return active[0]
+            self._condition.wait_for(lambda: self._active is None)
+            return None
+        finally:
+            self._emergencies_waiting -= 1
+
+    def cancel(self, reason="cancelled"):
+        """Cancel the running command, if any, without running another."""
+        active = self._active
+        token = active[2] if active else None
+        if token:
+            token.cancel(reason)
+        return token is not None
+
+    def stats(self):
+        """Return command counters and the name of the running command."""
+        active = self._active
+        return {
+            "active": active[0] if active else None,
+            "commands": self.commands,
+            "preemptions": self.preemptions,
+            "cancelled": self.cancelled,
+            "preempt_timeouts": self.preempt_timeouts,
+        }
+
+
+_arbiter = None
+_arbiter_lock = threading.Lock()
+
+
+def get_arbiter():
+    """Return the process-wide arbiter, creating it on first use."""
+    global _arbiter
+    with _arbiter_lock:
+        if _arbiter is None:
+            _arbiter = HardwareArbiter()
+        return _arbiter
+
+
+def current_token():
+    """Return the token of the hardware command this thread works for, or None."""
+    return _command_token.get()
+
+
+def force_safe_outputs():
+    """Release every actuator relay and drive every STEP pin low.
+
+    Writes GPIO directly, bypassing the relay bank and the command that
+    owns the pins, for when that command cannot be stopped. Each write is
+    attempted even if an earlier one fails.
+    """
+    from hal import GPIO
+    from relay_bank import USED_PINS
+    from delivery_mechanism import AXES
+
+    step_pins = sorted({axis.step_pin for axis in AXES.values()})
+    for label, pins, level in (("relay", USED_PINS, GPIO.HIGH), ("STEP", step_pins, GPIO.LOW)):
+        try:
+            if GPIO.getmode() is None:
+                GPIO.setmode(GPIO.BCM)
+            GPIO.setwarnings(False)
+            GPIO.setup(list(pins), GPIO.OUT)
+            GPIO.output(list(pins), level)
+        except Exception as e:
+            logging.critical(f"Could not force {label} pins {list(pins)} safe: {e}")
+
+
+def _cancellable_sleep(backend, seconds):
+    """hal.sleep() hook: sleep in short slices, raising once cancelled."""
+    token = current_token()
+    if token is None:
+        backend.sleep(seconds)
+        return
+    token.check()
+    deadline = backend.monotonic() + seconds
+    while True:
+        remaining = deadline - backend.monotonic()
+        if remaining <= 0:
+            return
+        backend.sleep(min(remaining, CANCEL_POLL_INTERVAL))
+        token.check()
+
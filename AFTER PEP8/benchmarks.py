@@ -0,0 +1,52 @@
+import argparse
+import importlib
+import json
+import logging
+
+# Benchmarks runnable from the command line, e.g. `python benchmarks.py vision`.
+# Modules are imported on demand so hardware-only benchmarks don't stop the
+# others from running on a machine without the hardware libraries.
+BENCHMARKS = {
+    "vision": "vision:benchmark_preprocess",
+    "ultrasonic": "ultrasonic:benchmark_ranging",
+    "optimizers": "algot:benchmark_optimizers",
+    "stepper": "stepper:benchmark_stepping",
+    "motion": "delivery_mechanism:benchmark_motion_profiles",
+    "jitter": "motion_executor:benchmark_jitter",
+    "relays": "relay_bank:benchmark_relays",
+    "estop": "delivery_mechanism:benchmark_estop_latency",
+    "store": "measurement_store:benchmark_measurement_store",
+    "history": "history:benchmark_history",
+    "metrics": "metrics:benchmark_metrics",
+}
+
+
+def run_benchmarks(names):
+    """Run the named benchmarks and return their results keyed by name."""
+    results = {}
+    for name in names:
+        logging.info(f"Running benchmark: {name}")
+        module_name, function_name = BENCHMARKS[name].split(":")
+        benchmark = getattr(importlib.import_module(module_name), function_name)
+        results[name] = benchmark()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run packaging benchmarks.")
+    parser.add_argument(
+        "names", nargs="*",
+        help=f"Benchmarks to run (default: all). Available: {', '.join(sorted(BENCHMARKS))}"
+    )
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    results = run_benchmarks(args.names or sorted(BENCHMARKS))
+    print(json.dumps(results, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+
+
+def quantize(values, resolution):
+    """Round values to a grid and return them as a hashable tuple of ints.
+
+    Values that differ by less than half a resolution step map to the same
+    key, so float noise in repeated measurements still hits the cache.
+    """
+    return tuple(int(round(float(value) / resolution)) for value in values)
+
+
+def dequantize(key, resolution):
+    """Return the grid values a quantized key stands for."""
+    return tuple(step * resolution for step in key)
+
+
+class LRUCache:
+    """Thread-safe, bounded least-recently-used cache with hit/miss counters."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, marking it most recently used."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entry."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing and storing it on a miss."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, predicate=None):
+        """Drop every entry, or only those whose key matches predicate.
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self._lock:
+            if predicate is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                stale = [key for key in self._entries if predicate(key)]
+                for key in stale:
+                    del self._entries[key]
+                removed = len(stale)
+            self.invalidations += 1
+            return removed
+
+    def items(self):
+        """Return (key, value) pairs from least to most recently used."""
+        with self._lock:
+            return list(self._entries.items())
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Return size, hit/miss counts and hit rate."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
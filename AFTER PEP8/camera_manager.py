@@ -0,0 +1,371 @@
+import threading
+import time
+import logging
+from collections import deque
+
+import cv2
+
+import metrics
+
+# --- Camera Configuration ---
+
+FRONT_CAMERA_INDEX = 0     # /dev/video0
+SIDE_CAMERA_INDEX = 2      # /dev/video2
+CAMERA_EXPOSURE = 1        # Increase exposure for dim environments
+RECONNECT_ATTEMPTS = 3     # Reopen attempts before a read is reported failed
+RECONNECT_DELAY = 0.5      # Seconds between reopen attempts
+FRAME_BUFFER_SIZE = 4      # Frames kept by each grabber thread
+FRAME_WAIT_TIMEOUT = 2.0   # Max seconds to wait for a fresh frame
+MAX_FRAME_AGE = 0.5        # Oldest buffered frame read() hands out (s)
+
+camera_open_seconds = metrics.histogram(
+    "packaging_camera_open_seconds", "Time to open a camera and read its first frame",
+    ["camera"]
+)
+
+
+class FrameGrabber:
+    """Background thread that keeps draining a camera into a ring buffer.
+
+    Reading continuously stops V4L2 from handing out stale queued frames:
+    the newest buffered frame is at most one frame period old. Frames that
+    fall off the ring without ever being handed out count as dropped.
+    """
+
+    def __init__(self, camera, buffer_size=FRAME_BUFFER_SIZE):
+        self.camera = camera
+        self._frames = deque(maxlen=buffer_size)  # (sequence, timestamp, frame)
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._sequence = 0
+        self._last_consumed = 0
+        self.frames_captured = 0
+        self.dropped_frames = 0
+        self.grab_failures = 0
+
+    def start(self):
+        """Start the grabber thread if it is not already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"{self.camera.name}-grabber",
+            daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the grabber thread and wait for it to exit."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=FRAME_WAIT_TIMEOUT)
+            self._thread = None
+
+    def is_running(self):
+        """Return True while the grabber thread is alive."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            ret, frame = self.camera.grab()
+            if not ret:
+                self.grab_failures += 1
+                self._stop_event.wait(RECONNECT_DELAY)
+                continue
+
+            timestamp = time.monotonic()
+            with self._condition:
+                if len(self._frames) == self._frames.maxlen:
+                    evicted_sequence = self._frames[0][0]
+                    if evicted_sequence > self._last_consumed:
+                        self.dropped_frames += 1
+                self._sequence += 1
+                self._frames.append((self._sequence, timestamp, frame))
+                self.frames_captured += 1
+                self._condition.notify_all()
+
+    def latest(self):
+        """Return (sequence, timestamp, frame) for the newest frame, or None."""
+        with self._condition:
+            return self._take(self._frames[-1]) if self._frames else None
+
+    def wait_for_frame(self, after=None, timeout=FRAME_WAIT_TIMEOUT):
+        """Return the first frame captured after a monotonic timestamp.
+
+        Args:
+            after: time.monotonic() value, or None for the newest frame
+            timeout: Maximum seconds to wait
+
+        Returns:
+            tuple: (sequence, timestamp, frame), or None on timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if after is None and self._frames:
+                    return self._take(self._frames[-1])
+                for entry in self._frames:
+                    if after is not None and entry[1] > after:
+                        return self._take(entry)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _take(self, entry):
+        self._last_consumed = max(self._last_consumed, entry[0])
+        return entry
+
+    def stats(self):
+        """Return frame age, buffer fill and drop counters."""
+        with self._condition:
+            newest = self._frames[-1][1] if self._frames else None
+            buffered = len(self._frames)
+        return {
+            "running": self.is_running(),
+            "frame_age": time.monotonic() - newest if newest is not None else None,
+            "buffered_frames": buffered,
+            "frames_captured": self.frames_captured,
+            "dropped_frames": self.dropped_frames,
+            "grab_failures": self.grab_failures,
+        }
+
+
+class ManagedCamera:
+    """Long-lived V4L2 camera that reopens itself when reads fail.
+
+    The device is opened once and kept open between captures, so callers
+    only pay for a frame grab. Once start_grabber() is called, read()
+    serves frames from a background FrameGrabber instead of the device.
+    Open, first-frame and per-grab latencies are reported by stats().
+    """
+
+    def __init__(self, name, index, exposure=CAMERA_EXPOSURE):
+        self.name = name
+        self.index = index
+        self.exposure = exposure
+        self._capture = None
+        self._lock = threading.Lock()
+
+        # Latency bookkeeping (seconds)
+        self.open_latency = None
+        self.first_frame_latency = None
+        self.last_grab_latency = None
+        self.grab_count = 0
+        self.grab_total = 0.0
+        self.grab_max = 0.0
+        self.read_failures = 0
+        self.reconnects = 0             # Opens following a failed read or open
+        self._failed = False
+        self.grabber = None
+
+    def open(self):
+        """Open the device and prime it with a first frame.
+
+        Returns:
+            bool: True if the camera delivered a frame, False otherwise
+        """
+        with self._lock:
+            return self._open_locked()
+
+    def _open_locked(self):
+        self._release_locked()
+        if self._failed:
+            self.reconnects += 1
+        self._failed = True     # Until the first frame arrives
+        logging.debug(f"Opening {self.name} camera (index {self.index})...")
+
+        start = time.perf_counter()
+        capture = cv2.VideoCapture(self.index, cv2.CAP_V4L2)
+        if not capture.isOpened():
+            logging.error(f"Failed to open {self.name} camera.")
+            capture.release()
+            return False
+        capture.set(cv2.CAP_PROP_EXPOSURE, self.exposure)
+        self.open_latency = time.perf_counter() - start
+
+        # The first frame includes the sensor's auto-settle time
+        ret, _ = capture.read()
+        if not ret:
+            logging.error(f"{self.name} camera opened but returned no frame.")
+            capture.release()
+            return False
+        self.first_frame_latency = time.perf_counter() - start
+        camera_open_seconds.observe(self.first_frame_latency, camera=self.name)
+
+        self._capture = capture
+        self._failed = False
+        logging.debug(
+            f"{self.name} camera ready: "
+            f"open={self.open_latency * 1000:.1f} ms, "
+            f"first frame={self.first_frame_latency * 1000:.1f} ms"
+        )
+        return True
+
+    def is_opened(self):
+        """Return True if the device is currently open."""
+        return self._capture is not None and self._capture.isOpened()
+
+    def start_grabber(self, buffer_size=FRAME_BUFFER_SIZE):
+        """Start draining the device into a ring buffer on a background thread."""
+        if self.grabber is None:
+            self.grabber = FrameGrabber(self, buffer_size)
+        self.grabber.start()
+
+    def stop_grabber(self):
+        """Stop the background grabber, if running."""
+        if self.grabber is not None:
+            self.grabber.stop()
+
+    def read(self, after=None, timeout=FRAME_WAIT_TIMEOUT):
+        """Return a frame without waiting on the V4L2 queue when possible.
+
+        Args:
+            after: Only accept a frame captured after this time.monotonic()
+                value. None returns the newest frame, provided it is at most
+                MAX_FRAME_AGE old.
+            timeout: Max seconds to wait for a matching frame
+
+        Returns:
+            tuple: (ret, frame) with the same meaning as VideoCapture.read()
+        """
+        if self.grabber is None or not self.grabber.is_running():
+            return self.grab()
+
+        entry = None
+        if after is None:
+            entry = self.grabber.latest()
+            if entry is not None and time.monotonic() - entry[1] > MAX_FRAME_AGE:
+                entry = None    # The grabber has stopped delivering; don't serve it
+            after = time.monotonic() - MAX_FRAME_AGE
+        if entry is None:
+            entry = self.grabber.wait_for_frame(after, timeout)
+        if entry is None:
+            logging.error(f"No fresh frame from {self.name} camera within {timeout}s.")
+            return False, None
+        return True, entry[2]
+
+    def grab(self):
+        """Read a frame from the device, reopening it if the read fails.
+
+        Returns:
+            tuple: (ret, frame) with the same meaning as VideoCapture.read()
+        """
+        with self._lock:
+            for attempt in range(RECONNECT_ATTEMPTS + 1):
+                if not self.is_opened():
+                    if attempt:
+                        time.sleep(RECONNECT_DELAY)
+                    if not self._open_locked():
+                        continue
+
+                start = time.perf_counter()
+                ret, frame = self._capture.read()
+                latency = time.perf_counter() - start
+                if ret:
+                    self._record_grab(latency)
+                    return ret, frame
+
+                self.read_failures += 1
+                self._failed = True
+                logging.warning(
+                    f"{self.name} camera read failed "
+                    f"(attempt {attempt + 1}). Reconnecting..."
+                )
+                self._release_locked()
+
+        logging.error(f"{self.name} camera unavailable after reconnect attempts.")
+        return False, None
+
+    def _record_grab(self, latency):
+        self.last_grab_latency = latency
+        self.grab_count += 1
+        self.grab_total += latency
+        self.grab_max = max(self.grab_max, latency)
+
+    def release(self):
+        """Stop the grabber and release the underlying device."""
+        self.stop_grabber()
+        with self._lock:
+            self._release_locked()
+
+    def _release_locked(self):
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+    def stats(self):
+        """Return latency and health counters for this camera."""
+        mean_grab = self.grab_total / self.grab_count if self.grab_count else None
+        return {
+            "index": self.index,
+            "opened": self.is_opened(),
+            "open_latency": self.open_latency,
+            "first_frame_latency": self.first_frame_latency,
+            "last_grab_latency": self.last_grab_latency,
+            "mean_grab_latency": mean_grab,
+            "max_grab_latency": self.grab_max,
+            "grab_count": self.grab_count,
+            "read_failures": self.read_failures,
+            "reconnects": self.reconnects,
+            "grabber": self.grabber.stats() if self.grabber else None,
+        }
+
+
+class CameraManager:
+    """Owns the front and side cameras for the lifetime of the process."""
+
+    def __init__(self, cameras=None):
+        if cameras is None:
+            cameras = {"front": FRONT_CAMERA_INDEX, "side": SIDE_CAMERA_INDEX}
+        self.cameras = {
+            name: ManagedCamera(name, index) for name, index in cameras.items()
+        }
+
+    def start(self, grabbers=True):
+        """Open every camera and start its grabber thread.
+
+        Open failures are logged; the grabber or first read retries them.
+        """
+        for camera in self.cameras.values():
+            camera.open()
+            if grabbers:
+                camera.start_grabber()
+
+    def get(self, name):
+        """Return the managed camera registered under name."""
+        return self.cameras[name]
+
+    def stats(self):
+        """Return latency statistics for every camera."""
+        return {name: camera.stats() for name, camera in self.cameras.items()}
+
+    def release(self):
+        """Release every camera."""
+        for camera in self.cameras.values():
+            camera.release()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_camera_manager():
+    """Return the process-wide camera manager, opening cameras on first use."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = CameraManager()
+            _manager.start()
+        return _manager
+
+
+def release_camera_manager():
+    """Release the process-wide camera manager, if one was started."""
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.release()
+            _manager = None
@@ -0,0 +1,186 @@
+import logging
+
+import hal
+from relay_bank import actuator_levels, get_relay_bank
+
+# --- Choreography Settings ---
+GROUPS = ("main", "left")          # Actuator groups driven by relay_bank
+ACTIONS = ("push", "pull")
+
+
+class Event:
+    """One actuator action on the timeline.
+
+    Args:
+        group: "main" (the three right-hand actuators) or "left"
+        action: "push" or "pull"
+        start: Offset from the start of the timeline (s)
+        duration: How long the relays stay on (s)
+    """
+
+    def __init__(self, group, action, start, duration):
+        if group not in GROUPS:
+            raise ValueError(f"Unknown actuator group: {group}")
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown actuator action: {action}")
+        if start < 0 or duration < 0:
+            raise ValueError("Event start and duration must not be negative")
+        self.group = group
+        self.action = action
+        self.start = start
+        self.duration = duration
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    def __repr__(self):
+        return f"Event({self.group!r}, {self.action!r}, {self.start}, {self.duration})"
+
+
+class Timeline:
+    """Events compiled into relay switch points.
+
+    points is a list of (offset, levels, labels) sorted by offset: at each
+    offset every relay in levels is written in one bank write. labels
+    names the event edges that switch there, e.g. "main push on".
+    """
+
+    def __init__(self, events, points, duration):
+        self.events = events
+        self.points = points
+        self.duration = duration
+
+
+def compile_timeline(events, duration=None):
+    """Merge events into switch points.
+
+    Edges at the same offset share one write; a group's release and its
+    next action at the same instant collapse to the action.
+
+    Args:
+        events: Iterable of Event
+        duration: Total timeline length (s); defaults to the last event end
+
+    Raises:
+        ValueError: If two events of the same group overlap
+    """
+    events = sorted(events, key=lambda event: (event.start, event.group))
+    for group in GROUPS:
+        own = [event for event in events if event.group == group]
+        for first, second in zip(own, own[1:]):
+            if second.start < first.end:
+                raise ValueError(f"Overlapping {group} events: {first} and {second}")
+
+    edges = {}
+    for event in events:
+        if not event.duration:
+            continue
+        edges.setdefault(event.end, []).append((0, event.group, "off"))
+        edges.setdefault(event.start, []).append((1, event.group, event.action))
+
+    points = []
+    for offset in sorted(edges):
+        levels = {}
+        labels = []
+        for _, group, action in sorted(edges[offset]):  # Releases before actions
+            levels.update(actuator_levels(**{group: action}))
+            labels.append(f"{group} {action}" + ("" if action == "off" else " on"))
+        points.append((offset, levels, labels))
+
+    end = max((event.end for event in events), default=0.0)
+    return Timeline(events, points, max(end, duration or 0.0))
+
+
+def cycle_events(cycles):
+    """Turn (action, main s, left s, pause after s) cycles into events.
+
+    Both groups start together; the next cycle starts once the longer of
+    the two has finished and the pause has elapsed.
+
+    Returns:
+        tuple: (list of Event, total duration including the last pause)
+    """
+    events = []
+    cursor = 0.0
+    for action, main_duration, left_duration, pause in cycles:
+        events.append(Event("main", action, cursor, main_duration))
+        events.append(Event("left", action, cursor, left_duration))
+        cursor += max(main_duration, left_duration) + pause
+    return events, cursor
+
+
+def scale_cycles(cycles, on_scale, dwell_scale, min_on_time=0.0, min_pause=0.0):
+    """Shorten push/pull cycles, never lengthening any of them.
+
+    Args:
+        cycles: (action, main s, left s, pause after s) tuples
+        on_scale: Factor for the time the relays stay on (capped at 1)
+        dwell_scale: Factor for the pause after each cycle (capped at 1)
+        min_on_time: Floor for a scaled on-time (the original is kept if
+            it was already shorter)
+        min_pause: Floor for a scaled pause, applied the same way
+    """
+    on_scale = min(on_scale, 1.0)
+    dwell_scale = min(dwell_scale, 1.0)
+
+    def on(duration):
+        return min(duration, max(duration * on_scale, min_on_time))
+
+    def dwell(duration):
+        return min(duration, max(duration * dwell_scale, min_pause))
+
+    return tuple(
+        (action, on(main_duration), on(left_duration), dwell(pause))
+        for action, main_duration, left_duration, pause in cycles
+    )
+
+
+def cycle_timeline(cycles):
+    """Compile push/pull cycles straight into a Timeline."""
+    events, duration = cycle_events(cycles)
+    return compile_timeline(events, duration)
+
+
+def run_timeline(timeline, label="timeline"):
+    """Play a timeline against absolute deadlines on the HAL clock.
+
+    Relays are released if playback is interrupted.
+
+    Returns:
+        dict: planned and actual duration, the latest switch, and every
+            switch point with its planned and actual offset
+    """
+    bank = get_relay_bank()
+    switches = []
+    origin = hal.monotonic()
+    try:
+        for offset, levels, labels in timeline.points:
+            remaining = origin + offset - hal.monotonic()
+            if remaining > 0:
+                hal.sleep(remaining)
+            bank.apply(levels)
+            actual = hal.monotonic() - origin
+            switches.append({"planned": offset, "actual": actual, "events": labels})
+            logging.debug(
+                f"{label} {offset:.3f}s (+{(actual - offset) * 1000:.1f}ms): {', '.join(labels)}"
+            )
+        remaining = origin + timeline.duration - hal.monotonic()
+        if remaining > 0:
+            hal.sleep(remaining)
+    except BaseException:
+        bank.apply(actuator_levels(main="off", left="off"))
+        raise
+
+    duration = hal.monotonic() - origin
+    max_lateness = max((s["actual"] - s["planned"] for s in switches), default=0.0)
+    logging.info(
+        f"{label}: {len(switches)} switch points in {duration:.2f}s "
+        f"(planned {timeline.duration:.2f}s, latest switch +{max_lateness * 1000:.1f}ms)"
+    )
+    return {
+        "planned_duration": timeline.duration,
+        "duration": duration,
+        "max_lateness": max_lateness,
+        "switches": switches,
+    }
@@ -1,7 +1,28 @@
-import RPi.GPIO as GPIO
-import time
+import os
+import json
 import math
+import time
 import logging
+import threading
+
+import hal
+import metrics
+from hal import GPIO
+from arbiter import CommandCancelled, get_arbiter
+from cache import LRUCache, quantize, dequantize
+from choreography import cycle_timeline, run_timeline, scale_cycles
+from history import record_delivery
+from motion import Axis, MotionProfile, plan_coordinated_move
+from positions import STATE_DIR, get_tracker
+from relay_bank import (  # Actuator helpers are re-exported for existing callers
+    ACT1_RELAY1, ACT1_RELAY2, ACT2_RELAY1, ACT2_RELAY2,
+    ACT3_RELAY1, ACT3_RELAY2, ACT4_RELAY1, ACT4_RELAY2, USED_PINS,
+    get_relay_bank, run_top_actuators_parallel, turn_off_top_actuators,
+    top_actuators_off_left, top_actuators_push, top_actuators_pull,
+    top_actuators_push_left, top_actuators_pull_left,
+)
+from scheduler import Phase, PhaseScheduler
+from stepper import run_pulse_train
 
 # Setup logging
 logging.basicConfig(
@@ -26,23 +47,7 @@ SERVO_PIN = 26          # Servo for package release
 STEP_PIN_FORK = 8       # Fork lift mechanism
 DIR_PIN_FORK = 25
 
-# Linear Actuator Relays
-ACT1_RELAY1 = 14    # PUSH
-ACT1_RELAY2 = 15    # PULL
-ACT2_RELAY1 = 18    # TOP LEFT actuator
-ACT2_RELAY2 = 17
-ACT3_RELAY1 = 27
-ACT3_RELAY2 = 22
-ACT4_RELAY1 = 10
-ACT4_RELAY2 = 9
-
-# List of used actuator GPIO pins
-USED_PINS = [
-    ACT1_RELAY1, ACT1_RELAY2,
-    ACT2_RELAY1, ACT2_RELAY2,
-    ACT3_RELAY1, ACT3_RELAY2,
-    ACT4_RELAY1, ACT4_RELAY2,
-]
+# Linear Actuator Relays: ACT*_RELAY* and USED_PINS, from relay_bank.py
 
 # ========== Motor Parameters ==========
 # Linear Rails
@@ -66,97 +71,170 @@ STEPS_PER_CM_FORK = STEPS_PER_REV_FORK / LEAD_SCREW_PITCH_FORK_CM
 
 # ========== Timing and Constants ==========
 PULSE_WIDTH = 0.0005
+STEP_INTERVAL = 2 * PULSE_WIDTH    # 1 kHz nominal step rate
 STANDARD_BUBBLE_WRAP_WIDTH_CM = 25.4
 SERVO_ACTIVATION_ANGLE = 120    # Degrees for package release
 
+# ========== Motion Profiles ==========
+# Moves start and stop at the old fixed rate (1 / STEP_INTERVAL), which the
+# motors start at without stalling, and ramp up to a cruise speed between.
+PROFILE_SHAPE = "s-curve"       # "s-curve", "trapezoid" or "fixed"
+STEP_HIGH_TIME = 0.00005        # STEP pulse width for profiled moves (s)
+
+# Per axis: max velocity (cm/s), acceleration (cm/s^2), jerk (cm/s^3)
+RAIL_PROFILE = MotionProfile(
+    6.0, 20.0, jerk=400.0, start_velocity=1 / (STEP_INTERVAL * STEPS_PER_CM_1)
+)
+FEEDER_PROFILE = MotionProfile(
+    12.0, 30.0, jerk=600.0, start_velocity=1 / (STEP_INTERVAL * STEPS_PER_CM_FEEDER)
+)
+FORK_PROFILE = MotionProfile(
+    5.0, 25.0, jerk=500.0, start_velocity=1 / (STEP_INTERVAL * STEPS_PER_CM_FORK)
+)
+
+# Stepper axes that move_axes() can drive, alone or together
+AXES = {
+    "rail_1": Axis("rail_1", STEP_PIN_1, DIR_PIN_1, STEPS_PER_CM_1, RAIL_PROFILE),
+    "rail_2": Axis("rail_2", STEP_PIN_2, DIR_PIN_2, STEPS_PER_CM_2, RAIL_PROFILE),
+    "feeder": Axis("feeder", STEP_PIN_FEED, DIR_PIN_FEED, STEPS_PER_CM_FEEDER, FEEDER_PROFILE),
+    "fork": Axis("fork", STEP_PIN_FORK, DIR_PIN_FORK, STEPS_PER_CM_FORK, FORK_PROFILE),
+}
+
+# ========== Rail Position Tracking ==========
+# Once the rails are homed (see emergency_stop.home_rails), their position
+# is tracked across packages: each delivery moves the rails only by the
+# difference to the new width, and with RAIL_LAZY_RETURN they stay open
+# after sealing instead of returning home.
+RAIL_AXES = ("rail_1", "rail_2")
+RAIL_LAZY_RETURN = True         # Skip the return stroke when rails are homed
+RAIL_WIDTH_TOLERANCE_CM = 0.2   # Rail moves shorter than this are skipped
+
+# ========== Motion Plan Cache ==========
+# Compiled moves (DIR levels and step schedule) are cached by exact step
+# counts, and whole delivery plans by wrap size quantized to
+# PLAN_RESOLUTION_CM plus the rails' starting position. Only the keys of
+# the delivery plans are saved, as JSON in PLAN_CACHE_FILE; app.py calls
+# load_plan_cache() at startup, before any motion, to recompile them. A
+# fingerprint of the motion configuration discards keys saved under other
+# settings.
+PLAN_CACHE_SIZE = 128
+PLAN_RESOLUTION_CM = 0.1
+PLAN_CACHE_FILE = os.path.join(STATE_DIR, "motion_plans.json")
+PLAN_CACHE_VERSION = 4
+
+plan_cache = LRUCache(PLAN_CACHE_SIZE)
+_plan_cache_saved_misses = 0    # plan_cache.misses when last saved
+
+
+# ========== Motor Control Functions ==========
+class CompiledMove:
+    """A move ready to replay: DIR pin levels, step schedule and the
+    position change of each axis."""
+
+    def __init__(self, targets, directions, train, deltas):
+        self.targets = targets
+        self.directions = directions
+        self.train = train
+        self.deltas = deltas
+
+
+def compile_move(targets, shape=None):
+    """Plan a coordinated move, reusing the cached plan for identical moves.
 
-# ========== Actuator Control Functions ==========
-def turn_off_top_actuators():
-    """Turn off all actuator relays."""
-    logging.info("Turning OFF all top actuators...")
-    for pin in USED_PINS:
-        GPIO.output(pin, GPIO.HIGH)
-    time.sleep(0.5)
-
-
-def top_actuators_off_left():
-    """Deactivate left actuator."""
-    logging.info("Deactivating top LEFT actuator...")
-    GPIO.output(ACT2_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT2_RELAY2, GPIO.HIGH)
-
-
-def top_actuators_pull():
-    """Activate pull motion on main actuators."""
-    logging.info("Pulling all top actuators...")
-    # ACT1
-    GPIO.output(ACT1_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT1_RELAY2, GPIO.LOW)
-    # ACT3
-    GPIO.output(ACT3_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT3_RELAY2, GPIO.LOW)
-    # ACT4
-    GPIO.output(ACT4_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT4_RELAY2, GPIO.LOW)
-
-
-def top_actuators_push():
-    """Activate push motion on main actuators."""
-    logging.info("Pushing all top actuators...")
-    # ACT1
-    GPIO.output(ACT1_RELAY1, GPIO.LOW)
-    GPIO.output(ACT1_RELAY2, GPIO.HIGH)
-    # ACT3
-    GPIO.output(ACT3_RELAY1, GPIO.LOW)
-    GPIO.output(ACT3_RELAY2, GPIO.HIGH)
-    # ACT4
-    GPIO.output(ACT4_RELAY1, GPIO.LOW)
-    GPIO.output(ACT4_RELAY2, GPIO.HIGH)
-
-
-def top_actuators_push_left():
-    """Activate left push."""
-    logging.info("Pushing top LEFT actuator...")
-    GPIO.output(ACT2_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT2_RELAY2, GPIO.LOW)
-
-
-def top_actuators_pull_left():
-    """Activate left pull."""
-    logging.info("Pulling top LEFT actuator...")
-    GPIO.output(ACT2_RELAY1, GPIO.LOW)
-    GPIO.output(ACT2_RELAY2, GPIO.HIGH)
-
-
-def run_top_actuators_parallel(main_func, left_func, main_duration, left_duration):
-    """Control parallel actuator operation.
-    
     Args:
-        main_func: Function to control main actuators
-        left_func: Function to control left actuator
-        main_duration: Duration for main actuators (seconds)
-        left_duration: Duration for left actuator (seconds)
+        targets: Iterable of (axis_name, distance_cm, direction), where
+            direction is 'forward' or 'backward'
+        shape: "s-curve", "trapezoid" or "fixed" (default PROFILE_SHAPE)
+
+    Returns:
+        CompiledMove: Plan for execute_move()
+
+    Raises:
+        ValueError: For an unknown axis name
     """
-    logging.info(
-        f"Running actuators: main({main_duration}s), left({left_duration}s)"
-    )
-    
-    main_func()
-    left_func()
-    time.sleep(min(main_duration, left_duration))
+    shape = shape or PROFILE_SHAPE
+    stepped = []
+    for name, distance_cm, direction in targets:
+        if name not in AXES:
+            raise ValueError(f"Unknown axis: {name}")
+        stepped.append((name, AXES[name].steps_for(distance_cm), direction))
+    stepped = tuple(stepped)
+
+    def compile_plan():
+        directions = {}
+        deltas = {}
+        moves = []
+        for name, steps, direction in stepped:
+            axis = AXES[name]
+            backward = direction == 'backward'
+            directions[axis.dir_pin] = GPIO.HIGH if backward else GPIO.LOW
+            deltas[name] = steps / axis.steps_per_cm * (-1 if backward else 1)
+            moves.append((axis, steps))
+        train = plan_coordinated_move(moves, STEP_HIGH_TIME, shape)
+        return CompiledMove(stepped, directions, train, deltas)
+
+    return plan_cache.get_or_compute(("move", shape, stepped), compile_plan)
+
+
+def execute_move(move, label="move", progress=None):
+    """Set DIR pins, play a compiled move and record the new positions.
 
-    if left_duration < main_duration:
-        top_actuators_off_left()
-        time.sleep(main_duration - left_duration)
-    elif left_duration > main_duration:
-        turn_off_top_actuators()
-        time.sleep(left_duration - main_duration)
+    Args:
+        move: CompiledMove to play
+        label: Name used when logging step timing
+        progress: Optional callback progress(steps_done, total)
+
+    Returns:
+        dict: Step timing result from the step backend
+    """
+    tracker = get_tracker()
+    for pin, level in move.directions.items():
+        GPIO.output(pin, level)
+    for name in move.deltas:
+        tracker.begin_move(name)
+    result = run_pulse_train(move.train, label=label, progress=progress)
+    for name, delta in move.deltas.items():
+        tracker.end_move(name, delta)
+    return result
 
-    turn_off_top_actuators()
-    logging.info("Parallel actuation complete")
+
+def run_axes(targets, label="move", shape=None):
+    """Move one or more axes together in a single merged step schedule.
+
+    Args:
+        targets: Iterable of (axis_name, distance_cm, direction)
+        label: Name used when logging step timing
+        shape: "s-curve", "trapezoid" or "fixed" (default PROFILE_SHAPE)
+
+    Returns:
+        dict: Step timing result from the step backend
+    """
+    return execute_move(compile_move(targets, shape), label=label)
+
+
+def move_axes(targets):
+    """Move several axes simultaneously, e.g. feed wrap while the rails open.
+
+    Args:
+        targets: Iterable of (axis_name, distance_cm, direction)
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        targets = list(targets)
+        logging.info(
+            "Moving axes: " + ", ".join(
+                f"{name} {distance}cm {direction}" for name, distance, direction in targets
+            )
+        )
+        run_axes(targets, label="+".join(name for name, _, _ in targets))
+        return True
+    except Exception as e:
+        logging.error(f"Axis movement error: {str(e)}")
+        return False
 
 
-# ========== Motor Control Functions ==========
 def set_servo_angle(angle):
     """Control servo motor position (0-180 degrees).
     
@@ -170,7 +248,7 @@ def set_servo_angle(angle):
         duty_cycle = (angle / 18) + 2  # Convert angle to duty cycle
         pwm = GPIO.PWM(SERVO_PIN, 50)  # 50 Hz PWM
         pwm.start(duty_cycle)
-        time.sleep(0.5)  # Allow movement time
+        hal.sleep(0.5)  # Allow movement time
         pwm.stop()
         logging.info(f"Servo moved to {angle}°")
         return True
@@ -190,17 +268,8 @@ def move_fork(distance_cm, direction):
         bool: True if successful, False otherwise
     """
     try:
-        steps = int(math.ceil(distance_cm * STEPS_PER_CM_FORK))
-        GPIO.output(DIR_PIN_FORK, GPIO.HIGH if direction == 'backward' else GPIO.LOW)
-        
         logging.info(f"Fork moving {distance_cm}cm {direction}")
-        
-        for _ in range(steps):
-            GPIO.output(STEP_PIN_FORK, GPIO.HIGH)
-            time.sleep(PULSE_WIDTH)
-            GPIO.output(STEP_PIN_FORK, GPIO.LOW)
-            time.sleep(PULSE_WIDTH)
-            
+        run_axes([("fork", distance_cm, direction)], label="fork")
         return True
     except Exception as e:
         logging.error(f"Fork error: {str(e)}")
@@ -218,17 +287,8 @@ def move_rail_1(distance_cm, direction):
         bool: True if successful, False otherwise
     """
     try:
-        steps = int(math.ceil(distance_cm * STEPS_PER_CM_1))
-        GPIO.output(DIR_PIN_1, GPIO.HIGH if direction == 'backward' else GPIO.LOW)
-        
         logging.info(f"Rail 1 moving {distance_cm}cm {direction}")
-        
-        for _ in range(steps):
-            GPIO.output(STEP_PIN_1, GPIO.HIGH)
-            time.sleep(PULSE_WIDTH)
-            GPIO.output(STEP_PIN_1, GPIO.LOW)
-            time.sleep(PULSE_WIDTH)
-            
+        run_axes([("rail_1", distance_cm, direction)], label="rail 1")
         return True
     except Exception as e:
         logging.error(f"Rail 1 error: {str(e)}")
@@ -248,30 +308,16 @@ def move_both_rails(distance_1, direction_1, distance_2, direction_2):
         bool: True if successful, False otherwise
     """
     try:
-        steps_1 = int(math.ceil(distance_1 * STEPS_PER_CM_1))
-        steps_2 = int(math.ceil(distance_2 * STEPS_PER_CM_2))
-        max_steps = max(steps_1, steps_2)
-
-        GPIO.output(DIR_PIN_1, GPIO.HIGH if direction_1 == 'backward' else GPIO.LOW)
-        GPIO.output(DIR_PIN_2, GPIO.HIGH if direction_2 == 'backward' else GPIO.LOW)
-
         logging.info(
             f"Moving rails:\n"
             f"Rail 1: {distance_1}cm {direction_1}\n"
             f"Rail 2: {distance_2}cm {direction_2}"
         )
 
-        for i in range(max_steps):
-            if i < steps_1:
-                GPIO.output(STEP_PIN_1, GPIO.HIGH)
-            if i < steps_2:
-                GPIO.output(STEP_PIN_2, GPIO.HIGH)
-            
-            time.sleep(PULSE_WIDTH)
-            GPIO.output(STEP_PIN_1, GPIO.LOW)
-            GPIO.output(STEP_PIN_2, GPIO.LOW)
-            time.sleep(PULSE_WIDTH)
-
+        run_axes(
+            [("rail_1", distance_1, direction_1), ("rail_2", distance_2, direction_2)],
+            label="rails"
+        )
         return True
     except Exception as e:
         logging.error(f"Rail movement error: {str(e)}")
@@ -289,34 +335,453 @@ def move_feeder(length_cm, direction):
         bool: True if successful, False otherwise
     """
     try:
-        steps = int(math.ceil(length_cm * STEPS_PER_CM_FEEDER))
-        GPIO.output(DIR_PIN_FEED, GPIO.HIGH if direction == 'backward' else GPIO.LOW)
-        
         logging.info(f"Feeding {length_cm}cm of wrap {direction}")
-        
-        for _ in range(steps):
-            GPIO.output(STEP_PIN_FEED, GPIO.HIGH)
-            time.sleep(PULSE_WIDTH)
-            GPIO.output(STEP_PIN_FEED, GPIO.LOW)
-            time.sleep(PULSE_WIDTH)
-            
+        run_axes([("feeder", length_cm, direction)], label="feeder")
         return True
     except Exception as e:
         logging.error(f"Feeder error: {str(e)}")
         return False
 
 
+# ========== Rail Positioning ==========
+def rail_moves_to(target_cm, positions=None):
+    """Return move_axes targets taking both homed rails to target_cm.
+
+    Rails already within RAIL_WIDTH_TOLERANCE_CM of the target are left
+    where they are.
+
+    Args:
+        target_cm: Rail position to reach, in cm from home
+        positions: Optional {axis_name: cm} to plan from instead of the
+            tracked positions
+    """
+    tracker = get_tracker()
+    targets = []
+    for name in RAIL_AXES:
+        current = positions[name] if positions else tracker.position(name)
+        delta = target_cm - current
+        if abs(delta) > RAIL_WIDTH_TOLERANCE_CM:
+            targets.append((name, abs(delta), 'forward' if delta > 0 else 'backward'))
+    return targets
+
+
+def park_rails():
+    """Return homed rails to their home position.
+
+    Returns:
+        bool: True if the rails are home, False if they are not homed or
+            the move failed
+    """
+    if not get_tracker().is_homed(*RAIL_AXES):
+        logging.warning("Rails are not homed; cannot park them")
+        return False
+    targets = rail_moves_to(0.0)
+    return move_axes(targets) if targets else True
+
+
+def rail_status():
+    """Return tracked rail positions and the rail travel saved so far."""
+    stats = get_tracker().stats()
+    rails = {name: stats.get(name) for name in RAIL_AXES}
+    return {
+        "homed": get_tracker().is_homed(*RAIL_AXES),
+        "axes": rails,
+        "travel_saved_cm": sum(axis["saved"] for axis in rails.values() if axis),
+    }
+
+
 # ========== Main Delivery Sequence ==========
-def run_delivery(optimal_width_cm, optimal_length_cm):
+# Delivery runs as a DAG of phases (see scheduler.py). Each phase names the
+# hardware it needs; phases with no dependency or resource in common run
+# concurrently. The wrap feed and rail opening are one coordinated move
+# (move_axes) because a single step backend plays one pulse train at a time.
+#
+#   release -> fork_jog -> settle ----------.
+#                      \-> feed_and_open ---+-> seal -> rails_back
+RELEASE_SETTLE_TIME = 3     # Wait after the servo drops the package (s)
+PACKAGE_SETTLE_TIME = 5     # Wait before sealing after the fork jog (s)
+
+FORK_JOGS = ((0.4, 1), (0.8, 1), (1.9, 0.3))    # (travel cm, dwell s)
+
+# Top actuator sealing timeline: (motion, main s, left s, pause after s)
+SEALING_CYCLES = (
+    ("push", 1, 0.8, 4),
+    ("pull", 0.5, 0.2, 0.5),
+    ("push", 0.5, 0.2, 4),
+    ("pull", 0.5, 0.2, 0.5),
+    ("push", 0.5, 0.2, 4),
+    ("pull", 2, 0.8, 2),
+)
+
+# Size-adaptive sealing. Smaller packages need less actuator travel and
+# less time for the wrap to set, so their cycles are scaled down. Rows are
+# (class, max package height cm, max wrap length cm, on-time scale, pause
+# scale); the first row the package fits in is used. Scales are capped at
+# 1, so SEALING_CYCLES stays the upper bound, and a package without
+# measured dimensions gets the full cycle.
+SEALING_CLASSES = (
+    ("small", 6, 45, 0.6, 0.5),
+    ("medium", 12, 70, 0.8, 0.75),
+    ("large", math.inf, math.inf, 1.0, 1.0),
+)
+SEALING_MIN_ON_TIME = 0.2   # Shortest relay on-time a scaled cycle may use (s)
+SEALING_MIN_PAUSE = 0.5     # Shortest relay-off gap a scaled cycle may use before
+                            # the next (reversing) cycle (s)
+
+# Sealing time per size class: {class: {"count", "total", "mean", "last"}}
+sealing_stats = {}
+
+# Result of the last run_delivery() schedule (phase timings, critical path)
+last_report = None
+
+# ========== Metrics ==========
+deliveries_total = metrics.counter(
+    "packaging_deliveries_total", "run_delivery() runs by outcome", ["result"]
+)
+delivery_seconds = metrics.histogram(
+    "packaging_delivery_seconds", "Whole delivery duration",
+    buckets=(10, 15, 20, 25, 30, 40, 60, 90, 120)
+)
+delivery_phase_seconds = metrics.histogram(
+    "packaging_delivery_phase_seconds", "Delivery phase duration", ["phase"]
+)
+delivery_in_progress = metrics.gauge(
+    "packaging_delivery_in_progress", "1 while a delivery is running"
+)
+wrap_length_cm_total = metrics.counter(
+    "packaging_wrap_length_cm_total", "Bubble wrap length used by successful deliveries"
+)
+
+
+# ========== Delivery Plans ==========
+def plan_fingerprint():
+    """Return a string identifying the settings compiled plans depend on."""
+    axes = [
+        (name, axis.step_pin, axis.dir_pin, axis.steps_per_cm, sorted(vars(axis.profile).items()))
+        for name, axis in sorted(AXES.items())
+    ]
+    return repr((
+        PLAN_CACHE_VERSION, STEP_HIGH_TIME, axes, FORK_JOGS,
+        SEALING_CYCLES, SEALING_CLASSES, SEALING_MIN_ON_TIME, SEALING_MIN_PAUSE
+    ))
+
+
+def save_plan_cache(path=PLAN_CACHE_FILE):
+    """Save the keys of the cached delivery plans as JSON (write then rename).
+
+    Step schedules are not saved; load_plan_cache() recompiles them.
+    """
+    global _plan_cache_saved_misses
+    _plan_cache_saved_misses = plan_cache.misses
+    deliveries = [list(key[1:]) for key, _ in plan_cache.items() if key[0] == "delivery"]
+    temp_path = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(temp_path, "w") as f:
+            json.dump({"fingerprint": plan_fingerprint(), "deliveries": deliveries}, f)
+        os.replace(temp_path, path)
+        logging.debug(f"Saved {len(deliveries)} delivery plan keys to {path}")
+    except OSError as e:
+        logging.warning(f"Could not save motion plans: {e}")
+
+
+def load_plan_cache(path=PLAN_CACHE_FILE):
+    """Recompile the delivery plans saved by save_plan_cache() into plan_cache.
+
+    Returns:
+        int: Number of plans compiled (0 if the file is missing or stale)
+    """
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable motion plan file {path}: {e}")
+        return 0
+    if not isinstance(saved, dict) or saved.get("fingerprint") != plan_fingerprint():
+        logging.info("Motion settings changed; discarding saved motion plans")
+        return 0
+
+    classes = {row[0]: row for row in SEALING_CLASSES}
+    started = time.perf_counter()
+    loaded = 0
+    for entry in saved.get("deliveries", []):
+        try:
+            size_key, start_key, class_name, shape = entry
+            size_key = tuple(int(step) for step in size_key)
+            if start_key is not None:
+                start_key = tuple(int(step) for step in start_key)
+        except (TypeError, ValueError):
+            continue
+        if shape != PROFILE_SHAPE or class_name not in classes:
+            continue
+        key = ("delivery", size_key, start_key, class_name, shape)
+        plan_cache.get_or_compute(
+            key, lambda: _compile_delivery_plan(size_key, start_key, classes[class_name])
+        )
+        loaded += 1
+    logging.info(
+        f"Recompiled {loaded} motion plans from {path} "
+        f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+    )
+    return loaded
+
+
+def sealing_class(wrap_length_cm, object_dimensions=None):
+    """Return the SEALING_CLASSES row for a package.
+
+    Args:
+        wrap_length_cm: Bubble wrap length cut for the package
+        object_dimensions: Measured (length, width, height) in cm, or None
+    """
+    if object_dimensions is None:
+        return SEALING_CLASSES[-1]
+    height = object_dimensions[2]
+    for row in SEALING_CLASSES:
+        _, max_height, max_length, _, _ = row
+        if height <= max_height and wrap_length_cm <= max_length:
+            return row
+    return SEALING_CLASSES[-1]
+
+
+def sealing_cycles_for(size_class):
+    """Scale SEALING_CYCLES for a SEALING_CLASSES row."""
+    _, _, _, on_scale, dwell_scale = size_class
+    return scale_cycles(
+        SEALING_CYCLES, on_scale, dwell_scale, SEALING_MIN_ON_TIME, SEALING_MIN_PAUSE
+    )
+
+
+def record_sealing_time(name, seconds):
+    """Add one sealing run to sealing_stats and log the class average."""
+    stats = sealing_stats.setdefault(name, {"count": 0, "total": 0.0})
+    stats["count"] += 1
+    stats["total"] += seconds
+    stats["mean"] = stats["total"] / stats["count"]
+    stats["last"] = seconds
+    full = cycle_timeline(SEALING_CYCLES).duration
+    logging.info(
+        f"Sealing ({name}): {seconds:.1f}s, mean {stats['mean']:.1f}s over "
+        f"{stats['count']} package(s) vs {full:.1f}s full cycle"
+    )
+
+
+def compile_delivery(optimal_width_cm, optimal_length_cm, object_dimensions=None):
+    """Return the compiled motion plan for a wrap size, from cache if possible.
+
+    The key is the wrap size quantized to PLAN_RESOLUTION_CM together with
+    the quantized rail start position (None while the rails are unhomed),
+    since homed rails only move the difference to the new width, and the
+    package's sealing class.
+
+    Returns:
+        dict: expansion, fork jog moves, feed/rail move and rail targets,
+            rail return move (unhomed rails only), sealing class and
+            sealing timeline
+    """
+    tracker = get_tracker()
+    size_key = quantize((optimal_width_cm, optimal_length_cm), PLAN_RESOLUTION_CM)
+    start_key = None
+    if tracker.is_homed(*RAIL_AXES):
+        start_key = quantize([tracker.position(name) for name in RAIL_AXES], PLAN_RESOLUTION_CM)
+    size_class = sealing_class(optimal_length_cm, object_dimensions)
+    key = ("delivery", size_key, start_key, size_class[0], PROFILE_SHAPE)
+    return plan_cache.get_or_compute(
+        key, lambda: _compile_delivery_plan(size_key, start_key, size_class)
+    )
+
+
+def _compile_delivery_plan(size_key, start_key, size_class):
+    """Compile a delivery plan from its cache key; see compile_delivery()."""
+    started = time.perf_counter()
+    width, length = dequantize(size_key, PLAN_RESOLUTION_CM)
+    expansion = STANDARD_BUBBLE_WRAP_WIDTH_CM - width
+
+    if start_key is not None:
+        starts = dict(zip(RAIL_AXES, dequantize(start_key, PLAN_RESOLUTION_CM)))
+        rail_targets = rail_moves_to(expansion, starts)
+        rails_back = None   # Lazy return, or park_rails() from the live position
+    else:
+        rail_targets = [(name, expansion, "forward") for name in RAIL_AXES]
+        rails_back = compile_move([(name, expansion, "backward") for name in RAIL_AXES])
+
+    plan = {
+        "expansion": expansion,
+        "fork_jog": [
+            (compile_move([("fork", travel, 'forward')]), dwell,
+             compile_move([("fork", travel, 'backward')]))
+            for travel, dwell in FORK_JOGS
+        ],
+        "feed_and_open": compile_move([("feeder", length, "forward")] + rail_targets),
+        "rail_targets": rail_targets,
+        "rails_back": rails_back,
+        "sealing_class": size_class[0],
+        "sealing": cycle_timeline(sealing_cycles_for(size_class)),
+    }
+    logging.debug(
+        f"Compiled delivery plan {size_key}, {start_key}, {size_class[0]} "
+        f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+    )
+    return plan
+
+
+def release_package():
+    """Drop the package with the release servo and let it come to rest."""
+    logging.info("-- INITIATING PACKAGE HANDLING --")
+    if not set_servo_angle(SERVO_ACTIVATION_ANGLE):
+        raise RuntimeError("Package release failed")
+    hal.sleep(RELEASE_SETTLE_TIME)
+
+
+def jog_fork(plan):
+    """Jog the fork in and out three times with increasing travel."""
+    for extend, dwell, retract in plan["fork_jog"]:
+        try:
+            execute_move(extend, label="fork")
+        except Exception as e:
+            raise RuntimeError(f"Fork extension failed: {e}")
+        hal.sleep(dwell)
+        try:
+            execute_move(retract, label="fork")
+        except Exception as e:
+            raise RuntimeError(f"Fork retraction failed: {e}")
+
+
+def feed_and_open_rails(plan, progress=None):
+    """Feed wrap while sliding both rails out, as one coordinated move.
+
+    Homed rails move only the difference from where the last package left
+    them; otherwise they open by the full expansion from home. progress
+    receives (steps_done, total) from the step backend.
+    """
+    logging.info("-- MATERIAL FEEDING AND WIDTH ADJUSTMENT PHASE --")
+    tracker = get_tracker()
+    homed = plan["rails_back"] is None
+    try:
+        execute_move(plan["feed_and_open"], label="feed+rails", progress=progress)
+    except Exception as e:
+        raise RuntimeError(f"Wrap feeding or rail adjustment failed: {e}")
+
+    if homed:
+        moved = {name: distance for name, distance, _ in plan["rail_targets"]}
+        for name in RAIL_AXES:
+            tracker.add_saved(name, plan["expansion"] - moved.get(name, 0.0))
+
+
+def run_sealing(timeline):
+    """Play the compiled top actuator push/pull timeline that seals the wrap.
+
+    Returns:
+        dict: Planned vs actual timing of every relay switch
+    """
+    logging.info("-- LINEAR ACTUATOR OPERATION --")
+    return run_timeline(timeline, label="sealing")
+
+
+def close_rails(plan):
+    """Slide both rails back to their starting position.
+
+    Homed rails are left open when RAIL_LAZY_RETURN is set, since the next
+    package only needs the difference from this width.
+    """
+    logging.info("-- WIDTH ADJUSTMENT PHASE --")
+    if plan["rails_back"] is not None:
+        try:
+            execute_move(plan["rails_back"], label="rails")
+        except Exception as e:
+            raise RuntimeError(f"Rail adjustment failed: {e}")
+    elif RAIL_LAZY_RETURN:
+        logging.info(f"Leaving rails open at {plan['expansion']:.1f}cm for the next package")
+        for name in RAIL_AXES:
+            get_tracker().add_saved(name, plan["expansion"])
+    elif not park_rails():
+        raise RuntimeError("Rail adjustment failed")
+
+
+def delivery_phases(plan, results=None, step_progress=None):
+    """Build the delivery DAG for one compiled plan.
+
+    Args:
+        plan: Plan from compile_delivery()
+        results: Optional dict that receives the sealing timing report
+        step_progress: Optional progress(steps_done, total) callback for
+            the wrap feed move
+
+    Returns:
+        list: Phase objects for PhaseScheduler
+    """
+    results = {} if results is None else results
+
+    def seal():
+        results["sealing"] = run_sealing(plan["sealing"])
+
+    return [
+        Phase("release", release_package, resources=["servo"]),
+        Phase("fork_jog", lambda: jog_fork(plan), after=["release"], resources=["fork"]),
+        Phase("settle", lambda: hal.sleep(PACKAGE_SETTLE_TIME), after=["fork_jog"]),
+        Phase(
+            "feed_and_open", lambda: feed_and_open_rails(plan, step_progress),
+            after=["fork_jog"], resources=["feeder", "rail_1", "rail_2"]
+        ),
+        Phase(
+            "seal", seal,
+            after=["settle", "feed_and_open"], resources=["relays"]
+        ),
+        Phase(
+            "rails_back", lambda: close_rails(plan),
+            after=["seal"], resources=["rail_1", "rail_2"]
+        ),
+    ]
+
+
+class DeliveryProgress:
+    """Turns phase and step callbacks into progress(stage, fraction).
+
+    The fraction is the share of phases finished, plus the share of the
+    wrap feed move done while it runs.
+    """
+
+    def __init__(self, progress, phase_count):
+        self.progress = progress
+        self.phase_count = phase_count
+        self.finished = set()
+        self._lock = threading.Lock()
+
+    def report(self, stage, partial=0.0):
+        with self._lock:
+            fraction = (len(self.finished) + partial) / self.phase_count
+        self.progress(stage, fraction)
+
+    def on_phase(self, name, state):
+        if state == "finished":
+            with self._lock:
+                self.finished.add(name)
+        self.report(name)
+
+    def on_steps(self, done, total):
+        self.report("feed_and_open", done / total if total else 1.0)
+
+
+def run_delivery(optimal_width_cm, optimal_length_cm, object_dimensions=None, progress=None):
     """Execute full delivery sequence with actuator integration.
     
     Args:
         optimal_width_cm: Width of package in cm
         optimal_length_cm: Length of package in cm
+        object_dimensions: Measured (length, width, height) in cm, used to
+            shorten sealing for small packages; None seals with the full cycle
+        progress: Optional callback progress(stage, fraction) with the
+            phase that started or finished and the overall fraction done
         
     Returns:
         bool: True if successful, False otherwise
     """
+    global last_report
+    start = time.perf_counter()
+    success = False
+    report = None
+    delivery_in_progress.set(1)
     try:
         # Validate inputs
         if not isinstance(optimal_width_cm, (int, float)) or not isinstance(
@@ -330,7 +795,6 @@ def run_delivery(optimal_width_cm, optimal_length_cm):
                 f"Width {optimal_width_cm}cm exceeds standard "
                 f"{STANDARD_BUBBLE_WRAP_WIDTH_CM}cm"
             )
-        half_expansion = required_expansion
 
         # Initialize GPIO
         GPIO.setmode(GPIO.BCM)
@@ -343,66 +807,40 @@ def run_delivery(optimal_width_cm, optimal_length_cm):
         GPIO.setup(all_pins, GPIO.OUT)
         
         # Initialize relays to safe state
-        for pin in USED_PINS:
-            GPIO.output(pin, GPIO.HIGH)
-
-        # Existing package handling sequence
-        logging.info("-- INITIATING PACKAGE HANDLING --")
-        if not set_servo_angle(SERVO_ACTIVATION_ANGLE):
-            raise RuntimeError("Package release failed")
-            
-        # Modified fork movement sequence
-        time.sleep(3)
-        if not move_fork(0.4, 'forward'):
-            raise RuntimeError("Fork extension failed")
-        time.sleep(1)
-        if not move_fork(0.4, 'backward'):
-            raise RuntimeError("Fork retraction failed")
-
-        if not move_fork(0.8, 'forward'):
-            raise RuntimeError("Fork extension failed")
-        time.sleep(1)
-        if not move_fork(0.8, 'backward'):
-            raise RuntimeError("Fork retraction failed")
-            
-        if not move_fork(1.9, 'forward'):
-            raise RuntimeError("Fork extension failed")
-        time.sleep(0.3)
-        if not move_fork(1.9, 'backward'):
-            raise RuntimeError("Fork retraction failed")
-
-        # Material feeding
-        time.sleep(5)
-        logging.info("-- MATERIAL FEEDING PHASE --")
-        if not move_feeder(optimal_length_cm, "forward"):
-            raise RuntimeError("Wrap feeding failed")
-            
-        # Slide rail forward
-        logging.info("-- WIDTH ADJUSTMENT PHASE --")
-        if not move_both_rails(half_expansion, 'forward', half_expansion, 'forward'):
-            raise RuntimeError("Rail adjustment failed")
-
-        # New actuator sequence
-        logging.info("-- LINEAR ACTUATOR OPERATION --")
-        run_top_actuators_parallel(top_actuators_push, top_actuators_push_left, 1, 0.8)
-        time.sleep(4)
-        run_top_actuators_parallel(top_actuators_pull, top_actuators_pull_left, 0.5, 0.2)
-        time.sleep(0.5)
-        run_top_actuators_parallel(top_actuators_push, top_actuators_push_left, 0.5, 0.2)
-        time.sleep(4)
-        run_top_actuators_parallel(top_actuators_pull, top_actuators_pull_left, 0.5, 0.2)
-        time.sleep(0.5)
-        run_top_actuators_parallel(top_actuators_push, top_actuators_push_left, 0.5, 0.2)
-        time.sleep(4)
-        run_top_actuators_parallel(top_actuators_pull, top_actuators_pull_left, 2, 0.8)
-        time.sleep(2)
-
-        # Slide rail backward
-        logging.info("-- WIDTH ADJUSTMENT PHASE --")
-        if not move_both_rails(half_expansion, 'backward', half_expansion, 'backward'):
-            raise RuntimeError("Rail adjustment failed")
+        relays = get_relay_bank()
+        relays.reset()
+
+        plan = compile_delivery(optimal_width_cm, optimal_length_cm, object_dimensions)
+        results = {}
+        phases = delivery_phases(plan, results)
+        on_phase = None
+        if progress:
+            reporter = DeliveryProgress(progress, len(phases))
+            reporter.report("planned")
+            phases = delivery_phases(plan, results, reporter.on_steps)
+            on_phase = reporter.on_phase
+        scheduler = PhaseScheduler(phases, on_phase=on_phase)
+        last_report = scheduler.run()
+        last_report["sealing"] = results.get("sealing")
+        last_report["sealing_class"] = plan["sealing_class"]
+        record_sealing_time(plan["sealing_class"], last_report["phases"]["seal"]["duration"])
+        last_report["plan_cache"] = plan_cache.stats()
+        last_report["relays"] = relays.stats()
+        for name, phase in last_report["phases"].items():
+            delivery_phase_seconds.observe(phase["duration"], phase=name)
+        if plan_cache.misses != _plan_cache_saved_misses:
+            save_plan_cache()   # New plans were compiled since the last save
+        logging.info(
+            f"Delivery took {last_report['total']:.1f}s "
+            f"({last_report['overlap_saved']:.1f}s saved by overlapping phases). "
+            f"Critical path: {' -> '.join(last_report['critical_path'])}"
+        )
 
         logging.info("COMPLETE: Full delivery sequence successful")
+        if progress:
+            progress("complete", 1.0)
+        success = True
+        report = last_report
         return True
         
     except Exception as e:
@@ -410,4 +848,112 @@ def run_delivery(optimal_width_cm, optimal_length_cm):
         return False
     finally:
         GPIO.cleanup()
-        logging.info("System cleanup completed")
\ No newline at end of file
+        get_relay_bank().invalidate()
+        logging.info("System cleanup completed")
+        duration = time.perf_counter() - start
+        record_delivery(
+            optimal_width_cm, optimal_length_cm, object_dimensions, success,
+            duration, report
+        )
+        deliveries_total.inc(result="success" if success else "failed")
+        delivery_in_progress.set(0)
+        if success:
+            delivery_seconds.observe(duration)
+            wrap_length_cm_total.inc(optimal_length_cm)
+
+
+# ========== Benchmark ==========
+def benchmark_motion_profiles(lengths_cm=(0.5, 2, 5, 10, 20, 40)):
+    """Report planned move time per profile shape and the time saved.
+
+    Returns:
+        dict: {axis: {length: {shape: seconds, "<shape>_plan_ms",
+            "saved_s", "saved_pct"}}}, saving is S-curve vs the fixed rate
+    """
+    axes = {
+        "rails": (RAIL_PROFILE, STEPS_PER_CM_1),
+        "feeder": (FEEDER_PROFILE, STEPS_PER_CM_FEEDER),
+        "fork": (FORK_PROFILE, STEPS_PER_CM_FORK),
+    }
+    results = {}
+    for axis, (profile, steps_per_cm) in axes.items():
+        results[axis] = {}
+        for length in lengths_cm:
+            steps = int(math.ceil(length * steps_per_cm))
+            row = {}
+            for shape in ("fixed", "trapezoid", "s-curve"):
+                start = time.perf_counter()
+                row[shape] = float(profile.step_intervals(steps, steps_per_cm, shape).sum())
+                row[f"{shape}_plan_ms"] = (time.perf_counter() - start) * 1000
+            row["saved_s"] = row["fixed"] - row["s-curve"]
+            row["saved_pct"] = 100 * row["saved_s"] / row["fixed"] if row["fixed"] else 0.0
+            results[axis][length] = row
+    return results
+
+
+def benchmark_estop_latency(width_cm=20.0, length_cm=40.0, lead_time=0.5):
+    """Time from an /emergency-stop request to the delivery's last STEP edge.
+
+    Starts a delivery through the arbiter, posts /emergency-stop through
+    the Flask test client once the wrap feed move has been stepping for
+    lead_time seconds, and reads the STEP edges from a RecordingBackend
+    trace. Needs a real-time clock: the RPi backend, or the simulated HAL
+    with PACKAGING_HAL_TIME_SCALE set. STEP edges played by the motion
+    executor process are not in this process' trace, so run it without
+    PACKAGING_MOTION_PROCESS.
+    """
+    import app
+
+    step_pins = {axis.step_pin for axis in AXES.values()}
+    recorder = hal.RecordingBackend(hal.get_backend())
+    previous = hal.set_backend(recorder)
+    arbiter = get_arbiter()
+    outcome = {}
+
+    def deliver():
+        try:
+            outcome["result"] = arbiter.run("delivery", run_delivery, width_cm, length_cm)
+        except CommandCancelled as e:
+            outcome["result"] = f"cancelled: {e}"
+
+    try:
+        plan = compile_delivery(width_cm, length_cm)
+        worker = threading.Thread(target=deliver)
+        worker.start()
+
+        def feed_edges():
+            return [e for e in list(recorder.events)
+                    if e["op"] == "output" and e["pin"] == STEP_PIN_FEED and e["value"]]
+
+        while not feed_edges() and worker.is_alive():
+            recorder.inner.sleep(0.01)
+        feed_start = feed_edges()[0]["t"] if feed_edges() else None
+        recorder.inner.sleep(lead_time)
+
+        requested = recorder.monotonic()
+        response = app.app.test_client().post("/emergency-stop")
+        worker.join()
+    finally:
+        hal.set_backend(previous)
+
+    events = recorder.events
+    delivery_end = next(
+        (e["t"] for e in events if e["op"] == "cleanup" and e["t"] >= requested), None
+    )
+    edges = [
+        e["t"] for e in events
+        if e["op"] == "output" and e["pin"] in step_pins
+        and (delivery_end is None or e["t"] <= delivery_end)
+    ]
+    last_edge = max(edges) if edges else None
+    move_end = None
+    if feed_start is not None:
+        move_end = feed_start + plan["feed_and_open"].train.duration
+    return {
+        "http_status": response.status_code,
+        "delivery": outcome.get("result"),
+        "estop_latency": (last_edge - requested) if last_edge else None,
+        "delivery_stopped_after": (delivery_end - requested) if delivery_end else None,
+        "unpreempted_move_would_end_after": (move_end - requested) if move_end else None,
+        "arbiter": arbiter.stats(),
+    }
@@ -1,8 +1,20 @@
-import RPi.GPIO as GPIO
-import time
 import math
+import time
 import logging
 
+import hal
+import metrics
+from hal import GPIO
+from choreography import cycle_timeline, run_timeline
+from positions import get_tracker
+from relay_bank import (  # Actuator helpers are re-exported for existing callers
+    ACT1_RELAY1, ACT1_RELAY2, ACT2_RELAY1, ACT2_RELAY2,
+    ACT3_RELAY1, ACT3_RELAY2, ACT4_RELAY1, ACT4_RELAY2, USED_PINS,
+    get_relay_bank, run_top_actuators_parallel, turn_off_top_actuators,
+    top_actuators_off_left, top_actuators_pull, top_actuators_pull_left,
+)
+from stepper import build_step_train, run_pulse_train
+
 # Setup logging
 logging.basicConfig(
     level=logging.DEBUG,
@@ -21,23 +33,7 @@ DIR_PIN_2 = 21
 STEP_PIN_FORK = 8       # Fork lift mechanism
 DIR_PIN_FORK = 25
 
-# Linear Actuator Relays
-ACT1_RELAY1 = 14    # PUSH
-ACT1_RELAY2 = 15    # PULL
-ACT2_RELAY1 = 18    # TOP LEFT actuator
-ACT2_RELAY2 = 17
-ACT3_RELAY1 = 27
-ACT3_RELAY2 = 22
-ACT4_RELAY1 = 10
-ACT4_RELAY2 = 9
-
-# List of used actuator GPIO pins
-USED_PINS = [
-    ACT1_RELAY1, ACT1_RELAY2,
-    ACT2_RELAY1, ACT2_RELAY2,
-    ACT3_RELAY1, ACT3_RELAY2,
-    ACT4_RELAY1, ACT4_RELAY2,
-]
+# Linear Actuator Relays: ACT*_RELAY* and USED_PINS, from relay_bank.py
 
 # ========== Motor Parameters ==========
 # Linear Rails
@@ -56,67 +52,27 @@ STEPS_PER_CM_FORK = STEPS_PER_REV_FORK / LEAD_SCREW_PITCH_FORK_CM
 
 # ========== Timing and Constants ==========
 PULSE_WIDTH = 0.0005
+STEP_INTERVAL = 2 * PULSE_WIDTH
 
-# ========== Actuator Control Functions ==========
-
-
-def turn_off_top_actuators():
-    """Turn off all actuator relays."""
-    logging.info("Turning OFF all top actuators...")
-    for pin in USED_PINS:
-        GPIO.output(pin, GPIO.HIGH)
-    time.sleep(0.5)
-
-
-def top_actuators_off_left():
-    """Deactivate left actuator."""
-    logging.info("Deactivating top LEFT actuator...")
-    GPIO.output(ACT2_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT2_RELAY2, GPIO.HIGH)
+# ========== Rail Homing ==========
+RAIL_AXES = ("rail_1", "rail_2")    # Names used by the position tracker
+HOMING_BACKOFF_CM = 15              # Drive back past the end stops
+HOMING_FORWARD_CM = 6               # Then forward to the working home
 
+# Actuator reset: (motion, main s, left s, pause after s)
+ACTUATOR_RESET_CYCLES = (("pull", 1, 0.8, 0),)
 
-def top_actuators_pull():
-    """Activate pull motion on main actuators."""
-    logging.info("Pulling all top actuators...")
-    # ACT1
-    GPIO.output(ACT1_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT1_RELAY2, GPIO.LOW)
-    # ACT3
-    GPIO.output(ACT3_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT3_RELAY2, GPIO.LOW)
-    # ACT4
-    GPIO.output(ACT4_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT4_RELAY2, GPIO.LOW)
-
-
-def top_actuators_pull_left():
-    """Activate left pull."""
-    logging.info("Pulling top LEFT actuator...")
-    GPIO.output(ACT2_RELAY1, GPIO.LOW)
-    GPIO.output(ACT2_RELAY2, GPIO.HIGH)
-
-
-def run_top_actuators_parallel(main_func, left_func, main_duration, left_duration):
-    """Control parallel actuator operation."""
-    logging.info(
-        f"Running actuators: main({main_duration}s), left({left_duration}s)"
-    )
-
-    main_func()
-    left_func()
-    time.sleep(min(main_duration, left_duration))
-
-    if left_duration < main_duration:
-        top_actuators_off_left()
-        time.sleep(main_duration - left_duration)
-    elif left_duration > main_duration:
-        turn_off_top_actuators()
-        time.sleep(left_duration - main_duration)
-
-    turn_off_top_actuators()
-    logging.info("Parallel actuation complete")
 
+# ========== Metrics ==========
+emergency_stops_total = metrics.counter(
+    "packaging_emergency_stops_total", "Emergency stop sequences by outcome", ["result"]
+)
+emergency_stop_seconds = metrics.histogram(
+    "packaging_emergency_stop_seconds", "Time from emergency stop to hardware reset",
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120)
+)
 
+# ========== Motor Control Functions ==========
 def move_fork(distance_cm, direction):
     """Control fork stepper motor."""
     try:
@@ -125,11 +81,10 @@ def move_fork(distance_cm, direction):
 
         logging.info(f"Fork moving {distance_cm}cm {direction}")
 
-        for _ in range(steps):
-            GPIO.output(STEP_PIN_FORK, GPIO.HIGH)
-            time.sleep(PULSE_WIDTH)
-            GPIO.output(STEP_PIN_FORK, GPIO.LOW)
-            time.sleep(PULSE_WIDTH)
+        run_pulse_train(
+            build_step_train({STEP_PIN_FORK: steps}, STEP_INTERVAL, PULSE_WIDTH),
+            label="fork"
+        )
 
         return True
     except Exception as e:
@@ -142,7 +97,6 @@ def move_both_rails(distance_1, direction_1, distance_2, direction_2):
     try:
         steps_1 = int(math.ceil(distance_1 * STEPS_PER_CM_1))
         steps_2 = int(math.ceil(distance_2 * STEPS_PER_CM_2))
-        max_steps = max(steps_1, steps_2)
 
         GPIO.output(DIR_PIN_1, GPIO.HIGH if direction_1 == 'backward' else GPIO.LOW)
         GPIO.output(DIR_PIN_2, GPIO.HIGH if direction_2 == 'backward' else GPIO.LOW)
@@ -152,16 +106,12 @@ def move_both_rails(distance_1, direction_1, distance_2, direction_2):
             f"Rail 2: {distance_2}cm {direction_2}"
         )
 
-        for i in range(max_steps):
-            if i < steps_1:
-                GPIO.output(STEP_PIN_1, GPIO.HIGH)
-            if i < steps_2:
-                GPIO.output(STEP_PIN_2, GPIO.HIGH)
-
-            time.sleep(PULSE_WIDTH)
-            GPIO.output(STEP_PIN_1, GPIO.LOW)
-            GPIO.output(STEP_PIN_2, GPIO.LOW)
-            time.sleep(PULSE_WIDTH)
+        run_pulse_train(
+            build_step_train(
+                {STEP_PIN_1: steps_1, STEP_PIN_2: steps_2}, STEP_INTERVAL, PULSE_WIDTH
+            ),
+            label="rails"
+        )
 
         return True
     except Exception as e:
@@ -169,51 +119,105 @@ def move_both_rails(distance_1, direction_1, distance_2, direction_2):
         return False
 
 
+def home_rails():
+    """Blind-home both rails: drive them back against their end stops, then
+    forward to the working home position, and reset the tracked positions.
+
+    Returns:
+        bool: True if both moves completed
+    """
+    tracker = get_tracker()
+    for name in RAIL_AXES:
+        tracker.begin_move(name)  # Reference is lost until homing completes
+
+    if not move_both_rails(HOMING_BACKOFF_CM, 'backward', HOMING_BACKOFF_CM, 'backward'):
+        logging.warning("Partial rail movement failure - continuing")
+        return False
+    hal.sleep(0.5)
+
+    if not move_both_rails(HOMING_FORWARD_CM, 'forward', HOMING_FORWARD_CM, 'forward'):
+        logging.warning("Partial rail movement failure - continuing")
+        return False
+
+    for name in RAIL_AXES:
+        tracker.set_home(name)
+    return True
+
+
+def return_rails_home():
+    """Move homed rails straight back to home using their tracked position.
+
+    Returns:
+        bool: True if the rails are home
+    """
+    tracker = get_tracker()
+    positions = [tracker.position(name) for name in RAIL_AXES]
+    logging.info(f"Returning rails from tracked positions {positions} cm")
+    for name in RAIL_AXES:
+        tracker.begin_move(name)
+
+    (position_1, position_2) = positions
+    if not move_both_rails(
+        abs(position_1), 'backward' if position_1 > 0 else 'forward',
+        abs(position_2), 'backward' if position_2 > 0 else 'forward'
+    ):
+        logging.warning("Partial rail movement failure - continuing")
+        return False
+
+    for name in RAIL_AXES:
+        tracker.set_home(name)
+    return True
+
+
 def emergency_stop():
     """Emergency stop with component reset to default positions."""
+    start = time.perf_counter()
     # Immediate stop
     GPIO.setwarnings(False)
     GPIO.setmode(GPIO.BCM)
     GPIO.cleanup()
+    get_relay_bank().invalidate()
     print("🛑 EMERGENCY STOP triggered: All GPIOs have been reset.")
 
     # Reinitialize with small delay
-    time.sleep(0.1)
+    hal.sleep(0.1)
     GPIO.setmode(GPIO.BCM)
     all_pins = [
         STEP_PIN_1, DIR_PIN_1, STEP_PIN_2, DIR_PIN_2,
         STEP_PIN_FORK, DIR_PIN_FORK
     ] + USED_PINS
     GPIO.setup(all_pins, GPIO.OUT)
+    get_relay_bank().reset()
 
     try:
         # Fork reset
         logging.info("Resetting fork position...")
         if not move_fork(1.5, 'backward'):
             logging.warning("Fork reset incomplete - continuing")
-        time.sleep(1)
+        hal.sleep(1)
 
         # Actuator reset
         logging.info("Resetting actuators...")
-        run_top_actuators_parallel(
-            top_actuators_pull, top_actuators_pull_left, 1, 0.8
-        )
+        run_timeline(cycle_timeline(ACTUATOR_RESET_CYCLES), label="actuator reset")
         turn_off_top_actuators()  # Extra safety
 
         # Rail reset sequence
         logging.info("Resetting rail positions...")
         try:
-            if not move_both_rails(15, 'backward', 15, 'backward'):
-                logging.warning("Partial rail movement failure - continuing")
-            time.sleep(0.5)
-
-            if not move_both_rails(6, 'forward', 6, 'forward'):
-                logging.warning("Partial rail movement failure - continuing")
+            # A move interrupted by this stop leaves the rails unhomed
+            if get_tracker().is_homed(*RAIL_AXES):
+                return_rails_home()
+            else:
+                home_rails()
         except Exception as e:
             logging.error(f"Rail movement error: {e}")
 
         logging.info("✅ Emergency stop sequence completed")
+        emergency_stops_total.inc(result="completed")
 
     except Exception as main_error:
         logging.error(f"Critical error during emergency stop: {main_error}")
-        raise
\ No newline at end of file
+        emergency_stops_total.inc(result="failed")
+        raise
+    finally:
+        emergency_stop_seconds.observe(time.perf_counter() - start)
\ No newline at end of file
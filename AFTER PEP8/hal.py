@@ -0,0 +1,546 @@
+import os
+import abc
+import json
+import time
+import logging
+import threading
+
+# --- Backend Selection ---
+# PACKAGING_HAL:       "rpi" (RPi.GPIO) or "sim" (simulated, virtual clock).
+#                      Defaults to "rpi"; the simulator is only used when
+#                      asked for, so a broken RPi.GPIO install fails loudly.
+# PACKAGING_HAL_TRACE: Optional path; wraps the backend in a RecordingBackend
+#                      that writes every pin change there as JSON lines.
+# PACKAGING_HAL_TIME_SCALE: Optional; runs the simulated clock in scaled real
+#                      time (e.g. 0.1 = 10x faster) instead of instantly.
+HAL_ENV = "PACKAGING_HAL"
+TRACE_ENV = "PACKAGING_HAL_TRACE"
+TIME_SCALE_ENV = "PACKAGING_HAL_TIME_SCALE"
+
+
+class GPIOBackend(abc.ABC):
+    """Interface shared by all backends.
+
+    Method names, signatures and constants follow RPi.GPIO, so modules use
+    a backend exactly as they used the RPi.GPIO module. Backends also own
+    the clock (monotonic(), sleep()) so timing can be virtualized.
+    """
+
+    # Constants (same values as RPi.GPIO)
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    name = "base"
+
+    @abc.abstractmethod
+    def setmode(self, mode):
+        """Select BCM or BOARD pin numbering."""
+
+    @abc.abstractmethod
+    def getmode(self):
+        """Return the pin numbering mode, or None if unset."""
+
+    @abc.abstractmethod
+    def setwarnings(self, flag):
+        """Enable or disable RPi.GPIO warnings."""
+
+    @abc.abstractmethod
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+        """Configure one or more channels as inputs or outputs."""
+
+    @abc.abstractmethod
+    def output(self, channel, value):
+        """Drive one or more output channels."""
+
+    @abc.abstractmethod
+    def input(self, channel):
+        """Return the level of an input channel."""
+
+    @abc.abstractmethod
+    def cleanup(self, channel=None):
+        """Release one, several or all channels."""
+
+    @abc.abstractmethod
+    def PWM(self, channel, frequency):
+        """Return a PWM object for a channel."""
+
+    @abc.abstractmethod
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        """Watch a channel for edges."""
+
+    @abc.abstractmethod
+    def remove_event_detect(self, channel):
+        """Stop watching a channel for edges."""
+
+    @abc.abstractmethod
+    def monotonic(self):
+        """Return the backend clock in seconds."""
+
+    @abc.abstractmethod
+    def monotonic_ns(self):
+        """Return the backend clock in nanoseconds."""
+
+    @abc.abstractmethod
+    def sleep(self, seconds):
+        """Sleep on the backend clock."""
+
+
+def _channels(channel):
+    """Normalize an RPi.GPIO channel argument (int or sequence) to a list."""
+    return list(channel) if isinstance(channel, (list, tuple)) else [channel]
+
+
+def _values(channel, value):
+    """Pair RPi.GPIO output values with channels (one value or one per channel)."""
+    channels = _channels(channel)
+    if isinstance(value, (list, tuple)):
+        if len(value) != len(channels):
+            raise ValueError("Number of values must match number of channels")
+        return list(zip(channels, value))
+    return [(pin, value) for pin in channels]
+
+
+class RPiGPIOBackend(GPIOBackend):
+    """Real hardware through RPi.GPIO."""
+
+    name = "rpi"
+
+    def __init__(self):
+        import RPi.GPIO as gpio  # Only importable on a Raspberry Pi
+        self._gpio = gpio
+
+    def setmode(self, mode):
+        self._gpio.setmode(mode)
+
+    def getmode(self):
+        return self._gpio.getmode()
+
+    def setwarnings(self, flag):
+        self._gpio.setwarnings(flag)
+
+    def setup(self, channel, direction, pull_up_down=GPIOBackend.PUD_OFF, initial=None):
+        if initial is None:
+            self._gpio.setup(channel, direction, pull_up_down=pull_up_down)
+        else:
+            self._gpio.setup(channel, direction, pull_up_down=pull_up_down, initial=initial)
+
+    def output(self, channel, value):
+        self._gpio.output(channel, value)
+
+    def input(self, channel):
+        return self._gpio.input(channel)
+
+    def cleanup(self, channel=None):
+        if channel is None:
+            self._gpio.cleanup()
+        else:
+            self._gpio.cleanup(channel)
+
+    def PWM(self, channel, frequency):
+        return self._gpio.PWM(channel, frequency)
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        kwargs = {"callback": callback}
+        if bouncetime is not None:
+            kwargs["bouncetime"] = bouncetime
+        self._gpio.add_event_detect(channel, edge, **kwargs)
+
+    def remove_event_detect(self, channel):
+        self._gpio.remove_event_detect(channel)
+
+    def monotonic(self):
+        return time.perf_counter()
+
+    def monotonic_ns(self):
+        return time.perf_counter_ns()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class SimulatedPWM:
+    """PWM channel for SimulatedBackend; records the duty-cycle history."""
+
+    def __init__(self, backend, channel, frequency):
+        self.backend = backend
+        self.channel = channel
+        self.frequency = frequency
+        self.duty_cycle = 0
+        self.running = False
+        self.history = []
+
+    def start(self, duty_cycle):
+        self.running = True
+        self.ChangeDutyCycle(duty_cycle)
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self.history.append((self.backend.monotonic(), duty_cycle))
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        self.running = False
+        self.history.append((self.backend.monotonic(), None))
+
+
+class SimulatedBackend(GPIOBackend):
+    """In-memory GPIO with a virtual clock, for headless runs and tests.
+
+    sleep() advances the virtual clock instantly, so full sequences run in
+    milliseconds. With time_scale set, the clock instead follows real time
+    divided by time_scale (0.1 runs ten times faster than real hardware),
+    so concurrent threads sleeping at once overlap as they would on the
+    machine. Inputs are driven with set_input(); attach_echo() models
+    an HC-SR04 that answers each trigger pulse with an echo for a given
+    distance. Like RPi.GPIO, using a channel that was not set up raises
+    RuntimeError.
+    """
+
+    name = "sim"
+
+    def __init__(self, start_time=0.0, time_scale=None):
+        self._lock = threading.RLock()
+        self._now = start_time
+        self.time_scale = time_scale
+        self._real_start = time.monotonic()
+        self.mode = None
+        self.warnings = True
+        self.directions = {}
+        self.levels = {}
+        self.pwms = []
+        self._callbacks = {}
+        self._echoes = {}
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def getmode(self):
+        return self.mode
+
+    def setwarnings(self, flag):
+        self.warnings = flag
+
+    def setup(self, channel, direction, pull_up_down=GPIOBackend.PUD_OFF, initial=None):
+        with self._lock:
+            if self.mode is None:
+                raise RuntimeError("Please set pin numbering mode using GPIO.setmode()")
+            for pin in _channels(channel):
+                self.directions[pin] = direction
+                if initial is not None:
+                    self.levels[pin] = int(bool(initial))
+                else:
+                    self.levels.setdefault(pin, self.LOW)
+
+    def output(self, channel, value):
+        with self._lock:
+            for pin, level in _values(channel, value):
+                if self.directions.get(pin) != self.OUT:
+                    raise RuntimeError(f"The GPIO channel {pin} has not been set up as an OUTPUT")
+                previous = self.levels.get(pin, self.LOW)
+                self.levels[pin] = int(bool(level))
+                if pin in self._echoes and previous and not level:
+                    self._answer_echo(pin)
+
+    def input(self, channel):
+        with self._lock:
+            if channel not in self.directions:
+                raise RuntimeError(f"You must setup() the GPIO channel {channel} first")
+            return self.levels.get(channel, self.LOW)
+
+    def cleanup(self, channel=None):
+        with self._lock:
+            pins = list(self.directions) if channel is None else _channels(channel)
+            for pin in pins:
+                self.directions.pop(pin, None)
+                self.levels.pop(pin, None)
+                self._callbacks.pop(pin, None)
+            if channel is None:
+                self.mode = None
+
+    def PWM(self, channel, frequency):
+        with self._lock:
+            if self.directions.get(channel) != self.OUT:
+                raise RuntimeError(f"The GPIO channel {channel} has not been set up as an OUTPUT")
+            pwm = SimulatedPWM(self, channel, frequency)
+            self.pwms.append(pwm)
+            return pwm
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        with self._lock:
+            if self.directions.get(channel) != self.IN:
+                raise RuntimeError(f"You must setup() the GPIO channel {channel} as an input first")
+            if channel in self._callbacks:
+                raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+            self._callbacks[channel] = (edge, callback)
+
+    def remove_event_detect(self, channel):
+        with self._lock:
+            self._callbacks.pop(channel, None)
+
+    def set_input(self, channel, level):
+        """Drive an input pin, firing edge callbacks like real hardware."""
+        with self._lock:
+            previous = self.levels.get(channel, self.LOW)
+            level = int(bool(level))
+            self.levels[channel] = level
+            detector = self._callbacks.get(channel)
+        if detector is None or previous == level:
+            return
+        edge, callback = detector
+        rising = level == self.HIGH
+        if callback and (edge == self.BOTH or edge == (self.RISING if rising else self.FALLING)):
+            callback(channel)
+
+    def attach_echo(self, trig_pin, echo_pin, distance_cm, latency=0.0005):
+        """Answer every trigger pulse on trig_pin with an echo for distance_cm."""
+        self._echoes[trig_pin] = (echo_pin, distance_cm, latency)
+
+    def _answer_echo(self, trig_pin):
+        echo_pin, distance_cm, latency = self._echoes[trig_pin]
+        if distance_cm is None or echo_pin not in self.directions:
+            return  # No echo: models an out-of-range target
+        self._advance(latency)
+        self.set_input(echo_pin, self.HIGH)
+        self._advance(distance_cm * 2 / 34300)
+        self.set_input(echo_pin, self.LOW)
+
+    def _advance(self, seconds):
+        with self._lock:
+            self._now += max(0.0, seconds)
+
+    def monotonic(self):
+        if self.time_scale:
+            return self._now + (time.monotonic() - self._real_start) / self.time_scale
+        return self._now
+
+    def monotonic_ns(self):
+        return int(round(self.monotonic() * 1e9))
+
+    def sleep(self, seconds):
+        if self.time_scale:
+            time.sleep(max(0.0, seconds) * self.time_scale)
+        else:
+            self._advance(seconds)
+
+
+class RecordingBackend(GPIOBackend):
+    """Wraps another backend and records every pin change as a trace.
+
+    Each output, setup, PWM duty change and input edge becomes one JSON
+    line: {"t": seconds, "op": ..., "pin": ..., "value": ...}. The trace
+    is also kept in memory (events) for benchmarks.
+    """
+
+    name = "record"
+
+    def __init__(self, inner, path=None, keep_events=True):
+        self.inner = inner
+        self.path = path
+        self.keep_events = keep_events
+        self.events = []
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1 << 16) if path else None
+        self.name = f"record({inner.name})"
+
+    def __getattr__(self, name):
+        # Backend-specific helpers (e.g. SimulatedBackend.set_input)
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def _record(self, op, pin, value=None):
+        event = {"t": self.inner.monotonic(), "op": op, "pin": pin, "value": value}
+        with self._lock:
+            if self.keep_events:
+                self.events.append(event)
+            if self._file:
+                self._file.write(json.dumps(event) + "\n")
+
+    def setmode(self, mode):
+        self.inner.setmode(mode)
+
+    def getmode(self):
+        return self.inner.getmode()
+
+    def setwarnings(self, flag):
+        self.inner.setwarnings(flag)
+
+    def setup(self, channel, direction, pull_up_down=GPIOBackend.PUD_OFF, initial=None):
+        self.inner.setup(channel, direction, pull_up_down=pull_up_down, initial=initial)
+        for pin in _channels(channel):
+            self._record("setup", pin, direction)
+
+    def output(self, channel, value):
+        self.inner.output(channel, value)
+        for pin, level in _values(channel, value):
+            self._record("output", pin, int(bool(level)))
+
+    def input(self, channel):
+        return self.inner.input(channel)
+
+    def cleanup(self, channel=None):
+        self.inner.cleanup(channel)
+        self._record("cleanup", channel)
+        self.flush()
+
+    def PWM(self, channel, frequency):
+        return _RecordingPWM(self, self.inner.PWM(channel, frequency), channel)
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        def recorded(pin):
+            self._record("edge", pin, self.inner.input(pin))
+            if callback:
+                callback(pin)
+        self.inner.add_event_detect(channel, edge, callback=recorded, bouncetime=bouncetime)
+
+    def remove_event_detect(self, channel):
+        self.inner.remove_event_detect(channel)
+
+    def monotonic(self):
+        return self.inner.monotonic()
+
+    def monotonic_ns(self):
+        return self.inner.monotonic_ns()
+
+    def sleep(self, seconds):
+        self.inner.sleep(seconds)
+
+    def flush(self):
+        """Write buffered trace lines to disk."""
+        with self._lock:
+            if self._file:
+                self._file.flush()
+
+    def close(self):
+        """Flush and close the trace file."""
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class _RecordingPWM:
+    def __init__(self, backend, pwm, channel):
+        self._backend = backend
+        self._pwm = pwm
+        self._channel = channel
+
+    def start(self, duty_cycle):
+        self._pwm.start(duty_cycle)
+        self._backend._record("pwm", self._channel, duty_cycle)
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self._pwm.ChangeDutyCycle(duty_cycle)
+        self._backend._record("pwm", self._channel, duty_cycle)
+
+    def ChangeFrequency(self, frequency):
+        self._pwm.ChangeFrequency(frequency)
+
+    def stop(self):
+        self._pwm.stop()
+        self._backend._record("pwm", self._channel, None)
+
+
+# --- Active Backend ---
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(kind=None, trace_path=None):
+    """Build a backend from explicit arguments or the environment."""
+    kind = kind or os.environ.get(HAL_ENV)
+    trace_path = trace_path or os.environ.get(TRACE_ENV)
+
+    time_scale = float(os.environ.get(TIME_SCALE_ENV) or 0) or None
+
+    if kind == "sim":
+        backend = SimulatedBackend(time_scale=time_scale)
+    elif kind in (None, "", "rpi"):
+        try:
+            backend = RPiGPIOBackend()
+        except ImportError as e:
+            raise ImportError(
+                f"RPi.GPIO could not be imported ({e}). Install it, or set "
+                f"{HAL_ENV}=sim to run without hardware."
+            ) from e
+    else:
+        raise ValueError(f"Unknown {HAL_ENV} backend '{kind}'. Use 'rpi' or 'sim'.")
+
+    if trace_path:
+        backend = RecordingBackend(backend, trace_path)
+    logging.debug(f"Using GPIO backend: {backend.name}")
+    return backend
+
+
+def get_backend():
+    """Return the active backend, creating it from the environment on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def set_backend(backend):
+    """Make backend the active backend and return the previous one."""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
+
+
+# Optional hook(backend, seconds) that performs every sleep() instead of the
+# backend; arbiter.py installs one so waits can be cancelled part-way.
+_sleep_hook = None
+
+
+def set_sleep_hook(hook):
+    """Route sleep() through hook(backend, seconds); None restores plain sleeps."""
+    global _sleep_hook
+    _sleep_hook = hook
+
+
+def sleep(seconds):
+    """Sleep on the active backend's clock."""
+    if _sleep_hook is None:
+        get_backend().sleep(seconds)
+    else:
+        _sleep_hook(get_backend(), seconds)
+
+
+def monotonic():
+    """Return the active backend's clock in seconds."""
+    return get_backend().monotonic()
+
+
+def monotonic_ns():
+    """Return the active backend's clock in nanoseconds."""
+    return get_backend().monotonic_ns()
+
+
+class _GPIOProxy:
+    """Module-like object forwarding to whichever backend is active.
+
+    Modules do `from hal import GPIO` and keep calling GPIO.output(...),
+    GPIO.HIGH, etc. The backend can be swapped after import.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_backend(), name)
+
+
+GPIO = _GPIOProxy()
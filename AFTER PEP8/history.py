@@ -0,0 +1,407 @@
+import os
+import math
+import time
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+
+from positions import STATE_DIR
+
+# --- History Settings ---
+# Every measurement and delivery outcome is appended to a SQLite database
+# in WAL mode. Callers only queue a row; a background thread writes the
+# queue out in batches, one transaction each.
+HISTORY_FILE = os.path.join(STATE_DIR, "history.sqlite3")
+BATCH_SIZE = 100              # Rows written per transaction at most
+FLUSH_INTERVAL = 1.0          # Seconds a queued row waits for more to batch with
+MAX_QUEUED = 10000            # Rows beyond this are dropped, never blocking a caller
+STATS_WINDOW_HOURS = 24       # Default /stats window
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS measurements (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        success INTEGER NOT NULL,
+        duration REAL,
+        length REAL, width REAL, height REAL,
+        wrap_width REAL, wrap_length REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS measurements_ts ON measurements (ts)",
+    "CREATE INDEX IF NOT EXISTS measurements_sku ON measurements (length, width, height)",
+    """CREATE TABLE IF NOT EXISTS deliveries (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        success INTEGER NOT NULL,
+        duration REAL,
+        length REAL, width REAL, height REAL,
+        wrap_width REAL, wrap_length REAL,
+        sealing_class TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS deliveries_ts ON deliveries (ts)",
+    "CREATE INDEX IF NOT EXISTS deliveries_sku ON deliveries (length, width, height)",
+    # One row per stage of a measurement or delivery phase, so percentiles
+    # come from an index range instead of decoding whole results
+    """CREATE TABLE IF NOT EXISTS stage_times (
+        ts REAL NOT NULL,
+        kind TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        seconds REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS stage_times_stage ON stage_times (kind, stage, ts)",
+)
+
+INSERTS = {
+    "measurements": (
+        "INSERT INTO measurements (ts, success, duration, length, width, height, "
+        "wrap_width, wrap_length) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    ),
+    "deliveries": (
+        "INSERT INTO deliveries (ts, success, duration, length, width, height, "
+        "wrap_width, wrap_length, sealing_class) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    ),
+    "stage_times": "INSERT INTO stage_times (ts, kind, stage, seconds) VALUES (?, ?, ?, ?)",
+}
+
+# Measurement timings that are not stage latencies
+NON_STAGE_TIMINGS = ("overlap_saved",)
+
+
+def _connect(path):
+    db = sqlite3.connect(path, timeout=5.0)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; fsync per checkpoint
+    return db
+
+
+def _dimensions(dimensions):
+    if not dimensions:
+        return (None, None, None)
+    return tuple(float(value) for value in dimensions[:3])
+
+
+def _wrap(wrap_size):
+    if not wrap_size:
+        return (None, None)
+    return (float(wrap_size["width"]), float(wrap_size["length"]))
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values, or None if empty."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class History:
+    """Append-only measurement and delivery log with a batching writer."""
+
+    def __init__(self, path=HISTORY_FILE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, max_queued=MAX_QUEUED):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._writer = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        db = _connect(self.path)
+        try:
+            for statement in SCHEMA:
+                db.execute(statement)
+            db.commit()
+        finally:
+            db.close()
+
+    # --- Recording ---
+
+    def _enqueue(self, rows):
+        self._start()
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            self.dropped += len(rows)
+            logging.warning("History queue full; dropping a record")
+
+    def record_measurement(self, result, duration, timestamp=None):
+        """Queue a measure_and_optimize() outcome (result None = failed)."""
+        ts = timestamp or time.time()
+        if result:
+            dimensions = _dimensions(result.get("object_dimensions"))
+            wrap = _wrap(result.get("bubble_wrap_size"))
+            timings = result.get("timings") or {}
+        else:
+            dimensions, wrap, timings = _dimensions(None), _wrap(None), {}
+        rows = [("measurements", (ts, int(bool(result)), duration) + dimensions + wrap)]
+        rows += [
+            ("stage_times", (ts, "measurement", stage, float(seconds)))
+            for stage, seconds in timings.items()
+            if stage not in NON_STAGE_TIMINGS and isinstance(seconds, (int, float))
+        ]
+        self._enqueue(rows)
+
+    def record_delivery(self, wrap_width, wrap_length, object_dimensions, success,
+                        duration, report=None, timestamp=None):
+        """Queue a run_delivery() outcome with its phase durations."""
+        ts = timestamp or time.time()
+        report = report or {}
+        row = (ts, int(bool(success)), duration) + _dimensions(object_dimensions) + (
+            float(wrap_width), float(wrap_length), report.get("sealing_class")
+        )
+        rows = [("deliveries", row)]
+        rows += [
+            ("stage_times", (ts, "delivery", name, float(phase["duration"])))
+            for name, phase in (report.get("phases") or {}).items()
+        ]
+        if "total" in report:
+            rows.append(("stage_times", (ts, "delivery", "total", float(report["total"]))))
+        self._enqueue(rows)
+
+    # --- Background writer ---
+
+    def _start(self):
+        if self._writer is not None:
+            return
+        with self._start_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_loop, name="history-writer", daemon=True
+                )
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _write_loop(self):
+        db = _connect(self.path)
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(db, [item for item in batch if not isinstance(item, threading.Event)])
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _write(self, db, batch):
+        if not batch:
+            return
+        grouped = {}
+        for rows in batch:
+            for table, row in rows:
+                grouped.setdefault(table, []).append(row)
+        try:
+            with db:
+                for table, rows in grouped.items():
+                    db.executemany(INSERTS[table], rows)
+            self.written += len(batch)
+            self.batches += 1
+        except sqlite3.Error as e:
+            self.errors += 1
+            logging.warning(f"Could not write {len(batch)} history records: {e}")
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far has been written."""
+        if self._writer is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    # --- Analytics ---
+
+    @staticmethod
+    def _stages(db):
+        """Yield each distinct (kind, stage), seeking the index once per stage."""
+        row = db.execute(
+            "SELECT kind, stage FROM stage_times ORDER BY kind, stage LIMIT 1"
+        ).fetchone()
+        while row:
+            yield row
+            kind, stage = row
+            row = db.execute(
+                "SELECT kind, stage FROM stage_times WHERE kind = ? AND stage > ? "
+                "ORDER BY stage LIMIT 1", (kind, stage)
+            ).fetchone() or db.execute(
+                "SELECT kind, stage FROM stage_times WHERE kind > ? "
+                "ORDER BY kind, stage LIMIT 1", (kind,)
+            ).fetchone()
+
+    def stats(self, hours=STATS_WINDOW_HOURS, now=None):
+        """Throughput per hour, stage latency percentiles and wrap consumption.
+
+        Every query is a range on a ts index limited to the last `hours`,
+        so the cost follows the window, not the size of the history.
+        """
+        now = now or time.time()
+        since = now - hours * 3600
+        db = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            hourly = {}
+            for table in ("measurements", "deliveries"):
+                for hour, total, succeeded in db.execute(
+                    f"SELECT CAST(ts / 3600 AS INTEGER), COUNT(*), SUM(success) "
+                    f"FROM {table} WHERE ts >= ? GROUP BY 1", (since,)
+                ):
+                    counts = hourly.setdefault(hour, {
+                        "measurements": 0, "deliveries": 0, "failed": 0
+                    })
+                    counts[table] = succeeded
+                    counts["failed"] += total - succeeded
+
+            latencies = {}
+            for kind, stage in self._stages(db):
+                values = [row[0] for row in db.execute(
+                    "SELECT seconds FROM stage_times WHERE kind = ? AND stage = ? "
+                    "AND ts >= ? ORDER BY seconds", (kind, stage, since)
+                )]
+                if not values:
+                    continue
+                latencies.setdefault(kind, {})[stage] = {
+                    "count": len(values),
+                    "p50": percentile(values, 0.50),
+                    "p95": percentile(values, 0.95),
+                }
+
+            deliveries, wrap_length, wrap_area = db.execute(
+                "SELECT COUNT(*), SUM(wrap_length), SUM(wrap_width * wrap_length) "
+                "FROM deliveries WHERE ts >= ? AND success = 1", (since,)
+            ).fetchone()
+        finally:
+            db.close()
+
+        return {
+            "window_hours": hours,
+            "throughput_per_hour": [
+                {"hour": datetime.fromtimestamp(hour * 3600).isoformat(timespec="minutes"),
+                 **hourly[hour]}
+                for hour in sorted(hourly)
+            ],
+            "stage_latency": latencies,
+            "wrap_consumption": {
+                "deliveries": deliveries,
+                "length_cm": wrap_length or 0.0,
+                "area_cm2": wrap_area or 0.0,
+            },
+            "writer": {
+                "queued": self._queue.qsize(),
+                "written": self.written,
+                "batches": self.batches,
+                "dropped": self.dropped,
+                "errors": self.errors,
+            },
+        }
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_history():
+    """Return the process-wide history, creating it on first use."""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = History()
+        return _history
+
+
+def record_measurement(result, duration):
+    """Queue a measurement outcome; history problems never reach the caller."""
+    try:
+        get_history().record_measurement(result, duration)
+    except Exception as e:
+        logging.warning(f"Could not record measurement history: {e}")
+
+
+def record_delivery(wrap_width, wrap_length, object_dimensions, success, duration,
+                    report=None):
+    """Queue a delivery outcome; history problems never reach the caller."""
+    try:
+        get_history().record_delivery(
+            wrap_width, wrap_length, object_dimensions, success, duration, report
+        )
+    except Exception as e:
+        logging.warning(f"Could not record delivery history: {e}")
+
+
+# --- Benchmark ---
+
+def benchmark_history(rows=2000, backlog_days=90, per_hour=30):
+    """Per-row commits vs the batching writer, and /stats on a large table.
+
+    Fills a temporary database with backlog_days of deliveries at per_hour
+    to show that stats() over the default window does not slow down with
+    the size of the table.
+    """
+    import tempfile
+
+    measurement = {
+        "object_dimensions": (21.4, 13.2, 7.9),
+        "bubble_wrap_size": {"width": 38.5, "length": 61.2},
+        "timings": {"front_capture": 0.41, "side_capture": 0.38,
+                    "optimization": 0.02, "total": 0.9},
+    }
+    report = {"sealing_class": "medium",
+              "phases": {"feed_and_open": {"duration": 6.1}, "seal": {"duration": 12.4}}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        history = History(os.path.join(directory, "direct.sqlite3"))
+        db = _connect(history.path)
+        start = time.perf_counter()
+        for _ in range(rows):
+            history._write(db, [[("measurements", (time.time(), 1, 0.9, 21.4, 13.2, 7.9,
+                                                   38.5, 61.2))]])
+        direct = time.perf_counter() - start
+        db.close()
+
+        history = History(os.path.join(directory, "batched.sqlite3"))
+        start = time.perf_counter()
+        for _ in range(rows):
+            history.record_measurement(measurement, 0.9)
+        queued = time.perf_counter() - start
+        history.flush(timeout=60)
+        batched = time.perf_counter() - start
+
+        now = time.time()
+        count = backlog_days * 24 * per_hour
+        db = _connect(history.path)
+        with db:
+            db.executemany(INSERTS["deliveries"], (
+                (now - i * 3600 / per_hour, 1, 30.0, 21.4, 13.2, 7.9, 38.5, 61.2, "medium")
+                for i in range(count)
+            ))
+            db.executemany(INSERTS["stage_times"], (
+                (now - i * 3600 / per_hour, "delivery", "seal", 12.0 + i % 7)
+                for i in range(count)
+            ))
+        db.close()
+        start = time.perf_counter()
+        stats = history.stats(now=now)
+        stats_time = time.perf_counter() - start
+
+    return {
+        "rows": rows,
+        "per_row_commit_ms": direct / rows * 1000,
+        "batched_enqueue_us": queued / rows * 1e6,
+        "batched_written_ms": batched / rows * 1000,
+        "batches": history.batches,
+        "backlog_deliveries": count,
+        "stats_ms": stats_time * 1000,
+        "stats_window_deliveries": stats["wrap_consumption"]["deliveries"],
+    }
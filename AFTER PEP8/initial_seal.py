@@ -1,51 +1,44 @@
 import math
-import time
 
-import RPi.GPIO as GPIO
+import hal
+import metrics
+from hal import GPIO
+from choreography import cycle_timeline, run_timeline
+from relay_bank import get_relay_bank
+from stepper import build_step_train, run_pulse_train
 
 
 # === CONFIG SECTION ===
-GPIO.setmode(GPIO.BCM)  # Use GPIO.BOARD if using physical pin numbers
-
-# Relay GPIO Pin Assignments (Modify based on your wiring)
-ACT1_RELAY1 = 14  # PUSH
-ACT1_RELAY2 = 15  # PULL
-
-ACT2_RELAY1 = 18  # TOP LEFT actuator
-ACT2_RELAY2 = 17
-
-ACT3_RELAY1 = 27
-ACT3_RELAY2 = 22
-
-ACT4_RELAY1 = 10
-ACT4_RELAY2 = 9
-
+# Relay GPIO pin assignments (ACT*_RELAY*) are shared in relay_bank.py
 STEP1_PIN = 24
 DIR1_PIN = 23
 
 STEPS_PER_REV = 3200
 LEAD_SCREW_PITCH = 8  # mm
 STEPS_PER_MM = STEPS_PER_REV / LEAD_SCREW_PITCH
+STEP_PULSE = 0.0005  # STEP high time (s)
+STEP_INTERVAL = 0.001  # 1 kHz step rate
 
-# List of used GPIO pins
-used_pins = [
-    ACT1_RELAY1, ACT1_RELAY2,
-    ACT2_RELAY1, ACT2_RELAY2,
-    ACT3_RELAY1, ACT3_RELAY2,
-    ACT4_RELAY1, ACT4_RELAY2,
-    STEP1_PIN, DIR1_PIN
-]
+# Top actuator sealing timeline: (motion, main s, left s, pause after s)
+SEALING_CYCLES = (
+    ("push", 1, 0.7, 4),
+    ("pull", 0.5, 0.2, 0.5),
+    ("push", 0.5, 0.2, 4),
+    ("pull", 0.5, 0.2, 0.5),
+    ("push", 0.5, 0.2, 4),
+    ("pull", 2, 0.7, 0),
+)
 
 
 # === SETUP ===
-try:
-    for pin in used_pins:
-        GPIO.setup(pin, GPIO.OUT)
-        GPIO.output(pin, GPIO.HIGH)  # Default state: OFF (relay deactivated)
-except Exception as e:
-    print(f"[ERROR] GPIO Setup failed: {e}")
-    GPIO.cleanup()
-    exit()
+# Pins are configured by InitialSealController() rather than at import,
+# so this module can be imported without touching hardware.
+
+
+# === METRICS ===
+initial_seal_seconds = metrics.histogram(
+    "packaging_initial_seal_seconds", "Initial feed and seal operation time", ["operation"]
+)
 
 
 # === ACTUATOR FUNCTIONS ===
@@ -54,100 +47,14 @@ def move_stepper(length_mm):
     steps = int(math.ceil(length_mm * STEPS_PER_MM))
     GPIO.output(DIR1_PIN, GPIO.LOW)  # Set motor direction (forward)
     
-    for _ in range(steps):
-        GPIO.output(STEP1_PIN, GPIO.HIGH)  # Activate stepper motor pin
-        time.sleep(0.0005)  # Wait for step delay
-        GPIO.output(STEP1_PIN, GPIO.LOW)  # Deactivate stepper motor pin
-        time.sleep(0.0005)  # Wait for step delay
-
-    print(f"[Stepper] Moved {length_mm} mm ({steps} steps)")
-
-
-def turn_off_top_actuators():
-    """Turn off all top actuators."""
-    print("[INFO] Turning OFF all top actuators...")
-    for pin in used_pins:
-        GPIO.output(pin, GPIO.HIGH)
-    time.sleep(0.5)
-
-
-def top_actuators_off_LEFT():
-    """Deactivate top LEFT actuator."""
-    print("[INFO] Deactivating top LEFT actuator...")
-    GPIO.output(ACT2_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT2_RELAY2, GPIO.HIGH)
-
-
-def top_actuators_pull():
-    """Pull top right actuators."""
-    print("[INFO] Pushing top right actuators...")
-    # ACT1
-    GPIO.output(ACT1_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT1_RELAY2, GPIO.LOW)
-    # ACT3
-    GPIO.output(ACT3_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT3_RELAY2, GPIO.LOW)
-    # ACT4
-    GPIO.output(ACT4_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT4_RELAY2, GPIO.LOW)
-
-
-def top_actuators_push():
-    """Push top right actuators."""
-    print("[INFO] Pulling top right actuators...")
-    # ACT1
-    GPIO.output(ACT1_RELAY1, GPIO.LOW)
-    GPIO.output(ACT1_RELAY2, GPIO.HIGH)
-    # ACT3
-    GPIO.output(ACT3_RELAY1, GPIO.LOW)
-    GPIO.output(ACT3_RELAY2, GPIO.HIGH)
-    # ACT4
-    GPIO.output(ACT4_RELAY1, GPIO.LOW)
-    GPIO.output(ACT4_RELAY2, GPIO.HIGH)
-
-
-def top_actuators_push_LEFT():
-    """Push top LEFT actuator."""
-    print("[INFO] Pushing top LEFT actuator...")
-    GPIO.output(ACT2_RELAY1, GPIO.HIGH)
-    GPIO.output(ACT2_RELAY2, GPIO.LOW)
-
-
-def top_actuators_pull_LEFT():
-    """Pull top LEFT actuator."""
-    print("[INFO] Pulling top LEFT actuator...")
-    GPIO.output(ACT2_RELAY1, GPIO.LOW)
-    GPIO.output(ACT2_RELAY2, GPIO.HIGH)
-
-
-# === PARALLEL ACTUATION WITH SEPARATE DURATIONS ===
-def run_top_actuators_parallel(
-    right_func, left_func, right_duration, left_duration
-):
-    """Run actuators in parallel with separate durations."""
+    result = run_pulse_train(
+        build_step_train({STEP1_PIN: steps}, STEP_INTERVAL, STEP_PULSE),
+        label="seal feed"
+    )
     print(
-        f"[INFO] Running actuators in parallel: "
-        f"right({right_duration}s), left({left_duration}s)"
+        f"[Stepper] Moved {length_mm} mm ({steps} steps, "
+        f"{result['achieved_rate']:.0f} steps/s)"
     )
-    
-    # Activate both actuator groups
-    right_func()
-    left_func()
-
-    # Wait for the shorter duration first
-    time.sleep(min(right_duration, left_duration))
-
-    # Turn off whichever finished first
-    if left_duration < right_duration:
-        top_actuators_off_LEFT()
-        time.sleep(right_duration - left_duration)
-    elif left_duration > right_duration:
-        turn_off_top_actuators()
-        time.sleep(left_duration - right_duration)
-
-    # Turn off the rest
-    turn_off_top_actuators()
-    print("[INFO] Parallel actuation complete.\n")
 
 
 class InitialSealController:
@@ -167,9 +74,9 @@ class InitialSealController:
                 raise RuntimeError("Failed to set BCM pin numbering mode")
                 
             # Then configure pins
-            for pin in used_pins:
-                GPIO.setup(pin, GPIO.OUT)
-                GPIO.output(pin, GPIO.HIGH)
+            GPIO.setup([STEP1_PIN, DIR1_PIN], GPIO.OUT)
+            GPIO.output([STEP1_PIN, DIR1_PIN], GPIO.HIGH)
+            get_relay_bank().reset()
                 
         except Exception as e:
             GPIO.cleanup()
@@ -177,7 +84,8 @@ class InitialSealController:
 
     def perform_feeding(self):
         """Handle only the feeding mechanism."""
-        move_stepper(40)  # Example feeding command
+        with initial_seal_seconds.time(operation="feeding"):
+            move_stepper(40)  # Example feeding command
 
     def perform_sealing(self):
         """Handle only the actuator sealing."""
@@ -185,47 +93,12 @@ class InitialSealController:
             # Double-check mode before operations
             if GPIO.getmode() != GPIO.BCM:
                 self.__init__()  # Re-initialize if needed
-            time.sleep(1)
-            run_top_actuators_parallel(
-                right_func=top_actuators_push,
-                left_func=top_actuators_push_LEFT,
-                right_duration=1,
-                left_duration=0.7
-            )
-            time.sleep(4)
-            run_top_actuators_parallel(
-                right_func=top_actuators_pull,
-                left_func=top_actuators_pull_LEFT,
-                right_duration=0.5,
-                left_duration=0.2
-            )
-            time.sleep(0.5)
-            run_top_actuators_parallel(
-                right_func=top_actuators_push,
-                left_func=top_actuators_push_LEFT,
-                right_duration=0.5,
-                left_duration=0.2
-            )
-            time.sleep(4)
-            run_top_actuators_parallel(
-                right_func=top_actuators_pull,
-                left_func=top_actuators_pull_LEFT,
-                right_duration=0.5,
-                left_duration=0.2
-            )
-            time.sleep(0.5)
-            run_top_actuators_parallel(
-                right_func=top_actuators_push,
-                left_func=top_actuators_push_LEFT,
-                right_duration=0.5,
-                left_duration=0.2
-            )
-            time.sleep(4)
-            run_top_actuators_parallel(
-                right_func=top_actuators_pull,
-                left_func=top_actuators_pull_LEFT,
-                right_duration=2,
-                left_duration=0.7
+            hal.sleep(1)
+            with initial_seal_seconds.time(operation="sealing"):
+                report = run_timeline(cycle_timeline(SEALING_CYCLES), label="initial seal")
+            print(
+                f"[INFO] Sealing took {report['duration']:.2f}s "
+                f"(planned {report['planned_duration']:.2f}s)"
             )
         except Exception as e:
             print(f"[ERROR] Sealing failed: {e}")
@@ -233,4 +106,5 @@ class InitialSealController:
 
     def cleanup(self):
         """Clean up GPIO resources."""
-        GPIO.cleanup()
\ No newline at end of file
+        GPIO.cleanup()
+        get_relay_bank().invalidate()
\ No newline at end of file
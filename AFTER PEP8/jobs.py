@@ -0,0 +1,165 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Job Settings ---
+JOB_WORKERS = 1            # Hardware jobs run one at a time
+MAX_FINISHED_JOBS = 50     # Finished jobs kept for /jobs/<id> lookups
+EVENT_WAIT_TIMEOUT = 15.0  # Seconds an event stream waits before a keep-alive
+
+FINISHED_STATES = ("succeeded", "failed")
+
+
+class Job:
+    """A long-running operation and the progress events it has published.
+
+    Events are dicts with a sequence number (seq), a type ("state" or
+    "progress") and their payload. They are kept for the job's lifetime, so
+    a client that connects late, or reconnects, replays what it missed.
+    """
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.state = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self._condition = threading.Condition()
+
+    @property
+    def done(self):
+        return self.state in FINISHED_STATES
+
+    def publish(self, event_type, **payload):
+        """Append an event and wake every waiting stream."""
+        with self._condition:
+            event = {"seq": len(self.events) + 1, "type": event_type,
+                     "time": time.time(), **payload}
+            self.events.append(event)
+            self._condition.notify_all()
+        return event
+
+    def progress(self, stage, fraction=None):
+        """Progress callback handed to the job function."""
+        if fraction is not None:
+            fraction = round(min(max(fraction, 0.0), 1.0), 3)
+        self.publish("progress", stage=stage, progress=fraction)
+
+    def set_state(self, state, **payload):
+        with self._condition:
+            self.state = state
+            if state == "running":
+                self.started = time.time()
+            elif state in FINISHED_STATES:
+                self.finished = time.time()
+            self.publish("state", state=state, **payload)
+
+    def events_after(self, seq, timeout=EVENT_WAIT_TIMEOUT):
+        """Return events newer than seq, waiting up to timeout for one."""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: len(self.events) > seq or self.done, timeout=timeout
+            )
+            return list(self.events[seq:])
+
+    def to_dict(self):
+        """Return the job status (without the event log)."""
+        last = next((e for e in reversed(self.events) if e["type"] == "progress"), None)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "progress": last,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Runs jobs on a worker pool and keeps them for status lookups."""
+
+    def __init__(self, workers=JOB_WORKERS, max_finished=MAX_FINISHED_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_finished = max_finished
+
+    def submit(self, kind, func, *args, **kwargs):
+        """Queue func(*args, progress=job.progress, **kwargs) and return the Job.
+
+        The job succeeds with func's return value, or fails with the message
+        of any exception it raises.
+        """
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job.set_state("queued")
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        job.set_state("running")
+        try:
+            job.result = func(*args, progress=job.progress, **kwargs)
+        except Exception as e:
+            job.error = str(e)
+            logging.error(f"Job {job.kind} {job.id} failed: {e}")
+            job.set_state("failed", error=job.error)
+        else:
+            job.set_state("succeeded")
+        logging.info(
+            f"Job {job.kind} {job.id} {job.state} in {job.finished - job.started:.1f}s"
+        )
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Return the job with this id, or None."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stream(self, job, after=0):
+        """Yield the job's events from seq after+1 until it has finished.
+
+        Yields None whenever EVENT_WAIT_TIMEOUT passes without an event, so
+        the caller can send a keep-alive.
+        """
+        seq = after
+        while True:
+            events = job.events_after(seq)
+            if not events:
+                if job.done:
+                    return
+                yield None
+                continue
+            for event in events:
+                seq = event["seq"]
+                yield event
+            if job.done and seq >= len(job.events):
+                return
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the process-wide job manager, creating it on first use."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
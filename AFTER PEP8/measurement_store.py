@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+
+import numpy as np
+
+from cache import LRUCache
+from positions import STATE_DIR
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- Measurement Store Settings ---
+# Measurements live server-side under a random id; the Flask session only
+# carries that id. Recent ones stay decoded in memory, all of them (up to
+# MAX_STORED_MEASUREMENTS) in SQLite so they survive a restart.
+STORE_FILE = os.path.join(STATE_DIR, "measurements.sqlite3")
+MEMORY_ENTRIES = 32               # Decoded measurements kept in the LRU
+MAX_STORED_MEASUREMENTS = 1000    # Older rows are pruned from SQLite
+
+
+# --- Serialization ---
+
+def _to_json(value):
+    """json/orjson fallback for numpy values."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    """Serialize to compact JSON text, converting numpy scalars and arrays.
+
+    Uses orjson when it is installed, the standard library otherwise.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_to_json, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(value, default=_to_json, separators=(",", ":"))
+
+
+def loads(text):
+    """Parse JSON text written by dumps()."""
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+class MeasurementStore:
+    """Measurements keyed by id: an in-memory LRU in front of SQLite.
+
+    put() normalizes the measurement to plain JSON types (tuples become
+    lists, numpy values Python numbers), so a value read back from memory
+    looks the same as one read from the database. Values returned by get()
+    are shared; treat them as read-only.
+    """
+
+    def __init__(self, path=STORE_FILE, memory_entries=MEMORY_ENTRIES,
+                 max_stored=MAX_STORED_MEASUREMENTS):
+        self.path = path
+        self.max_stored = max_stored
+        self.memory = LRUCache(memory_entries)
+        self._db = None
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.db_reads = 0
+        self.db_errors = 0
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS measurements ("
+                "id TEXT PRIMARY KEY, created REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS measurements_created ON measurements (created)"
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def put(self, measurement):
+        """Store a measurement and return its id.
+
+        The measurement stays available from memory even if it could not
+        be written to the database.
+        """
+        measurement_id = uuid.uuid4().hex
+        text = dumps(measurement)
+        self.memory.put(measurement_id, loads(text))
+        try:
+            with self._lock:
+                db = self._connect()
+                with db:
+                    db.execute(
+                        "INSERT INTO measurements (id, created, data) VALUES (?, ?, ?)",
+                        (measurement_id, time.time(), text)
+                    )
+                    db.execute(
+                        "DELETE FROM measurements WHERE id IN ("
+                        "SELECT id FROM measurements ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                        (self.max_stored,)
+                    )
+                self.writes += 1
+        except sqlite3.Error as e:
+            self.db_errors += 1
+            logging.warning(f"Could not persist measurement {measurement_id}: {e}")
+        return measurement_id
+
+    def get(self, measurement_id):
+        """Return the measurement with this id, or None if it is unknown."""
+        if not measurement_id:
+            return None
+        measurement = self.memory.get(measurement_id)
+        if measurement is not None:
+            return measurement
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT data FROM measurements WHERE id = ?", (measurement_id,)
+                ).fetchone()
+                self.db_reads += 1
+        except sqlite3.Error as e:
+            self.db_errors += 1
+            logging.warning(f"Could not read measurement {measurement_id}: {e}")
+            return None
+        if row is None:
+            return None
+        measurement = loads(row[0])
+        self.memory.put(measurement_id, measurement)
+        return measurement
+
+    def stats(self):
+        """Return memory-tier counters and the number of stored rows."""
+        try:
+            with self._lock:
+                stored = self._connect().execute(
+                    "SELECT COUNT(*) FROM measurements"
+                ).fetchone()[0]
+        except sqlite3.Error:
+            stored = None
+        return {
+            "memory": self.memory.stats(),
+            "stored": stored,
+            "writes": self.writes,
+            "db_reads": self.db_reads,
+            "db_errors": self.db_errors,
+            "serializer": "orjson" if orjson is not None else "json",
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_measurement_store():
+    """Return the process-wide measurement store, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MeasurementStore()
+        return _store
+
+
+# --- Benchmark ---
+
+def benchmark_measurement_store(rounds=2000):
+    """Session cookie size and store put/get cost for a typical measurement.
+
+    Compares the signed session cookie holding the whole measurement (as
+    before) with one holding only its id, and times put() and cold and
+    warm get() against a temporary database.
+    """
+    import tempfile
+    from flask import Flask
+
+    measurement = {
+        "object_dimensions": (np.float64(21.4), np.float64(13.2), np.float64(7.9)),
+        "optimized_dimensions": {
+            "Optimal Length": np.float32(22.0), "Optimal Width": np.float32(14.0),
+            "Optimal Height": np.float32(9.0),
+        },
+        "bubble_wrap_size": {"width": np.float64(38.5), "length": np.float64(61.2)},
+        "front_image_path": "/home/team48/packaging_env/images/front_20260101_120000.jpg",
+        "side_image_path": "/home/team48/packaging_env/images/side_20260101_120000.jpg",
+        "timings": {"front_capture": 0.41, "side_capture": 0.38, "optimization": 0.02},
+    }
+
+    app = Flask(__name__)
+    app.secret_key = "benchmark"
+    serializer = app.session_interface.get_signing_serializer(app)
+    whole = json.loads(dumps(measurement))  # What the cookie session can hold
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Keep every row, so the cold reads below all come from the database
+        store = MeasurementStore(
+            os.path.join(directory, "measurements.sqlite3"),
+            max_stored=max(rounds, MAX_STORED_MEASUREMENTS)
+        )
+        ids = []
+        start = time.perf_counter()
+        for _ in range(rounds):
+            ids.append(store.put(measurement))
+        put_time = (time.perf_counter() - start) / rounds
+
+        store.memory.invalidate()
+        start = time.perf_counter()
+        for measurement_id in ids:
+            store.get(measurement_id)
+        cold_time = (time.perf_counter() - start) / rounds
+        db_reads = store.db_reads
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            store.get(ids[-1])
+        warm_time = (time.perf_counter() - start) / rounds
+        stats = store.stats()
+        store.close()
+
+    return {
+        "cookie_bytes": {
+            "measurement": len(serializer.dumps({"measurement_data": whole})),
+            "measurement_id": len(serializer.dumps({"measurement_id": ids[-1]})),
+        },
+        "put_ms": put_time * 1000,
+        "get_from_db_ms": cold_time * 1000,
+        "get_from_memory_ms": warm_time * 1000,
+        "db_reads": db_reads,
+        "serializer": stats["serializer"],
+    }
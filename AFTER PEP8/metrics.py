@@ -0,0 +1,253 @@
+import math
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# --- Metrics Settings ---
+# In-process counters, gauges and fixed-bucket histograms, rendered in the
+# Prometheus text format by /metrics. Metrics are recorded per stage, phase
+# or move, never per step, so step loops stay untouched.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)     # Seconds
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base class: one named metric with a value per label combination."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        """Return the metric's lines in the Prometheus text format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            samples = sorted(self._values.items())
+        for key, value in samples:
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets, with their sum and count.
+
+    Buckets are upper bounds; a +Inf bucket is always added. Bucket counts
+    are kept per bucket and only made cumulative when rendered.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        bounds = sorted(float(bound) for bound in buckets)
+        if bounds and bounds[-1] == math.inf:
+            bounds.pop()
+        self.buckets = tuple(bounds)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            samples = sorted(
+                (key, list(entry[0]), entry[1], entry[2])
+                for key, entry in self._values.items()
+            )
+        for key, counts, total, count in samples:
+            running = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                running += bucket_count
+                label_text = _label_text(self.labels, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{label_text} {running}")
+            label_text = _label_text(self.labels, key)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Registry:
+    """Named metrics, registered once and rendered together."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labels, **kwargs)
+            elif type(metric) is not cls or metric.labels != tuple(labels):
+                raise ValueError(f"Metric {name} is already registered differently")
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labels, buckets=buckets)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+_registry = Registry()
+
+
+def get_registry():
+    """Return the process-wide metrics registry."""
+    return _registry
+
+
+def counter(name, documentation, labels=()):
+    """Register (or return) a counter in the process-wide registry."""
+    return _registry.counter(name, documentation, labels)
+
+
+def gauge(name, documentation, labels=()):
+    """Register (or return) a gauge in the process-wide registry."""
+    return _registry.gauge(name, documentation, labels)
+
+
+def histogram(name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+    """Register (or return) a histogram in the process-wide registry."""
+    return _registry.histogram(name, documentation, labels, buckets)
+
+
+# --- Benchmark ---
+
+def benchmark_metrics(observations=100000):
+    """Cost of one histogram observation against a delivery's step timing.
+
+    A delivery records a few dozen observations (stages, phases, moves);
+    the step loop itself records none.
+    """
+    registry = Registry()
+    metric = registry.histogram("benchmark_seconds", "Benchmark", ["stage"])
+
+    start = time.perf_counter()
+    for i in range(observations):
+        metric.observe(i * 1e-6, stage="seal")
+    observe_time = (time.perf_counter() - start) / observations
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        with metric.time(stage="seal"):
+            pass
+    timer_time = (time.perf_counter() - start) / 1000
+
+    for stage in range(20):
+        for i in range(100):
+            metric.observe(i * 0.01, stage=f"stage_{stage}")
+    start = time.perf_counter()
+    text = registry.render()
+    render_time = time.perf_counter() - start
+
+    return {
+        "observe_us": observe_time * 1e6,
+        "timer_us": timer_time * 1e6,
+        "render_ms": render_time * 1000,
+        "render_bytes": len(text),
+    }
@@ -0,0 +1,208 @@
+import math
+import logging
+
+import numpy as np
+
+from stepper import PulseTrain
+
+# --- Profile Settings ---
+PROFILE_SHAPES = ("s-curve", "trapezoid", "fixed")
+SCURVE_GRID = 2e-5           # Time step (s) for sampling S-curve velocity
+
+
+class MotionProfile:
+    """Velocity limits for one stepper axis, in cm, cm/s, cm/s^2, cm/s^3.
+
+    Moves start and end at start_velocity (a speed the motor can start at
+    without stalling), accelerate at most at acceleration up to
+    max_velocity, and decelerate symmetrically. With a jerk limit the
+    acceleration itself ramps, giving an S-curve.
+    """
+
+    def __init__(self, max_velocity, acceleration, jerk=None, start_velocity=0.0):
+        if max_velocity <= 0 or acceleration <= 0:
+            raise ValueError("max_velocity and acceleration must be positive")
+        self.max_velocity = max_velocity
+        self.acceleration = acceleration
+        self.jerk = jerk
+        self.start_velocity = min(start_velocity, max_velocity)
+
+    def step_times(self, steps, steps_per_cm, shape="s-curve"):
+        """Return the time (s) at which each of steps+1 positions is reached.
+
+        Entry k is when the axis has travelled k steps, so entry 0 is 0 and
+        the last entry is the total move time.
+        """
+        if shape not in PROFILE_SHAPES:
+            raise ValueError(f"Unknown profile shape: {shape}")
+        positions = np.arange(steps + 1) / steps_per_cm
+        distance = steps / steps_per_cm
+        if steps == 0:
+            return positions
+
+        v0 = self.start_velocity
+        if shape == "fixed" or self.max_velocity <= v0:
+            return positions / (v0 or self.max_velocity)
+        if shape == "s-curve" and self.jerk:
+            ramp = self.acceleration / self.jerk
+            if distance > v0 * ramp:
+                return self._scurve_times(positions, distance, ramp)
+        return self._trapezoid_times(positions, distance)
+
+    def step_intervals(self, steps, steps_per_cm, shape="s-curve"):
+        """Return the delay (s) between consecutive steps of a move."""
+        return np.diff(self.step_times(steps, steps_per_cm, shape))
+
+    def _trapezoid_phases(self, distance):
+        """Return peak velocity, accel time and cruise time for a move."""
+        v0, a = self.start_velocity, self.acceleration
+        peak = min(self.max_velocity, np.sqrt(v0 ** 2 + a * distance))
+        accel_distance = (peak ** 2 - v0 ** 2) / (2 * a)
+        return peak, (peak - v0) / a, (distance - 2 * accel_distance) / peak
+
+    def _trapezoid_times(self, positions, distance):
+        v0, a = self.start_velocity, self.acceleration
+        peak, accel_time, cruise_time = self._trapezoid_phases(distance)
+        accel_distance = (peak ** 2 - v0 ** 2) / (2 * a)
+        total = 2 * accel_time + cruise_time
+
+        def time_to_cover(s):
+            return (np.sqrt(v0 ** 2 + 2 * a * np.maximum(s, 0.0)) - v0) / a
+
+        return np.where(
+            positions <= accel_distance,
+            time_to_cover(positions),
+            np.where(
+                positions <= distance - accel_distance,
+                accel_time + (positions - accel_distance) / peak,
+                total - time_to_cover(distance - positions)
+            )
+        )
+
+    def _scurve_times(self, positions, distance, ramp):
+        # Averaging a trapezoid's velocity over `ramp` seconds ramps its
+        # acceleration linearly (jerk = acceleration / ramp, doubled where a
+        # short move switches straight from accelerating to decelerating).
+        # The average adds start_velocity * ramp of travel, so the trapezoid
+        # is planned that much shorter.
+        v0 = self.start_velocity
+        peak, accel_time, cruise_time = self._trapezoid_phases(distance - v0 * ramp)
+        total = 2 * accel_time + cruise_time
+
+        t = np.arange(0.0, total + SCURVE_GRID, SCURVE_GRID)
+        excess = np.minimum.reduce([
+            self.acceleration * t,
+            np.full_like(t, peak - v0),
+            self.acceleration * (total - t),
+        ]).clip(min=0.0)
+
+        width = max(1, int(round(ramp / SCURVE_GRID)))
+        padded = np.concatenate((np.zeros(width), excess, np.zeros(width)))
+        summed = np.cumsum(padded)
+        smoothed = (summed[width:] - summed[:-width]) / width
+
+        velocity = v0 + smoothed
+        grid = np.arange(len(velocity)) * SCURVE_GRID
+        travelled = np.concatenate(([0.0], np.cumsum(
+            (velocity[1:] + velocity[:-1]) / 2 * SCURVE_GRID
+        )))
+        # Correct the small integration error so the final step lands at the end
+        travelled *= distance / travelled[-1]
+        return np.interp(positions, travelled, grid)
+
+
+class Axis:
+    """A stepper axis: its STEP/DIR pins, scale and motion limits."""
+
+    def __init__(self, name, step_pin, dir_pin, steps_per_cm, profile):
+        self.name = name
+        self.step_pin = step_pin
+        self.dir_pin = dir_pin
+        self.steps_per_cm = steps_per_cm
+        self.profile = profile
+
+    def steps_for(self, distance_cm):
+        """Return the whole number of steps covering distance_cm."""
+        # The epsilon stops float noise (5.4 * 500 = 2700.0000000000005)
+        # from adding a step, which would drift tracked positions
+        return int(math.ceil(distance_cm * self.steps_per_cm - 1e-9))
+
+
+def bresenham_steps(steps, master_steps):
+    """Spread steps evenly over master_steps events (Bresenham/DDA).
+
+    Returns:
+        np.ndarray: Boolean array, True where the axis steps on that event
+    """
+    k = np.arange(master_steps + 1, dtype=np.int64)
+    # Start the error term at half a step to centre the steps in each span
+    reached = (k * steps + master_steps // 2) // master_steps
+    return np.diff(reached) > 0
+
+
+def coordination_stretch(moves, master, shape="s-curve"):
+    """Return how much the master's timing must slow for every axis to keep its limits.
+
+    Each axis moves ratio = its distance / the master's distance times as
+    fast as the master, so velocity and start velocity scale by the ratio,
+    acceleration by ratio / stretch^2 and jerk by ratio / stretch^3.
+    """
+    master_axis, master_steps = master
+    master_profile = master_axis.profile
+    master_distance = master_steps / master_axis.steps_per_cm
+    stretch = 1.0
+    for axis, steps in moves:
+        ratio = (steps / axis.steps_per_cm) / master_distance
+        limits = axis.profile
+        peak = master_profile.max_velocity
+        if shape == "fixed":
+            peak = master_profile.start_velocity or peak
+        stretch = max(stretch, ratio * peak / limits.max_velocity)
+        if limits.start_velocity:
+            stretch = max(
+                stretch, ratio * master_profile.start_velocity / limits.start_velocity
+            )
+        if shape == "fixed":
+            continue
+        stretch = max(
+            stretch, math.sqrt(ratio * master_profile.acceleration / limits.acceleration)
+        )
+        if shape == "s-curve" and master_profile.jerk and limits.jerk:
+            stretch = max(stretch, (ratio * master_profile.jerk / limits.jerk) ** (1 / 3))
+    return stretch
+
+
+def plan_coordinated_move(moves, pulse_width, shape="s-curve"):
+    """Merge several axis moves into one step schedule.
+
+    The axis with the most steps is the master and follows its own motion
+    profile; every other axis steps on Bresenham-spaced master events, so
+    all axes start and finish together. The schedule is slowed uniformly
+    when another axis would exceed its own limits.
+
+    Args:
+        moves: Iterable of (Axis, steps)
+        pulse_width: Seconds each STEP pulse stays high
+        shape: "s-curve", "trapezoid" or "fixed"
+
+    Returns:
+        PulseTrain: Merged schedule for all STEP pins
+    """
+    moves = [(axis, steps) for axis, steps in moves if steps > 0]
+    if not moves:
+        return PulseTrain([], [], pulse_width)
+
+    master = max(moves, key=lambda move: move[1])
+    master_axis, master_steps = master
+    intervals = master_axis.profile.step_intervals(
+        master_steps, master_axis.steps_per_cm, shape
+    )
+    stretch = coordination_stretch(moves, master, shape)
+    if stretch > 1.0:
+        logging.debug(f"Slowing coordinated move by {stretch:.2f}x to respect axis limits")
+        intervals = intervals * stretch
+
+    masks = np.zeros(master_steps, dtype=np.uint32)
+    for axis, steps in moves:
+        masks[bresenham_steps(steps, master_steps)] |= np.uint32(1 << axis.step_pin)
+    return PulseTrain(masks, intervals, pulse_width)
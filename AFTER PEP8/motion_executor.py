@@ -0,0 +1,231 @@
+import os
+import gc
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+
+# --- Executor Settings ---
+MOTION_CPU = 3                # Pin the executor to this core (None = any)
+MOTION_PRIORITY = 50          # SCHED_FIFO priority (None = normal scheduling)
+START_TIMEOUT = 10.0          # Seconds to wait for the process to come up
+CANCEL_POLL_INTERVAL = 0.002  # How often a waiting move checks for cancellation (s)
+
+
+def _isolate(cpu, priority):
+    """Apply CPU affinity and real-time priority where the OS allows it."""
+    applied = {"cpu": None, "priority": None}
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        try:
+            if cpu in os.sched_getaffinity(0):
+                os.sched_setaffinity(0, {cpu})
+                applied["cpu"] = cpu
+            else:
+                logging.warning(f"CPU {cpu} not available; not pinning motion executor")
+        except OSError as e:
+            logging.warning(f"Could not set motion executor CPU affinity: {e}")
+    if priority is not None and hasattr(os, "sched_setscheduler"):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            applied["priority"] = priority
+        except (OSError, PermissionError) as e:
+            logging.warning(f"Could not enable SCHED_FIFO (needs CAP_SYS_NICE): {e}")
+    return applied
+
+
+def _executor_main(conn, cpu, priority, cancel):
+    """Executor process loop: play each train received and report back.
+
+    Messages in:  ("run", command_id, train) or ("stop",)
+    Messages out: ("ready", isolation), ("progress", command_id, done, total),
+                  ("done", command_id, result), ("error", command_id, message),
+                  ("cancelled", command_id, message)
+    The parent sets the shared cancel event to stop the running train.
+    """
+    from hal import GPIO
+    from arbiter import CommandCancelled
+    from stepper import create_wave_backend
+
+    conn.send(("ready", _isolate(cpu, priority)))
+    backend = create_wave_backend("local")
+    gc.collect()
+    gc.freeze()  # Keep start-up objects out of later collections
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message[0] == "stop":
+            break
+
+        _, command_id, train = message
+
+        def progress(done, total):
+            conn.send(("progress", command_id, done, total))
+
+        try:
+            # This process has its own GPIO state; claim the STEP pins here
+            if GPIO.getmode() is None:
+                GPIO.setmode(GPIO.BCM)
+            GPIO.setwarnings(False)
+            GPIO.setup(train.pins, GPIO.OUT)
+            gc.disable()  # No collector pauses in the middle of a move
+            try:
+                result = backend.run(train, progress=progress, cancel=cancel)
+            finally:
+                gc.enable()
+            conn.send(("done", command_id, result))
+        except CommandCancelled as e:
+            conn.send(("cancelled", command_id, str(e)))
+        except Exception as e:
+            conn.send(("error", command_id, f"{type(e).__name__}: {e}"))
+    conn.close()
+
+
+class ProcessWaveBackend:
+    """Step backend that plays trains in a dedicated executor process.
+
+    The process is spawned on first use, optionally pinned to MOTION_CPU
+    with SCHED_FIFO priority, and receives trains over a Pipe. Flask
+    threads, logging and OpenCV work in this process then no longer
+    compete with step timing for the GIL. DIR pins stay with the caller.
+    On the instant (unscaled) simulated HAL, move time passes on the
+    executor's virtual clock rather than the caller's.
+    """
+
+    name = "process"
+
+    def __init__(self, cpu=MOTION_CPU, priority=MOTION_PRIORITY):
+        self.cpu = cpu
+        self.priority = priority
+        self.isolation = None
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._cancel = None
+
+    def start(self):
+        """Spawn the executor process if it is not already running."""
+        if self._process is not None and self._process.is_alive():
+            return
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._cancel = context.Event()
+        self._process = context.Process(
+            target=_executor_main, args=(child_conn, self.cpu, self.priority, self._cancel),
+            name="motion-executor", daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        if not self._conn.poll(START_TIMEOUT):
+            self.close()
+            raise RuntimeError("Motion executor did not start")
+        _, self.isolation = self._conn.recv()
+        logging.info(f"Motion executor started (pid {self._process.pid}, {self.isolation})")
+        atexit.register(self.close)
+
+    def run(self, train, progress=None, cancel=None):
+        """Send a train to the executor and wait for it to finish.
+
+        While waiting, cancel (anything with is_set()) is polled and
+        forwarded to the executor through a shared event.
+
+        Returns:
+            dict: The executor's step timing result
+
+        Raises:
+            CommandCancelled: If cancel was set before the train finished
+            RuntimeError: If the move failed or the executor died
+        """
+        from arbiter import CommandCancelled
+
+        with self._lock:
+            self.start()
+            self._next_id += 1
+            command_id = self._next_id
+            self._cancel.clear()
+            try:
+                self._conn.send(("run", command_id, train))
+                while True:
+                    while not self._conn.poll(CANCEL_POLL_INTERVAL):
+                        if cancel is not None and cancel.is_set():
+                            self._cancel.set()
+                    message = self._conn.recv()
+                    kind, message_id = message[0], message[1]
+                    if message_id != command_id:
+                        continue
+                    if kind == "progress" and progress:
+                        progress(message[2], message[3])
+                    elif kind == "done":
+                        return message[2]
+                    elif kind == "cancelled":
+                        raise CommandCancelled(message[2])
+                    elif kind == "error":
+                        raise RuntimeError(f"Motion executor: {message[2]}")
+            except (EOFError, BrokenPipeError, ConnectionResetError) as e:
+                self._process = None  # Respawn on the next move
+                raise RuntimeError(f"Motion executor died: {e}")
+
+    def close(self):
+        """Stop the executor process."""
+        if self._process is None:
+            return
+        try:
+            self._conn.send(("stop",))
+        except (OSError, BrokenPipeError):
+            pass
+        self._process.join(timeout=2)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process = None
+
+
+# --- Benchmark ---
+
+def _cpu_load(stop):
+    """Pure-Python busy work standing in for Flask and OpenCV threads."""
+    while not stop.is_set():
+        sum(i * i for i in range(20000))
+
+
+def benchmark_jitter(step_pin=24, steps=4000, interval=0.0005, load_threads=2):
+    """Step lateness histograms in-process vs in the executor, under load.
+
+    Needs a real-time clock: the RPi backend, or the simulated HAL with
+    PACKAGING_HAL_TIME_SCALE=1.
+    """
+    from hal import GPIO
+    from stepper import build_step_train, create_wave_backend
+
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup(step_pin, GPIO.OUT)
+    train = build_step_train({step_pin: steps}, interval, interval / 2)
+    keys = ("achieved_rate", "timing_error", "max_lateness", "lateness_histogram")
+
+    stop = threading.Event()
+    workers = [threading.Thread(target=_cpu_load, args=(stop,)) for _ in range(load_threads)]
+    for worker in workers:
+        worker.start()
+    try:
+        in_process = create_wave_backend("local").run(train)
+        executor = ProcessWaveBackend()
+        try:
+            executor.start()
+            time.sleep(0.2)
+            isolated = executor.run(train)
+        finally:
+            executor.close()
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+        GPIO.cleanup(step_pin)
+
+    return {
+        "in_process": {key: in_process.get(key) for key in keys},
+        "isolated": {key: isolated.get(key) for key in keys},
+        "isolation": executor.isolation,
+    }
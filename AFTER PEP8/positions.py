@@ -0,0 +1,121 @@
+import os
+import json
+import logging
+import threading
+
+# --- Position Persistence ---
+# Axis positions survive restarts in STATE_DIR/axis_positions.json; the
+# other runtime files (plan cache, measurement store, history) live there
+# too. PACKAGING_STATE_DIR overrides the directory (default:
+# $XDG_STATE_HOME/packaging, i.e. ~/.local/state/packaging).
+STATE_DIR = os.environ.get("PACKAGING_STATE_DIR") or os.path.join(
+    os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state"),
+    "packaging"
+)
+POSITION_FILE = os.path.join(STATE_DIR, "axis_positions.json")
+
+
+class PositionTracker:
+    """Persisted open-loop position of each stepper axis.
+
+    Positions are in cm from the axis' home reference, positive in the
+    'forward' direction. An axis is only trusted once it has been homed,
+    and it loses its reference if a move starts but never completes
+    (an exception, e-stop or power loss mid-move).
+    """
+
+    def __init__(self, path=POSITION_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._axes = {}
+        self._load()
+
+    def _axis(self, name):
+        return self._axes.setdefault(name, {
+            "position": 0.0, "homed": False, "moving": False,
+            "travel": 0.0, "saved": 0.0,
+        })
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                self._axes = json.load(f)
+        except FileNotFoundError:
+            self._axes = {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable position file {self.path}: {e}")
+            self._axes = {}
+
+    def _save(self):
+        # Write then rename so a crash never leaves a half-written file
+        temp_path = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(temp_path, "w") as f:
+                json.dump(self._axes, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save axis positions: {e}")
+
+    def position(self, name):
+        """Return the axis position in cm, or None if it is not trusted."""
+        with self._lock:
+            axis = self._axis(name)
+            if not axis["homed"] or axis["moving"]:
+                return None
+            return axis["position"]
+
+    def is_homed(self, *names):
+        """Return True if every named axis has a trusted position."""
+        with self._lock:
+            return all(
+                self._axis(name)["homed"] and not self._axis(name)["moving"]
+                for name in names
+            )
+
+    def begin_move(self, name):
+        """Mark the axis as moving until end_move() records the result."""
+        with self._lock:
+            self._axis(name)["moving"] = True
+            self._save()
+
+    def end_move(self, name, delta_cm):
+        """Record a completed move of delta_cm (negative = backward)."""
+        with self._lock:
+            axis = self._axis(name)
+            axis["position"] += delta_cm
+            axis["travel"] += abs(delta_cm)
+            axis["moving"] = False
+            self._save()
+
+    def set_home(self, name, position_cm=0.0):
+        """Declare the axis to be at position_cm of its home reference."""
+        with self._lock:
+            axis = self._axis(name)
+            axis.update(position=position_cm, homed=True, moving=False)
+            self._save()
+        logging.info(f"Axis {name} homed at {position_cm} cm")
+
+    def add_saved(self, name, distance_cm):
+        """Count travel avoided compared with the full out-and-back stroke."""
+        with self._lock:
+            self._axis(name)["saved"] += distance_cm
+            self._save()
+
+    def stats(self):
+        """Return position, homed state, travel and saved travel per axis."""
+        with self._lock:
+            return {name: dict(axis) for name, axis in self._axes.items()}
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    """Return the process-wide tracker, loading it on first use."""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = PositionTracker()
+        return _tracker
@@ -0,0 +1,311 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+import hal
+from hal import GPIO
+
+# ========== Relay Pin Assignments ==========
+# Linear Actuator Relays (active low: HIGH releases the relay)
+ACT1_RELAY1 = 14    # PUSH
+ACT1_RELAY2 = 15    # PULL
+ACT2_RELAY1 = 18    # TOP LEFT actuator
+ACT2_RELAY2 = 17
+ACT3_RELAY1 = 27
+ACT3_RELAY2 = 22
+ACT4_RELAY1 = 10
+ACT4_RELAY2 = 9
+
+# List of used actuator GPIO pins
+USED_PINS = [
+    ACT1_RELAY1, ACT1_RELAY2,
+    ACT2_RELAY1, ACT2_RELAY2,
+    ACT3_RELAY1, ACT3_RELAY2,
+    ACT4_RELAY1, ACT4_RELAY2,
+]
+
+MAIN_ACTUATORS = (
+    (ACT1_RELAY1, ACT1_RELAY2),
+    (ACT3_RELAY1, ACT3_RELAY2),
+    (ACT4_RELAY1, ACT4_RELAY2),
+)
+LEFT_ACTUATOR = (ACT2_RELAY1, ACT2_RELAY2)
+
+# (relay 1, relay 2) levels per motion, 1 = HIGH. The left actuator is
+# wired the other way round.
+MAIN_MOTIONS = {"off": (1, 1), "push": (0, 1), "pull": (1, 0)}
+LEFT_MOTIONS = {"off": (1, 1), "push": (1, 0), "pull": (0, 1)}
+
+
+class RelayBank:
+    """Shadow register for the actuator relays.
+
+    The last level written to each pin is kept as a bit mask, so apply()
+    only writes pins whose level actually changes, and writes them all in
+    one GPIO.output(list, list) call. Inside batch(), several apply() calls
+    are merged into a single write when the block exits.
+
+    The shadow is unknown until the first write (or after invalidate()),
+    in which case every requested pin is written.
+    """
+
+    def __init__(self, pins=USED_PINS):
+        self.pins = tuple(pins)
+        self._bits = {pin: 1 << index for index, pin in enumerate(self.pins)}
+        self._shadow = None          # Bit set = pin HIGH; None = unknown
+        self._lock = threading.RLock()
+        self._pending = None
+        self.applies = 0             # apply() calls
+        self.writes = 0              # GPIO.output calls issued
+        self.pin_writes = 0          # Pins written
+        self.skipped = 0             # Pins requested at the level they already had
+        self.last_spread = None      # Seconds from first to last relay switching
+        self.max_spread = 0.0
+
+    def _mask(self, levels, base):
+        mask = base
+        for pin, level in levels.items():
+            if pin not in self._bits:
+                raise ValueError(f"Pin {pin} is not part of this relay bank")
+            if level:
+                mask |= self._bits[pin]
+            else:
+                mask &= ~self._bits[pin]
+        return mask
+
+    def apply(self, levels):
+        """Drive pins to the given levels, writing only those that change.
+
+        Args:
+            levels: {pin: level}; pins not listed keep their level
+
+        Returns:
+            int: Number of pins written (0 when deferred by batch())
+        """
+        with self._lock:
+            self.applies += 1
+            if self._pending is not None:
+                self._pending.update(levels)
+                return 0
+            return self._write(levels)
+
+    def _write(self, levels):
+        base = self._shadow or 0
+        target = self._mask(levels, base)
+        if self._shadow is None:
+            changed = list(levels)
+        else:
+            changed = [pin for pin in levels if (target ^ base) & self._bits[pin]]
+        self.skipped += len(levels) - len(changed)
+        if not changed:
+            return 0
+
+        values = [int(bool(levels[pin])) for pin in changed]
+        start = hal.monotonic()
+        GPIO.output(changed, values)
+        self.last_spread = hal.monotonic() - start
+        self.max_spread = max(self.max_spread, self.last_spread)
+        self.writes += 1
+        self.pin_writes += len(changed)
+
+        # A partial first write still leaves the other pins unknown
+        if self._shadow is not None or len(levels) == len(self.pins):
+            self._shadow = target
+        return len(changed)
+
+    @contextmanager
+    def batch(self):
+        """Merge every apply() in the block into one write at the end."""
+        with self._lock:
+            if self._pending is not None:
+                yield self  # Already batching; the outer block writes
+                return
+            self._pending = {}
+            try:
+                yield self
+                pending = self._pending
+            finally:
+                self._pending = None
+            if pending:
+                self._write(pending)
+
+    def reset(self):
+        """Configure the relay pins as outputs and release every relay."""
+        with self._lock:
+            GPIO.setup(list(self.pins), GPIO.OUT)
+            self._shadow = None
+            self._write({pin: GPIO.HIGH for pin in self.pins})
+
+    def invalidate(self):
+        """Forget the shadow, e.g. after GPIO.cleanup()."""
+        with self._lock:
+            self._shadow = None
+
+    def state(self):
+        """Return {pin: level} as last written, or None if unknown."""
+        with self._lock:
+            if self._shadow is None:
+                return None
+            return {pin: int(bool(self._shadow & bit)) for pin, bit in self._bits.items()}
+
+    def stats(self):
+        """Return write counters and the switching spread."""
+        with self._lock:
+            return {
+                "applies": self.applies,
+                "writes": self.writes,
+                "pin_writes": self.pin_writes,
+                "skipped": self.skipped,
+                "last_spread": self.last_spread,
+                "max_spread": self.max_spread,
+            }
+
+
+_bank = None
+_bank_lock = threading.Lock()
+
+
+def get_relay_bank():
+    """Return the process-wide relay bank, creating it on first use."""
+    global _bank
+    with _bank_lock:
+        if _bank is None:
+            _bank = RelayBank()
+        return _bank
+
+
+def actuator_levels(main=None, left=None):
+    """Return relay levels for a main-group and a left-actuator motion.
+
+    Args:
+        main: "push", "pull", "off" or None to leave the main group alone
+        left: Same for the left actuator
+    """
+    levels = {}
+    if main is not None:
+        for pins in MAIN_ACTUATORS:
+            levels.update(zip(pins, MAIN_MOTIONS[main]))
+    if left is not None:
+        levels.update(zip(LEFT_ACTUATOR, LEFT_MOTIONS[left]))
+    return levels
+
+
+# ========== Actuator Control Functions ==========
+def turn_off_top_actuators():
+    """Turn off all actuator relays."""
+    logging.info("Turning OFF all top actuators...")
+    get_relay_bank().apply(actuator_levels(main="off", left="off"))
+
+
+def top_actuators_off_left():
+    """Deactivate left actuator."""
+    logging.info("Deactivating top LEFT actuator...")
+    get_relay_bank().apply(actuator_levels(left="off"))
+
+
+def top_actuators_pull():
+    """Activate pull motion on main actuators."""
+    logging.info("Pulling all top actuators...")
+    get_relay_bank().apply(actuator_levels(main="pull"))
+
+
+def top_actuators_push():
+    """Activate push motion on main actuators."""
+    logging.info("Pushing all top actuators...")
+    get_relay_bank().apply(actuator_levels(main="push"))
+
+
+def top_actuators_push_left():
+    """Activate left push."""
+    logging.info("Pushing top LEFT actuator...")
+    get_relay_bank().apply(actuator_levels(left="push"))
+
+
+def top_actuators_pull_left():
+    """Activate left pull."""
+    logging.info("Pulling top LEFT actuator...")
+    get_relay_bank().apply(actuator_levels(left="pull"))
+
+
+def run_top_actuators_parallel(main_func, left_func, main_duration, left_duration):
+    """Control parallel actuator operation.
+
+    Both groups switch on in one relay write. If the left group is
+    shorter it is released first; if the main group is shorter, all relays
+    are released then and the remaining time is waited out.
+
+    Args:
+        main_func: Function to control main actuators
+        left_func: Function to control left actuator
+        main_duration: Duration for main actuators (seconds)
+        left_duration: Duration for left actuator (seconds)
+    """
+    logging.info(
+        f"Running actuators: main({main_duration}s), left({left_duration}s)"
+    )
+
+    with get_relay_bank().batch():
+        main_func()
+        left_func()
+    hal.sleep(min(main_duration, left_duration))
+
+    if left_duration < main_duration:
+        top_actuators_off_left()
+        hal.sleep(main_duration - left_duration)
+    elif left_duration > main_duration:
+        turn_off_top_actuators()
+        hal.sleep(left_duration - main_duration)
+
+    turn_off_top_actuators()
+    logging.info("Parallel actuation complete")
+
+
+# ========== Benchmark ==========
+def benchmark_relays(cycles=None):
+    """Count relay writes for the sealing sequence, per-pin vs relay bank.
+
+    Replays the relay levels of each sealing cycle (both groups on, the
+    shorter one off, everything off) without the waits. The switching
+    spread is only meaningful on real GPIO or a time-scaled simulated HAL.
+    """
+    if cycles is None:
+        from delivery_mechanism import SEALING_CYCLES as cycles
+
+    # Each entry is one switching event: the levels the old helpers wrote
+    events = []
+    for motion, main_duration, left_duration, _ in cycles:
+        events.append([actuator_levels(main=motion), actuator_levels(left=motion)])
+        shorter = "left" if left_duration < main_duration else "main"
+        events.append([actuator_levels(**{shorter: "off"})])
+        events.append([actuator_levels(main="off", left="off")])
+
+    GPIO.setmode(GPIO.BCM)
+    bank = RelayBank()
+    bank.reset()
+
+    writes = spread = 0
+    for groups in events:
+        start = hal.monotonic()
+        for levels in groups:
+            for pin, level in levels.items():
+                GPIO.output(pin, level)   # One call per pin, changed or not
+                writes += 1
+        spread = max(spread, hal.monotonic() - start)
+
+    baseline = bank.stats()
+    for groups in events:
+        with bank.batch():
+            for levels in groups:
+                bank.apply(levels)
+    stats = bank.stats()
+    GPIO.cleanup(list(bank.pins))
+
+    return {
+        "per_pin": {"writes": writes, "pin_writes": writes, "max_spread": spread},
+        "relay_bank": {
+            "writes": stats["writes"] - baseline["writes"],
+            "pin_writes": stats["pin_writes"] - baseline["pin_writes"],
+            "skipped": stats["skipped"] - baseline["skipped"],
+            "max_spread": stats["max_spread"],
+        },
+    }
@@ -0,0 +1,200 @@
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import hal
+
+
+class Phase:
+    """One step of a sequence: an action, its prerequisites and resources.
+
+    Args:
+        name: Unique phase name
+        action: Callable run with no arguments; returning False marks the
+            phase as failed (matching the move_* helpers)
+        after: Names of phases that must finish first
+        resources: Hardware the phase needs exclusively, e.g. "fork",
+            "rail_1", "relays"
+    """
+
+    def __init__(self, name, action, after=(), resources=()):
+        self.name = name
+        self.action = action
+        self.after = tuple(after)
+        self.resources = tuple(sorted(set(resources)))
+
+
+class PhaseScheduler:
+    """Runs a DAG of phases, overlapping those that are independent.
+
+    A phase starts once all of its prerequisites have finished and it
+    holds a lock on each of its resources. Locks are always taken in
+    sorted order, so phases sharing resources cannot deadlock. Timings
+    use the HAL clock. on_phase(name, state) is called as each phase
+    is "started" and once it has "finished" or "failed". Each phase runs
+    in a copy of the caller's context, so it works under the caller's
+    hardware command token (see arbiter.py).
+    """
+
+    def __init__(self, phases, max_workers=None, on_phase=None):
+        self.phases = {}
+        for phase in phases:
+            if phase.name in self.phases:
+                raise ValueError(f"Duplicate phase: {phase.name}")
+            self.phases[phase.name] = phase
+        self.max_workers = max_workers or len(self.phases) or 1
+        self.on_phase = on_phase
+        self._locks = {
+            resource: threading.Lock()
+            for phase in self.phases.values() for resource in phase.resources
+        }
+        self._check_graph()
+
+    def _check_graph(self):
+        """Reject unknown prerequisites and dependency cycles."""
+        for phase in self.phases.values():
+            for dep in phase.after:
+                if dep not in self.phases:
+                    raise ValueError(f"Phase '{phase.name}' depends on unknown phase '{dep}'")
+
+        remaining = {name: set(phase.after) for name, phase in self.phases.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Dependency cycle among phases: {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def _notify(self, name, state):
+        if self.on_phase is None:
+            return
+        try:
+            self.on_phase(name, state)
+        except Exception as e:
+            logging.warning(f"Phase listener failed for '{name}': {e}")
+
+    def _run_phase(self, phase, timings):
+        ready = hal.monotonic()
+        for resource in phase.resources:
+            self._locks[resource].acquire()
+        ok = False
+        try:
+            start = hal.monotonic()
+            logging.debug(f"Phase '{phase.name}' started")
+            self._notify(phase.name, "started")
+            ok = phase.action() is not False
+            end = hal.monotonic()
+        finally:
+            for resource in reversed(phase.resources):
+                self._locks[resource].release()
+            self._notify(phase.name, "finished" if ok else "failed")
+        timings[phase.name] = {
+            "ready": ready,
+            "start": start,
+            "end": end,
+            "duration": end - start,
+            "resource_wait": start - ready,
+        }
+        return ok
+
+    def run(self):
+        """Run every phase and return a timing report.
+
+        Returns:
+            dict: Per-phase timings relative to the start, total time, the
+                sum of phase durations, and the critical path
+
+        Raises:
+            RuntimeError: If a phase fails; phases already running are
+                allowed to finish, and no new ones are started
+        """
+        timings = {}
+        done = set()
+        running = {}
+        failure = None
+        origin = hal.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                if failure is None:
+                    for name, phase in self.phases.items():
+                        if (name not in done and name not in running.values()
+                                and all(dep in done for dep in phase.after)):
+                            future = executor.submit(
+                                contextvars.copy_context().run,
+                                self._run_phase, phase, timings
+                            )
+                            running[future] = name
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        ok = future.result()
+                    except Exception as e:
+                        ok = False
+                        logging.error(f"Phase '{name}' raised: {e}")
+                    if ok:
+                        done.add(name)
+                    elif failure is None:
+                        failure = name
+
+        if failure is not None:
+            raise RuntimeError(f"Phase '{failure}' failed")
+        return self._report(timings, origin, hal.monotonic())
+
+    def _report(self, timings, origin, finish):
+        path = self.critical_path(timings)
+        relative = {
+            name: {
+                key: (value - origin if key in ("ready", "start", "end") else value)
+                for key, value in timing.items()
+            }
+            for name, timing in timings.items()
+        }
+        serial = sum(timing["duration"] for timing in timings.values())
+        return {
+            "total": finish - origin,
+            "serial": serial,
+            "overlap_saved": serial - (finish - origin),
+            "phases": relative,
+            "critical_path": path,
+            "critical_path_time": sum(timings[name]["duration"] for name in path),
+        }
+
+    def critical_path(self, timings):
+        """Return the chain of phases that bounded the finish time.
+
+        Walks back from the last phase to finish. At each phase it steps to
+        the prerequisite or earlier holder of a shared resource that
+        finished last, because that is what the phase was waiting on.
+        """
+        if not timings:
+            return []
+        name = max(timings, key=lambda n: timings[n]["end"])
+        path = [name]
+        visited = {name}
+        while True:
+            phase = self.phases[name]
+            start = timings[name]["start"]
+            blockers = [dep for dep in phase.after if dep in timings]
+            # A zero-length phase can end exactly when another starts, so a
+            # holder that ended at our start only counts if it started first
+            blockers += [
+                other for other in timings
+                if other != name
+                and set(self.phases[other].resources) & set(phase.resources)
+                and (timings[other]["end"] < start
+                     or (timings[other]["end"] <= start and timings[other]["start"] < start))
+            ]
+            blockers = [other for other in blockers if other not in visited]
+            if not blockers:
+                return list(reversed(path))
+            name = max(blockers, key=lambda n: timings[n]["end"])
+            path.append(name)
+            visited.add(name)
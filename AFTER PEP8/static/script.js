@@ -20,6 +20,63 @@ function resetProgressBar() {
     progressText.textContent = '';
 }
 
+// Text shown for each stage reported by capture and delivery jobs
+const STAGE_LABELS = {
+    capture: 'Capturing front and side images...',
+    front_capture: 'Capturing front image...',
+    side_alignment: 'Aligning side camera...',
+    side_capture: 'Capturing side image...',
+    optimization: 'Optimizing package dimensions...',
+    wrap_size: 'Calculating bubble wrap size...',
+    planned: 'Planning delivery...',
+    release: 'Releasing package...',
+    fork_jog: 'Positioning package...',
+    settle: 'Letting package settle...',
+    feed_and_open: 'Feeding bubble wrap...',
+    seal: 'Sealing bubble wrap...',
+    rails_back: 'Returning rails...',
+    complete: 'Complete!'
+};
+
+// Start a job with a POST and follow its progress events until it ends.
+// Resolves with the final job status (including its result).
+async function runJob(url) {
+    const response = await fetch(url, {method: 'POST'});
+    const started = await response.json();
+    if (!response.ok) {
+        throw new Error(started.error || 'Request failed');
+    }
+
+    await new Promise((resolve, reject) => {
+        const events = new EventSource(`/jobs/${started.job_id}/events`);
+        events.addEventListener('progress', (message) => {
+            const event = JSON.parse(message.data);
+            const percentage = Math.round((event.progress || 0) * 100);
+            updateProgressBar(percentage, STAGE_LABELS[event.stage] || event.stage);
+        });
+        events.addEventListener('state', (message) => {
+            const event = JSON.parse(message.data);
+            if (event.state === 'succeeded' || event.state === 'failed') {
+                events.close();
+                resolve();
+            }
+        });
+        events.onerror = () => {
+            // The browser reconnects on its own unless the stream was closed
+            if (events.readyState === EventSource.CLOSED) {
+                reject(new Error('Lost connection to the server'));
+            }
+        };
+    });
+
+    const statusResponse = await fetch(`/jobs/${started.job_id}`);
+    const status = await statusResponse.json();
+    if (status.state !== 'succeeded') {
+        throw new Error(status.error || 'Job failed');
+    }
+    return status;
+}
+
 // Updated initialSealButton event listener
 document.getElementById('initialSealButton').addEventListener('click', async () => {
     updateProgressBar(10, 'Feeding bubble wrap...');
@@ -130,13 +187,9 @@ function showDeliveryPopup() {
     // Delivery button
     document.getElementById('deliverButton').addEventListener('click', async () => {
         try {
-            updateProgressBar(30, 'Initiating delivery...');
-            const response = await fetch('/deliver-product', {method: 'POST'});
-            if (!response.ok) {
-                throw new Error('Delivery failed');
-            }
-            const result = await response.json();
-            alert(result.message || "Product delivered successfully!");
+            updateProgressBar(0, 'Initiating delivery...');
+            const status = await runJob('/deliver-product');
+            alert(status.result.message || "Product delivered successfully!");
 
             document.getElementById('clearButton').click();
             popup.remove();
@@ -175,21 +228,17 @@ document.getElementById('emergencyStopButton').addEventListener('click', async (
 
 // Detect dimensions
 document.getElementById('detectButton').addEventListener('click', async () => {
-    updateProgressBar(10, 'Starting detection...');
+    updateProgressBar(0, 'Starting detection...');
     try {
-        const response = await fetch('/capture-dimensions');
-        if (!response.ok) {
+        let data;
+        try {
+            data = (await runJob('/capture-dimensions')).result;
+        } catch (error) {
             throw new Error(
                 'Failed to capture dimensions. Please check your camera or sensor setup.'
             );
         }
 
-        updateProgressBar(50, 'Processing captured image...');
-        const data = await response.json();
-        if (data.error) {
-            throw new Error(data.error);
-        }
-
         // Captured Image
         document.getElementById('capturedImage').innerHTML = `
             <h2>Captured Image</h2>
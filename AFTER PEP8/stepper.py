@@ -0,0 +1,399 @@
+import os
+import time
+import bisect
+import logging
+import threading
+
+import numpy as np
+
+import hal
+import metrics
+from hal import GPIO
+from arbiter import CommandCancelled, current_token
+
+# --- Step Generation Settings ---
+# PACKAGING_STEPPER: "pigpio" (hardware-timed DMA waves through pigpiod) or
+# "software" (deadline-paced bit-banging through the HAL). Defaults to
+# pigpio when the daemon is reachable, otherwise software. pigpio drives
+# the pins itself, bypassing the HAL, so it is only used with the RPi HAL;
+# any other HAL (simulated, recording) gets the software backend, which
+# runs on the virtual clock under the simulated HAL.
+STEPPER_ENV = "PACKAGING_STEPPER"
+
+# PACKAGING_MOTION_PROCESS=1 plays trains in a separate motion executor
+# process (see motion_executor.py) instead of the calling thread.
+MOTION_PROCESS_ENV = "PACKAGING_MOTION_PROCESS"
+
+WAVE_CHUNK_STEPS = 1000       # Steps per pigpio wave (2 pulses per step)
+SPIN_THRESHOLD = 0.0002       # Busy-wait the last 200 us before a deadline
+PROGRESS_STEPS = 500          # Report progress every this many steps
+LATENESS_BUCKETS_US = (5, 10, 20, 50, 100, 200, 500, 1000)  # Jitter histogram edges
+
+
+class PulseTrain:
+    """Precomputed step schedule for one or more STEP pins.
+
+    Event i raises every pin in masks[i] (a bit mask of BCM pin numbers),
+    holds them for pulse_width seconds, lowers them, and the next event
+    starts intervals[i] seconds after this one started.
+    """
+
+    def __init__(self, masks, intervals, pulse_width):
+        self.masks = np.asarray(masks, dtype=np.uint32)
+        self.intervals = np.asarray(intervals, dtype=np.float64)
+        self.pulse_width = pulse_width
+        if len(self.masks) != len(self.intervals):
+            raise ValueError("masks and intervals must have the same length")
+        if len(self.intervals) and self.intervals.min() <= pulse_width:
+            raise ValueError("Step interval must be longer than the pulse width")
+
+    def __len__(self):
+        return len(self.masks)
+
+    @property
+    def duration(self):
+        """Planned duration in seconds."""
+        return float(self.intervals.sum())
+
+    @property
+    def pins(self):
+        """Sorted list of pins driven by this train."""
+        combined = int(np.bitwise_or.reduce(self.masks)) if len(self.masks) else 0
+        return pins_from_mask(combined)
+
+    def step_counts(self):
+        """Return {pin: number of steps} for every pin in the train."""
+        return {
+            pin: int(np.count_nonzero(self.masks & np.uint32(1 << pin)))
+            for pin in self.pins
+        }
+
+    def start_times_us(self):
+        """Integer start time (us) of every event, rounded without drift."""
+        starts = np.concatenate(([0.0], np.cumsum(self.intervals)[:-1]))
+        return np.rint(starts * 1e6).astype(np.int64)
+
+
+def pins_from_mask(mask):
+    """Return the BCM pin numbers set in a bit mask."""
+    return [pin for pin in range(32) if mask & (1 << pin)]
+
+
+def build_step_train(step_counts, interval, pulse_width):
+    """Build a train stepping several pins together.
+
+    Args:
+        step_counts: {step_pin: steps}; pins with fewer steps stop early
+        interval: Seconds between step starts, either a constant or one
+            value per step of the longest axis (e.g. from a MotionProfile)
+        pulse_width: Seconds each STEP pulse stays high
+    """
+    total = max(step_counts.values(), default=0)
+    masks = np.zeros(total, dtype=np.uint32)
+    index = np.arange(total)
+    for pin, steps in step_counts.items():
+        masks[index < steps] |= np.uint32(1 << pin)
+    return PulseTrain(masks, np.broadcast_to(interval, total), pulse_width)
+
+
+def _result(train, duration, max_lateness=None, lateness_counts=None):
+    steps = len(train)
+    planned = train.duration
+    result = {
+        "steps": steps,
+        "planned_duration": planned,
+        "duration": duration,
+        "nominal_rate": steps / planned if planned else 0.0,
+        "achieved_rate": steps / duration if duration else 0.0,
+        "timing_error": (duration - planned) / planned if planned else 0.0,
+        "max_lateness": max_lateness,
+    }
+    if lateness_counts is not None:
+        labels = [f"<={edge}us" for edge in LATENESS_BUCKETS_US]
+        labels.append(f">{LATENESS_BUCKETS_US[-1]}us")
+        result["lateness_histogram"] = dict(zip(labels, lateness_counts))
+    return result
+
+
+class SoftwareWaveBackend:
+    """Plays pulse trains by bit-banging through the HAL.
+
+    Every edge is scheduled against an absolute deadline on the HAL clock,
+    so sleep overshoot on one step is absorbed by the next instead of
+    accumulating. The last SPIN_THRESHOLD before each edge is busy-waited;
+    with spin=False every wait is a plain HAL sleep, which is what the
+    simulated HAL's virtual clock needs.
+    """
+
+    name = "software"
+
+    def __init__(self, spin=True):
+        self.spin = spin
+
+    def run(self, train, progress=None, cancel=None):
+        """Play a train; progress(steps_done, total) is called periodically.
+
+        cancel is checked before every step; once it is set the STEP pins
+        are driven low and CommandCancelled is raised.
+        """
+        # STEP pins are configured as outputs by the caller, as before
+        pin_lists = {}
+        start = hal.monotonic()
+        offsets = train.start_times_us() / 1e6
+        max_lateness = 0.0
+        lateness_counts = [0] * (len(LATENESS_BUCKETS_US) + 1)
+        total = len(train)
+
+        try:
+            for index, (mask, offset) in enumerate(zip(train.masks.tolist(), offsets.tolist())):
+                if cancel is not None and cancel.is_set():
+                    raise CommandCancelled(f"Step train cancelled after {index} of {total} steps")
+                pins = pin_lists.get(mask)
+                if pins is None:
+                    pins = pin_lists[mask] = pins_from_mask(mask)
+
+                deadline = start + offset
+                lateness = self._wait_until(deadline)
+                GPIO.output(pins, GPIO.HIGH)
+                self._wait_until(deadline + train.pulse_width)
+                GPIO.output(pins, GPIO.LOW)
+
+                max_lateness = max(max_lateness, lateness)
+                lateness_counts[bisect.bisect_left(LATENESS_BUCKETS_US, lateness * 1e6)] += 1
+                if progress and index % PROGRESS_STEPS == 0:
+                    progress(index, total)
+
+            if total:
+                self._wait_until(start + train.duration)
+        except BaseException:
+            if total:
+                GPIO.output(train.pins, GPIO.LOW)  # Never leave a STEP pin high
+            raise
+        if progress:
+            progress(total, total)
+        return _result(train, hal.monotonic() - start, max_lateness, lateness_counts)
+
+    def _wait_until(self, deadline):
+        """Wait for a deadline and return how late we were (seconds)."""
+        remaining = deadline - hal.monotonic()
+        if not self.spin:
+            if remaining > 0:
+                hal.sleep(remaining)
+        else:
+            if remaining > SPIN_THRESHOLD:
+                hal.sleep(remaining - SPIN_THRESHOLD)
+            while hal.monotonic() < deadline:
+                pass
+        return max(0.0, hal.monotonic() - deadline)
+
+
+class PigpioWaveBackend:
+    """Plays pulse trains as DMA-timed pigpio waves.
+
+    The train is split into waves of WAVE_CHUNK_STEPS steps. Each wave is
+    queued with WAVE_MODE_ONE_SHOT_SYNC so it starts exactly when the
+    previous one ends, and at most two waves exist at once to stay within
+    pigpiod's pulse memory.
+
+    The waves are driven by pigpiod, not through the hal backend, so they
+    never appear in RecordingBackend traces and cannot run under
+    SimulatedBackend; create_wave_backend() only picks it with the RPi HAL.
+    """
+
+    name = "pigpio"
+
+    def __init__(self, pi=None):
+        import pigpio  # Requires the pigpiod daemon
+        self._pigpio = pigpio
+        self.pi = pi or pigpio.pi()
+        if not self.pi.connected:
+            raise RuntimeError("pigpiod is not running")
+
+    def run(self, train, progress=None, cancel=None):
+        """Play a train; progress(steps_done, total) is called per wave.
+
+        cancel is checked while waves are queued and transmitted; once it
+        is set the transmission is stopped and CommandCancelled is raised.
+        """
+        pigpio = self._pigpio
+        for pin in train.pins:
+            self.pi.set_mode(pin, pigpio.OUTPUT)
+
+        starts = train.start_times_us()
+        ends = np.append(starts[1:], int(round(train.duration * 1e6)))
+        high_us = int(round(train.pulse_width * 1e6))
+
+        self.pi.wave_clear()
+        try:
+            return self._transmit(train, starts, ends, high_us, progress, cancel)
+        except BaseException:
+            self.stop()
+            self.pi.wave_clear()
+            for pin in train.pins:
+                self.pi.write(pin, 0)  # A stopped wave can leave a pin high
+            raise
+
+    def _transmit(self, train, starts, ends, high_us, progress, cancel):
+        pigpio = self._pigpio
+
+        def check():
+            if cancel is not None and cancel.is_set():
+                raise CommandCancelled("Wave transmission cancelled")
+
+        previous = None
+        start = hal.monotonic()
+        for first in range(0, len(train), WAVE_CHUNK_STEPS):
+            check()
+            last = min(first + WAVE_CHUNK_STEPS, len(train))
+            pulses = []
+            for mask, begin, end in zip(
+                train.masks[first:last].tolist(),
+                starts[first:last].tolist(),
+                ends[first:last].tolist()
+            ):
+                pulses.append(pigpio.pulse(mask, 0, high_us))
+                pulses.append(pigpio.pulse(0, mask, end - begin - high_us))
+            self.pi.wave_add_generic(pulses)
+            wave_id = self.pi.wave_create()
+            self.pi.wave_send_using_mode(wave_id, pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+
+            if previous is not None:
+                # Free the previous wave once the new one is transmitting
+                while self.pi.wave_tx_at() == previous:
+                    check()
+                    hal.sleep(0.001)
+                self.pi.wave_delete(previous)
+                if progress:
+                    progress(first, len(train))
+            previous = wave_id
+
+        while self.pi.wave_tx_busy():
+            check()
+            hal.sleep(0.001)
+        duration = hal.monotonic() - start
+        if previous is not None:
+            self.pi.wave_delete(previous)
+        if progress:
+            progress(len(train), len(train))
+        return _result(train, duration)
+
+    def stop(self):
+        """Abort the wave currently being transmitted."""
+        self.pi.wave_tx_stop()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_wave_backend(kind=None):
+    """Build the step backend named by kind or PACKAGING_STEPPER.
+
+    kind="local" ignores PACKAGING_MOTION_PROCESS; the executor process
+    uses it to pick the backend it drives. Unless the HAL is the RPi
+    backend, the software backend is used even if pigpio was asked for.
+    """
+    kind = kind or os.environ.get(STEPPER_ENV)
+    if os.environ.get(MOTION_PROCESS_ENV) == "1" and kind != "local":
+        from motion_executor import ProcessWaveBackend
+        return ProcessWaveBackend()
+    gpio = hal.get_backend()
+    if "sim" in gpio.name and not getattr(gpio, "time_scale", None):
+        return SoftwareWaveBackend(spin=False)  # Busy-waiting never ends on a virtual clock
+    if kind == "software":
+        return SoftwareWaveBackend()
+    if gpio.name != "rpi":
+        if kind == "pigpio":
+            logging.warning(
+                f"pigpio bypasses the {gpio.name} HAL; using software step timing."
+            )
+        return SoftwareWaveBackend()
+    try:
+        return PigpioWaveBackend()
+    except (ImportError, RuntimeError) as e:
+        if kind == "pigpio":
+            raise
+        logging.warning(f"pigpio unavailable ({e}); using software step timing.")
+        return SoftwareWaveBackend()
+
+
+def get_wave_backend():
+    """Return the process-wide step backend, creating it on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_wave_backend()
+            logging.debug(f"Using step backend: {_backend.name}")
+        return _backend
+
+
+def set_wave_backend(backend):
+    """Replace the process-wide step backend and return the previous one."""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
+
+
+# Recorded once per move, after the train has finished playing
+move_seconds = metrics.histogram(
+    "packaging_move_seconds", "Stepper move duration", ["move"]
+)
+move_steps_total = metrics.counter(
+    "packaging_move_steps_total", "Steps played by stepper moves", ["move"]
+)
+
+
+def run_pulse_train(train, label="move", progress=None, cancel=None):
+    """Play a pulse train on the active backend and log its timing.
+
+    Args:
+        train: PulseTrain to play
+        label: Name used in the timing log line
+        progress: Optional callback progress(steps_done, total)
+        cancel: Object with is_set() that stops the train; defaults to the
+            token of the running arbiter command
+
+    Returns:
+        dict: steps, planned and actual duration, nominal and achieved
+            step rate, and relative timing error
+    """
+    if cancel is None:
+        cancel = current_token()
+    result = get_wave_backend().run(train, progress=progress, cancel=cancel)
+    logging.debug(
+        f"{label}: {result['steps']} steps in {result['duration']:.3f}s "
+        f"(planned {result['planned_duration']:.3f}s, "
+        f"{result['achieved_rate']:.0f} steps/s, "
+        f"error {result['timing_error'] * 100:+.2f}%)"
+    )
+    move_seconds.observe(result["duration"], move=label)
+    move_steps_total.inc(result["steps"], move=label)
+    return result
+
+
+# --- Benchmark ---
+
+def benchmark_stepping(step_pin=24, steps=2000, pulse_width=0.0005):
+    """Compare the legacy sleep-per-edge loop with the active step backend.
+
+    Meaningful on the real GPIO backend; under the simulated HAL the
+    backend runs on the virtual clock and reports zero error.
+    """
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setup(step_pin, GPIO.OUT)
+    interval = 2 * pulse_width
+    train = build_step_train({step_pin: steps}, interval, pulse_width)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        GPIO.output(step_pin, GPIO.HIGH)
+        time.sleep(pulse_width)
+        GPIO.output(step_pin, GPIO.LOW)
+        time.sleep(pulse_width)
+    legacy = _result(train, time.perf_counter() - start)
+
+    backend = get_wave_backend()
+    results = {"sleep_loop": legacy, backend.name: backend.run(train)}
+    GPIO.cleanup(step_pin)
+    return results
@@ -0,0 +1,218 @@
+import threading
+import time
+import logging
+import statistics
+
+import hal
+from hal import GPIO
+
+# --- Ranging Constants ---
+
+SPEED_OF_SOUND_CM_S = 34300
+TRIGGER_SETTLE = 0.0002      # Trigger held low before the pulse (s)
+TRIGGER_PULSE = 0.00001      # 10 microsecond trigger pulse (s)
+ECHO_TIMEOUT = 0.2           # Max wait for a complete echo (s)
+BURST_INTERVAL = 0.06        # HC-SR04 needs ~60 ms between pings (s)
+OUTLIER_MADS = 3.0           # Reject readings this many MADs from the median
+MIN_MAD_CM = 0.2             # Floor so identical readings don't reject jitter
+
+
+class UltrasonicRanger:
+    """HC-SR04 ranging with edge-timestamped echoes.
+
+    Pins and echo edge detection are configured once. Each echo edge is
+    timestamped with the HAL's monotonic nanosecond clock in the GPIO edge
+    callback, and the caller blocks on an Event instead of polling the
+    echo pin.
+    """
+
+    def __init__(self, trig_pin, echo_pin):
+        self.trig_pin = trig_pin
+        self.echo_pin = echo_pin
+        self._configured = False
+        self._lock = threading.Lock()
+        self._edges = []
+        self._echo_done = threading.Event()
+
+        # Per-reading statistics
+        self.readings = 0
+        self.timeouts = 0
+        self.total_latency = 0.0
+        self.total_cpu = 0.0
+
+    def setup(self):
+        """Configure pins and echo edge detection (only on first call)."""
+        if self._configured:
+            return
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        GPIO.setup(self.trig_pin, GPIO.OUT)
+        GPIO.setup(self.echo_pin, GPIO.IN)
+        GPIO.output(self.trig_pin, False)
+        GPIO.add_event_detect(self.echo_pin, GPIO.BOTH, callback=self._on_edge)
+        self._configured = True
+        logging.debug("Ultrasonic ranger configured.")
+
+    def close(self):
+        """Stop edge detection so the pins can be reconfigured."""
+        if self._configured:
+            self._configured = False
+            try:
+                GPIO.remove_event_detect(self.echo_pin)
+            except RuntimeError:
+                pass  # Already released by a GPIO.cleanup() elsewhere
+
+    def _on_edge(self, channel):
+        # Edges alternate rise/fall, so the order identifies them; reading
+        # the pin level here would race against short echoes.
+        if len(self._edges) < 2:
+            self._edges.append(hal.monotonic_ns())
+            if len(self._edges) == 2:
+                self._echo_done.set()
+
+    def measure(self, timeout=ECHO_TIMEOUT):
+        """Fire one ping and return the distance in cm, or None on timeout."""
+        self.setup()
+        with self._lock:
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+
+            try:
+                self._trigger()
+            except RuntimeError:
+                # Another module ran GPIO.cleanup(); configure the pins again
+                logging.warning("Ultrasonic pins were released. Reconfiguring...")
+                self.close()
+                self.setup()
+                self._trigger()
+
+            echoed = self._echo_done.wait(timeout)
+            self.total_latency += time.perf_counter() - start
+            self.total_cpu += time.process_time() - cpu_start
+            self.readings += 1
+
+            if not echoed:
+                self.timeouts += 1
+                logging.error("Timeout waiting for echo.")
+                self.close()  # Re-arm edge detection on the next reading
+                return None
+
+            rise_ns, fall_ns = self._edges
+        distance = (fall_ns - rise_ns) / 1e9 * SPEED_OF_SOUND_CM_S / 2
+        logging.debug(f"Distance measured: {distance:.2f} cm")
+        return distance
+
+    def _trigger(self):
+        self._edges.clear()
+        self._echo_done.clear()
+        GPIO.output(self.trig_pin, False)
+        hal.sleep(TRIGGER_SETTLE)
+        GPIO.output(self.trig_pin, True)
+        hal.sleep(TRIGGER_PULSE)
+        GPIO.output(self.trig_pin, False)
+
+    def measure_burst(self, count=5, interval=BURST_INTERVAL, timeout=ECHO_TIMEOUT):
+        """Return the median of several pings after rejecting outliers.
+
+        Readings further than OUTLIER_MADS median absolute deviations from
+        the median are discarded. Returns None unless at least half of the
+        pings produced an accepted reading.
+        """
+        readings = []
+        for i in range(count):
+            if i:
+                hal.sleep(interval)
+            distance = self.measure(timeout)
+            if distance is not None:
+                readings.append(distance)
+
+        if len(readings) * 2 < count:
+            logging.error(f"Burst ranging failed: {len(readings)}/{count} echoes.")
+            return None
+
+        median = statistics.median(readings)
+        mad = max(statistics.median(abs(r - median) for r in readings), MIN_MAD_CM)
+        inliers = [r for r in readings if abs(r - median) <= OUTLIER_MADS * mad]
+        if len(inliers) * 2 < count:
+            logging.error("Burst ranging failed: too many outliers.")
+            return None
+
+        distance = statistics.median(inliers)
+        logging.debug(
+            f"Burst distance: {distance:.2f} cm "
+            f"({len(inliers)}/{count} readings kept)"
+        )
+        return distance
+
+    def stats(self):
+        """Return reading count, timeouts, and mean latency and CPU per reading."""
+        return {
+            "readings": self.readings,
+            "timeouts": self.timeouts,
+            "mean_latency": self.total_latency / self.readings if self.readings else None,
+            "mean_cpu": self.total_cpu / self.readings if self.readings else None,
+        }
+
+
+def measure_distance_polling(trig_pin, echo_pin, timeout=ECHO_TIMEOUT):
+    """Original busy-polling measurement, kept as the benchmark baseline."""
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setwarnings(False)
+    GPIO.setup(trig_pin, GPIO.OUT)
+    GPIO.setup(echo_pin, GPIO.IN)
+
+    GPIO.output(trig_pin, False)
+    time.sleep(TRIGGER_SETTLE)
+    GPIO.output(trig_pin, True)
+    time.sleep(TRIGGER_PULSE)
+    GPIO.output(trig_pin, False)
+
+    start_time = time.time()
+    stop_time = time.time()
+
+    echo_start = time.time()
+    while GPIO.input(echo_pin) == 0:
+        start_time = time.time()
+        if time.time() - echo_start > timeout:
+            return None
+
+    echo_end = time.time()
+    while GPIO.input(echo_pin) == 1:
+        stop_time = time.time()
+        if time.time() - echo_end > timeout:
+            return None
+
+    return (stop_time - start_time) * SPEED_OF_SOUND_CM_S / 2
+
+
+# --- Benchmark ---
+
+def benchmark_ranging(trig_pin=13, echo_pin=6, count=50):
+    """Compare latency, CPU time and spread of polling vs edge ranging."""
+    results = {}
+
+    def run(name, measure):
+        distances = []
+        latency = cpu = 0.0
+        for _ in range(count):
+            start, cpu_start = time.perf_counter(), time.process_time()
+            distance = measure()
+            latency += time.perf_counter() - start
+            cpu += time.process_time() - cpu_start
+            if distance is not None:
+                distances.append(distance)
+            time.sleep(BURST_INTERVAL)
+        results[name] = {
+            "mean_latency_ms": latency / count * 1000,
+            "mean_cpu_ms": cpu / count * 1000,
+            "valid_readings": len(distances),
+            "stdev_cm": statistics.pstdev(distances) if len(distances) > 1 else None,
+        }
+
+    run("polling", lambda: measure_distance_polling(trig_pin, echo_pin))
+    ranger = UltrasonicRanger(trig_pin, echo_pin)
+    try:
+        run("edge", ranger.measure)
+    finally:
+        ranger.close()
+    return results